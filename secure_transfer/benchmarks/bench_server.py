@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Run FileServer on loopback for benchmarks and report its resource usage
+
+Started as a subprocess by run_benchmarks.py with the working directory set to
+a folder containing server.crt/server.key. On SIGINT the server stops and a
+JSON stats file (CPU time, peak RSS, buffer I/O counters, disk flushes) is written.
+"""
+import os
+import sys
+import json
+import argparse
+import resource
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'server')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from server import FileServer
+from buffers import io_stats
+from fake_storage import FakeDriveAPI
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark server harness')
+    parser.add_argument('--port', type=int, required=True, help='Port to listen on')
+    parser.add_argument('--upload-dir', required=True, help='Server upload directory')
+    parser.add_argument('--storage-dir', help='Fake storage directory (omit for local plaintext mode)')
+    parser.add_argument('--storage-latency', type=float, default=0.0, help='Simulated storage latency in seconds')
+    parser.add_argument('--prepopulate', type=int, default=0, help='Create this many objects in fake storage first')
+    parser.add_argument('--stats-out', required=True, help='Where to write the JSON stats on shutdown')
+    parser.add_argument('--server-args', default='{}', help='Extra FileServer keyword arguments as JSON')
+    args = parser.parse_args()
+
+    storage = None
+    if args.storage_dir:
+        storage = FakeDriveAPI(args.storage_dir, latency=args.storage_latency)
+        if args.prepopulate:
+            storage.populate(args.prepopulate)
+
+    server = FileServer(
+        host='127.0.0.1',
+        port=args.port,
+        upload_dir=args.upload_dir,
+        gdrive_enabled=storage is not None,
+        storage=storage,
+        **json.loads(args.server_args)
+    )
+
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        server.stop()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    with open(args.stats_out, 'w') as f:
+        json.dump({
+            'cpu_user_s': usage.ru_utime,
+            'cpu_system_s': usage.ru_stime,
+            'peak_rss_kb': usage.ru_maxrss,
+            'io': io_stats.snapshot(),
+            'durability': server.durability.stats()
+        }, f)
+
+
+if __name__ == "__main__":
+    main()
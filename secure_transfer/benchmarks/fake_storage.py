@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+
+
+class FakeDriveAPI:
+    """
+    Stand-in for GoogleDriveAPI that keeps blobs in a local directory
+
+    Implements the same upload/download/list/delete interface so FileServer can
+    run fully offline. An optional fixed latency simulates the Drive round trip.
+    """
+    def __init__(self, storage_dir, latency=0.0):
+        self.storage_dir = storage_dir
+        self.latency = latency
+        self.lock = threading.Lock()
+        os.makedirs(self.storage_dir, exist_ok=True)
+
+    def _blob_path(self, file_id):
+        return os.path.join(self.storage_dir, os.path.basename(file_id))
+
+    def _meta_path(self, file_id):
+        return self._blob_path(file_id) + '.meta'
+
+    def _link_or_copy(self, src, dst):
+        # Hard links keep the fake backend from dominating the measurement
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def upload_file(self, file_path, folder_id=None, properties=None):
+        """Store a copy of file_path and return its new ID"""
+        self._wait()
+        file_id = uuid.uuid4().hex
+        self._link_or_copy(file_path, self._blob_path(file_id))
+
+        meta = {
+            'id': file_id,
+            'name': os.path.basename(file_path),
+            'mimeType': 'application/octet-stream',
+            'size': str(os.path.getsize(file_path)),
+            'createdTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        }
+        if properties:
+            meta['appProperties'] = dict(properties)
+        self._write_meta(file_id, meta)
+        return file_id
+
+    def _write_meta(self, file_id, meta):
+        # Write then rename so a concurrent list never sees a half-written file
+        tmp_path = f"{self._meta_path(file_id)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(file_id))
+
+    def set_properties(self, file_id, properties):
+        """Add or replace appProperties of a stored blob"""
+        self._wait()
+        with self.lock:
+            with open(self._meta_path(file_id)) as f:
+                meta = json.load(f)
+            meta.setdefault('appProperties', {}).update(properties)
+            self._write_meta(file_id, meta)
+
+    def download_file(self, file_id, output_path=None):
+        """Copy a stored blob to output_path"""
+        self._wait()
+        blob_path = self._blob_path(file_id)
+        if not os.path.exists(blob_path):
+            raise FileNotFoundError(f"File not found: {file_id}")
+
+        if not output_path:
+            output_path = file_id
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        self._link_or_copy(blob_path, output_path)
+        return output_path
+
+    def read_chunks(self, file_id, chunk_size=1024 * 1024):
+        """Iterate over a stored blob in chunks (raises FileNotFoundError if missing)"""
+        self._wait()
+        f = open(self._blob_path(file_id), 'rb')
+        return self._chunks(f, chunk_size)
+
+    def _chunks(self, f, chunk_size):
+        with f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def delete_file(self, file_id):
+        """Delete a stored blob, returning True if it existed"""
+        self._wait()
+        try:
+            os.remove(self._blob_path(file_id))
+            os.remove(self._meta_path(file_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list_files(self, folder_id=None, query=None):
+        """List stored blobs in the same shape as GoogleDriveAPI.list_files"""
+        self._wait()
+        files = []
+        with os.scandir(self.storage_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.meta'):
+                    with open(entry.path) as f:
+                        files.append(json.load(f))
+        return files
+
+    def populate(self, count, size=1024):
+        """Create count dummy objects directly in storage (for list benchmarks)"""
+        payload = os.urandom(size)
+        for i in range(count):
+            file_id = uuid.uuid4().hex
+            with open(self._blob_path(file_id), 'wb') as f:
+                f.write(payload)
+            with open(self._meta_path(file_id), 'w') as f:
+                json.dump({
+                    'id': file_id,
+                    'name': f'object_{i}.bin.enc',
+                    'mimeType': 'application/octet-stream',
+                    'size': str(size),
+                    'createdTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+                }, f)
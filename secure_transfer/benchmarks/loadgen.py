@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+"""
+Load generator for the secure transfer server
+
+Drives thousands of concurrent connections from one process with asyncio,
+speaking the same length-prefixed JSON protocol as FileClient. Each virtual
+client loops over a weighted mix of upload/download/list commands with
+random file sizes and think times, reconnecting after a number of commands
+to simulate connection churn. Throughput, error rates and latency
+percentiles are printed for every interval and summarised at the end.
+
+Without --target a server with fake storage is started on loopback
+(bench_server.py), so the whole run is offline.
+
+Examples:
+    python loadgen.py --clients 1000 --duration 60
+    python loadgen.py --mix upload=1,download=4,list=1 --sizes 4K:0.7,1M:0.25,64M:0.05
+    python loadgen.py --target 127.0.0.1:5000 --cert ../server/server.crt --clients 200
+"""
+import os
+import sys
+import ssl
+import json
+import time
+import random
+import struct
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+from collections import defaultdict
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from run_benchmarks import ServerProcess, generate_certificate, parse_size, format_size, percentile, git_commit
+
+HEADER = struct.Struct('>I')
+WRITE_CHUNK = 256 * 1024
+READ_CHUNK = 256 * 1024
+
+
+def parse_weights(text, parse_key=str):
+    """Parse 'a=1,b=2' or 'a:1,b:2' into a list of (key, weight)"""
+    pairs = []
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, weight = item.replace('=', ':').partition(':')
+        pairs.append((parse_key(key), float(weight) if weight else 1.0))
+    if not pairs or sum(w for _, w in pairs) <= 0:
+        raise argparse.ArgumentTypeError(f"invalid weights: {text}")
+    return pairs
+
+
+class ServerError(Exception):
+    """The server answered with status 'error'"""
+
+
+class ServerBusy(ServerError):
+    """The server refused the command for lack of capacity"""
+    def __init__(self, response):
+        super().__init__(response.get('message', 'busy'))
+        self.reason = response.get('reason')
+        self.retry_after = response.get('retry_after', 1.0)
+        self.closing = bool(response.get('closing'))
+
+
+class Stats:
+    """Per-interval and whole-run counters, keyed by operation"""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timeline = []
+        self.total = self._empty()
+        self.interval = self._empty()
+        self.active = 0
+        self.connects = 0
+
+    @staticmethod
+    def _empty():
+        return {'latencies': defaultdict(list), 'errors': defaultdict(int), 'bytes': 0, 'error_kinds': defaultdict(int)}
+
+    def success(self, op, latency, nbytes):
+        for bucket in (self.total, self.interval):
+            bucket['latencies'][op].append(latency)
+            bucket['bytes'] += nbytes
+
+    def error(self, op, exc):
+        if isinstance(exc, ServerBusy):
+            kind = f"busy ({exc.reason})"
+        elif isinstance(exc, ServerError):
+            kind = str(exc)[:80]
+        else:
+            kind = type(exc).__name__
+        for bucket in (self.total, self.interval):
+            bucket['errors'][op] += 1
+            bucket['error_kinds'][kind] += 1
+
+    @staticmethod
+    def summarize(bucket, seconds):
+        # Connects are reported per operation but not counted as commands
+        commands = [op for op in bucket['latencies'] if op != 'connect']
+        ops = sum(len(bucket['latencies'][op]) for op in commands)
+        errors = sum(count for op, count in bucket['errors'].items() if op != 'connect')
+        all_latencies = [x for op in commands for x in bucket['latencies'][op]]
+
+        def ms(values, pct):
+            value = percentile(values, pct)
+            return round(value * 1000, 3) if value is not None else None
+
+        per_op = {}
+        for op in sorted(set(bucket['latencies']) | set(bucket['errors'])):
+            values = bucket['latencies'][op]
+            per_op[op] = {
+                'ops': len(values),
+                'errors': bucket['errors'][op],
+                'p50_ms': ms(values, 50),
+                'p95_ms': ms(values, 95),
+                'p99_ms': ms(values, 99)
+            }
+        return {
+            'ops': ops,
+            'errors': errors,
+            'error_rate': round(errors / (ops + errors), 4) if ops + errors else 0.0,
+            'ops_s': round(ops / seconds, 2) if seconds else None,
+            'mb_s': round(bucket['bytes'] / (1 << 20) / seconds, 3) if seconds else None,
+            'p50_ms': ms(all_latencies, 50),
+            'p95_ms': ms(all_latencies, 95),
+            'p99_ms': ms(all_latencies, 99),
+            'operations': per_op,
+            'error_kinds': dict(bucket['error_kinds'])
+        }
+
+    def roll(self, seconds):
+        """Close the current interval and return its summary"""
+        summary = self.summarize(self.interval, seconds)
+        summary['t_s'] = round(time.perf_counter() - self.started, 1)
+        summary['active_connections'] = self.active
+        self.timeline.append(summary)
+        self.interval = self._empty()
+        return summary
+
+
+class Connection:
+    """One TLS connection speaking the FileClient protocol"""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host, port, ssl_context, timeout):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context, server_hostname='localhost',
+                                    limit=READ_CHUNK), timeout)
+        return cls(reader, writer)
+
+    async def send(self, message):
+        payload = json.dumps(message).encode('utf-8')
+        self.writer.write(HEADER.pack(len(payload)) + payload)
+        await self.writer.drain()
+
+    async def receive(self):
+        header = await self.reader.readexactly(HEADER.size)
+        response = json.loads(await self.reader.readexactly(HEADER.unpack(header)[0]))
+        if response.get('status') == 'error':
+            raise ServerError(response.get('message', 'error'))
+        if response.get('status') == 'busy':
+            raise ServerBusy(response)
+        return response
+
+    async def request(self, message):
+        await self.send(message)
+        return await self.receive()
+
+    async def upload(self, filename, payload):
+        ready = await self.request({'command': 'upload', 'filename': filename, 'file_size': len(payload)})
+        if ready.get('status') != 'ready':
+            raise ServerError(f"unexpected {ready.get('status')}")
+        for offset in range(0, len(payload), WRITE_CHUNK):
+            self.writer.write(payload[offset:offset + WRITE_CHUNK])
+            await self.writer.drain()
+        return await self.receive()
+
+    async def download(self, file_id, key):
+        message = {'command': 'download', 'gdrive_file_id': file_id}
+        if key:
+            message['key'] = key
+        ready = await self.request(message)
+        remaining = ready['file_size']
+        # Payload is discarded; only the transfer itself is measured
+        while remaining:
+            data = await self.reader.read(min(remaining, READ_CHUNK))
+            if not data:
+                raise asyncio.IncompleteReadError(b'', remaining)
+            remaining -= len(data)
+        await self.receive()
+        return ready['file_size']
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+
+
+class LoadGenerator:
+    def __init__(self, args, host, port, ssl_context):
+        self.args = args
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.stats = Stats()
+        self.rng = random.Random(args.seed)
+        self.ops, self.op_weights = zip(*args.mix)
+        self.sizes, self.size_weights = zip(*args.sizes)
+        self.payload = memoryview(os.urandom(max(self.sizes)))
+        # Objects available for download: (file_id, key)
+        self.objects = []
+        self.counter = 0
+        self.deadline = None
+
+    def next_name(self):
+        self.counter += 1
+        return f"lg_{os.getpid()}_{self.counter}.bin"
+
+    def remember(self, response):
+        if 'gdrive_file_id' in response:
+            self.objects.append((response['gdrive_file_id'], response.get('key')))
+        elif 'file_id' in response:
+            self.objects.append((response['file_id'], None))
+        # Bound memory on long runs; old objects are as good as new ones
+        if len(self.objects) > 10000:
+            del self.objects[:5000]
+
+    async def seed(self, count):
+        """Upload count objects of the configured sizes so downloads have targets"""
+        conn = await Connection.open(self.host, self.port, self.ssl_context, self.args.timeout)
+        try:
+            for i in range(count):
+                size = self.sizes[i % len(self.sizes)]
+                self.remember(await conn.upload(self.next_name(), self.payload[:size]))
+        finally:
+            await conn.close()
+
+    async def run_op(self, conn, op):
+        if op == 'download' and not self.objects:
+            op = 'upload'
+        if op == 'upload':
+            size = self.rng.choices(self.sizes, self.size_weights)[0]
+            self.remember(await conn.upload(self.next_name(), self.payload[:size]))
+            return size
+        if op == 'download':
+            file_id, key = self.rng.choice(self.objects)
+            return await conn.download(file_id, key)
+        response = await conn.request({'command': 'list'})
+        return len(json.dumps(response.get('files', [])))
+
+    async def client(self, index):
+        args = self.args
+        # Spread connection setup over the ramp-up period
+        if args.ramp_up:
+            await asyncio.sleep(args.ramp_up * index / args.clients)
+
+        conn = None
+        ops_left = 0
+        while time.perf_counter() < self.deadline:
+            if conn is None:
+                try:
+                    start = time.perf_counter()
+                    conn = await Connection.open(self.host, self.port, self.ssl_context, args.timeout)
+                    self.stats.success('connect', time.perf_counter() - start, 0)
+                    self.stats.active += 1
+                    self.stats.connects += 1
+                    ops_left = self._ops_per_connection()
+                except Exception as e:
+                    self.stats.error('connect', e)
+                    await asyncio.sleep(args.reconnect_delay)
+                    continue
+
+            op = self.rng.choices(self.ops, self.op_weights)[0]
+            start = time.perf_counter()
+            try:
+                nbytes = await asyncio.wait_for(self.run_op(conn, op), args.timeout)
+                self.stats.success(op, time.perf_counter() - start, nbytes)
+                ops_left -= 1
+            except ServerBusy as e:
+                # Back off like FileClient does; a closing busy means the connection is gone
+                self.stats.error(op, e)
+                ops_left = 0 if e.closing else ops_left - 1
+                await asyncio.sleep(e.retry_after * self.rng.uniform(1.0, 1.5))
+            except ServerError as e:
+                # The connection is still in sync after an error response
+                self.stats.error(op, e)
+                ops_left -= 1
+            except Exception as e:
+                self.stats.error(op, e)
+                ops_left = 0
+
+            if ops_left <= 0:
+                await conn.close()
+                conn = None
+                self.stats.active -= 1
+
+            if args.think_time:
+                await asyncio.sleep(self.rng.expovariate(1.0 / args.think_time))
+
+        if conn is not None:
+            await conn.close()
+            self.stats.active -= 1
+
+    def _ops_per_connection(self):
+        # 0 keeps connections open for the whole run; otherwise churn around the mean
+        if not self.args.ops_per_connection:
+            return float('inf')
+        return max(1, round(self.rng.expovariate(1.0 / self.args.ops_per_connection)))
+
+    async def report(self):
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.args.interval)
+            now = time.perf_counter()
+            s = self.stats.roll(now - last)
+            last = now
+            print(f"{s['t_s']:>7.1f}s  conns {s['active_connections']:>5}  ops/s {s['ops_s']:>9}  "
+                  f"MB/s {s['mb_s']:>9}  err {s['error_rate'] * 100:>5.1f}%  "
+                  f"p50 {s['p50_ms']}  p95 {s['p95_ms']}  p99 {s['p99_ms']} ms", file=sys.stderr)
+
+    async def run(self):
+        if 'download' in self.ops:
+            await self.seed(self.args.seed_objects)
+        started = time.perf_counter()
+        self.stats = Stats()
+        self.deadline = started + self.args.ramp_up + self.args.duration
+        reporter = asyncio.ensure_future(self.report())
+        tasks = [asyncio.ensure_future(self.client(i)) for i in range(self.args.clients)]
+        try:
+            # Commands still running after the deadline get drain_timeout to finish
+            _, pending = await asyncio.wait(tasks, timeout=self.deadline - started + self.args.drain_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+                print(f"{len(pending)} clients still busy after the drain timeout were cancelled", file=sys.stderr)
+        finally:
+            reporter.cancel()
+        elapsed = time.perf_counter() - started
+        summary = Stats.summarize(self.stats.total, elapsed)
+        summary['connects'] = self.stats.connects
+        summary['duration_s'] = round(elapsed, 3)
+        return summary
+
+
+def raise_fd_limit(needed):
+    """Raise the open file soft limit towards the hard limit for many connections"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = hard if hard != resource.RLIM_INFINITY else max(soft, needed)
+    if soft < needed and soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, target), hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='asyncio load generator for FileServer')
+    parser.add_argument('--clients', type=int, default=100, help='Concurrent virtual clients')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run after ramp-up')
+    parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which clients connect')
+    parser.add_argument('--mix', type=parse_weights, default='upload=1,download=2,list=1',
+                        help='Weighted command mix, e.g. upload=1,download=4,list=1')
+    parser.add_argument('--sizes', type=lambda v: parse_weights(v, parse_size), default='4K:0.6,256K:0.3,4M:0.1',
+                        help='Weighted upload sizes, e.g. 4K:0.7,1M:0.25,64M:0.05')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Mean pause between commands (exponential)')
+    parser.add_argument('--ops-per-connection', type=float, default=0,
+                        help='Mean commands before reconnecting (0: keep connections open)')
+    parser.add_argument('--reconnect-delay', type=float, default=0.5, help='Pause after a failed connect')
+    parser.add_argument('--timeout', type=float, default=60, help='Per-command and connect timeout')
+    parser.add_argument('--drain-timeout', type=float, default=10, help='Grace period for in-flight commands at the end')
+    parser.add_argument('--interval', type=float, default=5, help='Seconds between progress reports')
+    parser.add_argument('--seed-objects', type=int, default=20, help='Objects uploaded before the run for downloads')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+    parser.add_argument('--target', help='host:port of a running server (default: start one locally)')
+    parser.add_argument('--cert', help='Server certificate to trust with --target')
+    parser.add_argument('--backend', choices=['fake', 'local'], default='fake',
+                        help='Storage for the local server: fake Drive or plaintext upload_dir')
+    parser.add_argument('--storage-latency', type=float, default=0.0, help='Simulated storage latency in seconds')
+    parser.add_argument('--server-args', type=json.loads, default={}, help='Extra FileServer kwargs as JSON')
+    parser.add_argument('--output', '-o', help='Write the JSON report (summary and timeline) here')
+    args = parser.parse_args()
+
+    if args.mix and not {op for op, _ in args.mix} <= {'upload', 'download', 'list'}:
+        parser.error('--mix accepts upload, download and list')
+
+    limit = raise_fd_limit(args.clients + 64)
+    if limit < args.clients + 16:
+        print(f"warning: open file limit {limit} is below --clients {args.clients}", file=sys.stderr)
+
+    workdir = tempfile.mkdtemp(prefix='sft_loadgen_')
+    server = None
+    try:
+        if args.target:
+            host, _, port = args.target.rpartition(':')
+            port = int(port)
+            cert = args.cert or 'server.crt'
+        else:
+            generate_certificate(workdir)
+            storage_dir = os.path.join(workdir, 'storage') if args.backend == 'fake' else None
+            server = ServerProcess(workdir, storage_dir, args.storage_latency, server_args=args.server_args)
+            host, port = '127.0.0.1', server.port
+            cert = os.path.join(workdir, 'server.crt')
+
+        ssl_context = ssl.create_default_context()
+        ssl_context.load_verify_locations(cert)
+
+        generator = LoadGenerator(args, host, port, ssl_context)
+        summary = asyncio.run(generator.run())
+    finally:
+        server_stats = server.stop() if server else {}
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'op':<10}{'ops':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", file=sys.stderr)
+    for op, s in summary['operations'].items():
+        print(f"{op:<10}{s['ops']:>10}{s['errors']:>8}{str(s['p50_ms']):>10}{str(s['p95_ms']):>10}{str(s['p99_ms']):>10}",
+              file=sys.stderr)
+    print(f"total: {summary['ops_s']} ops/s, {summary['mb_s']} MB/s, "
+          f"error rate {summary['error_rate'] * 100:.2f}%", file=sys.stderr)
+    for kind, count in sorted(summary['error_kinds'].items(), key=lambda item: -item[1]):
+        print(f"  {count:>8}  {kind}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'clients': args.clients,
+            'duration': args.duration,
+            'mix': dict(args.mix),
+            'sizes': {format_size(size): weight for size, weight in args.sizes},
+            'think_time': args.think_time,
+            'ops_per_connection': args.ops_per_connection,
+            'target': args.target,
+            'backend': None if args.target else args.backend,
+            'server_args': args.server_args
+        },
+        'summary': summary,
+        'timeline': generator.stats.timeline,
+        'server': server_stats
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+"""
+End-to-end loopback benchmarks for the secure transfer server
+
+Starts FileServer on 127.0.0.1 with a fake storage backend (bench_server.py),
+drives it with FileClient instances and reports throughput, latency
+percentiles, CPU time and peak RSS as JSON.
+
+Examples:
+    python run_benchmarks.py --preset quick -o results.json
+    python run_benchmarks.py --sizes 1M,1G --concurrency 1,64 --scenarios upload,download
+    python run_benchmarks.py --backend local --durability none,fsync,group --scenarios upload
+    python run_benchmarks.py --compare before.json after.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import socket
+import shutil
+import signal
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.abspath(os.path.dirname(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BENCH_DIR, '..'))
+sys.path.append(os.path.join(ROOT_DIR, 'client'))
+from client import FileClient
+from server.buffers import io_stats
+
+SIZE_UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+PRESETS = {
+    'quick': {
+        'sizes': '1K,64K,1M,16M',
+        'concurrency': '1,8,32',
+        'list_objects': 200
+    },
+    'full': {
+        'sizes': '1K,1M,64M,1G,4G',
+        'concurrency': '1,8,64,512',
+        'list_objects': 5000
+    }
+}
+
+
+def parse_size(text):
+    """Parse sizes like 1K, 64M or 4G into bytes"""
+    text = text.strip().upper()
+    if text and text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    for unit in ('G', 'M', 'K'):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return str(size)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+class ServerProcess:
+    """A bench_server.py subprocess bound to a free loopback port"""
+    def __init__(self, workdir, storage_dir=None, storage_latency=0.0, prepopulate=0, server_args=None):
+        self.workdir = workdir
+        self.port = free_port()
+        self.stats_path = os.path.join(workdir, f'server_stats_{self.port}.json')
+        self.log = open(os.path.join(workdir, f'server_{self.port}.log'), 'wb')
+
+        cmd = [
+            sys.executable, '-u', os.path.join(BENCH_DIR, 'bench_server.py'),
+            '--port', str(self.port),
+            '--upload-dir', os.path.join(workdir, 'uploads'),
+            '--stats-out', self.stats_path,
+            '--storage-latency', str(storage_latency),
+            '--prepopulate', str(prepopulate),
+            '--server-args', json.dumps(server_args or {})
+        ]
+        if storage_dir:
+            cmd += ['--storage-dir', storage_dir]
+
+        self.proc = subprocess.Popen(cmd, cwd=workdir, stdout=self.log, stderr=subprocess.STDOUT)
+        self._wait_until_listening()
+
+    def _wait_until_listening(self, timeout=60):
+        # Watch the log rather than probing the port: a bare TCP connect
+        # without a TLS handshake is itself a load on the accept loop
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"Benchmark server exited early, see {self.log.name}")
+            with open(self.log.name, 'rb') as f:
+                if b'Server started' in f.read():
+                    return
+            time.sleep(0.05)
+        raise RuntimeError("Benchmark server did not start in time")
+
+    def stop(self):
+        """Stop the server and return its resource usage stats"""
+        self.proc.send_signal(signal.SIGINT)
+        try:
+            self.proc.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.log.close()
+        try:
+            with open(self.stats_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+def run_clients(port, workdir, concurrency, operation):
+    """
+    Connect concurrency clients and run operation(index, client) on all at once
+
+    Returns:
+        Dict with per-operation latencies, error count, bytes moved, wall time
+        and client CPU time
+    """
+    # No download cache: every download must move its bytes
+    clients = [
+        FileClient('localhost', port, download_dir=os.path.join(workdir, 'downloads', str(i)), key_store=None,
+                   cache=None)
+        for i in range(concurrency)
+    ]
+    with ThreadPoolExecutor(max_workers=min(concurrency, 64)) as pool:
+        list(pool.map(lambda c: c.connect(), clients))
+
+    barrier = threading.Barrier(concurrency + 1)
+    lock = threading.Lock()
+    latencies = []
+    results = {'errors': 0, 'bytes': 0}
+
+    def worker(index, client):
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            nbytes = operation(index, client)
+        except Exception:
+            nbytes = None
+        elapsed = time.perf_counter() - start
+        with lock:
+            if nbytes is None:
+                results['errors'] += 1
+            else:
+                latencies.append(elapsed)
+                results['bytes'] += nbytes
+
+    threads = [threading.Thread(target=worker, args=(i, c), daemon=True) for i, c in enumerate(clients)]
+    for t in threads:
+        t.start()
+
+    cpu_start = time.process_time()
+    barrier.wait()
+    wall_start = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    for client in clients:
+        client.disconnect()
+
+    return {
+        'latencies': latencies,
+        'errors': results['errors'],
+        'bytes': results['bytes'],
+        'wall_s': wall,
+        'client_cpu_s': cpu
+    }
+
+
+def summarize(scenario, size, concurrency, measured, server_stats, extra=None):
+    latencies = measured['latencies']
+    wall = measured['wall_s']
+    io = io_stats.snapshot()
+    result = {
+        'scenario': scenario,
+        'size': size,
+        'size_label': format_size(size) if size else None,
+        'concurrency': concurrency,
+        'ops': len(latencies),
+        'errors': measured['errors'],
+        'bytes': measured['bytes'],
+        'wall_s': round(wall, 6),
+        'mb_s': round(measured['bytes'] / (1 << 20) / wall, 3) if wall else None,
+        'ops_s': round(len(latencies) / wall, 3) if wall else None,
+        'latency_p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'latency_p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'client_cpu_s': round(measured['client_cpu_s'], 6),
+        'client_peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'client_allocations_per_gb': round(io['allocations_per_gb'], 3),
+        'server_cpu_s': round(server_stats.get('cpu_user_s', 0) + server_stats.get('cpu_system_s', 0), 6),
+        'server_peak_rss_kb': server_stats.get('peak_rss_kb'),
+        'server_allocations_per_gb': round(server_stats.get('io', {}).get('allocations_per_gb', 0), 3)
+    }
+    if extra:
+        result.update(extra)
+    return result
+
+
+def make_source_files(workdir, size, concurrency):
+    """Create one random file of the given size and a distinctly named link per client"""
+    src_dir = os.path.join(workdir, 'src')
+    os.makedirs(src_dir, exist_ok=True)
+    source = os.path.join(src_dir, f'source_{size}.bin')
+    with open(source, 'wb') as f:
+        remaining = size
+        block = os.urandom(min(size, 1 << 20)) if size else b''
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+    # The server stores uploads by base name, so every client needs its own name
+    paths = []
+    for i in range(concurrency):
+        path = os.path.join(src_dir, f'c{i}_{size}.bin')
+        os.symlink(source, path)
+        paths.append(path)
+    return paths
+
+
+def bench_transfer(args, workdir, size, concurrency, scenarios, durability=None):
+    """Upload (and optionally download) one file per client; one server per phase"""
+    results = []
+    server_args = dict(args.server_args)
+    if durability:
+        server_args['durability'] = durability
+    storage_dir = None if args.backend == 'local' else os.path.join(workdir, 'storage')
+    paths = make_source_files(workdir, size, concurrency)
+    file_ids = [None] * concurrency
+    keys = [None] * concurrency
+
+    def upload(index, client):
+        if not client.upload_file(paths[index]):
+            return None
+        if storage_dir:
+            file_ids[index], keys[index] = list(client.saved_keys.items())[-1]
+        else:
+            file_ids[index] = os.path.basename(paths[index])
+        return size
+
+    def download(index, client):
+        if file_ids[index] is None:
+            return None
+        if keys[index]:
+            client.saved_keys[file_ids[index]] = keys[index]
+        return size if client.download_file(file_ids[index]) else None
+
+    for scenario, operation in (('upload', upload), ('download', download)):
+        # Downloads need the uploaded objects, so upload always runs
+        if scenario not in scenarios and scenario != 'upload':
+            continue
+        io_stats.reset()
+        server = ServerProcess(workdir, storage_dir, args.storage_latency, server_args=server_args)
+        try:
+            measured = run_clients(server.port, workdir, concurrency, operation)
+        finally:
+            server_stats = server.stop()
+        if scenario in scenarios:
+            extra = None
+            if durability:
+                flushes = server_stats.get('durability', {})
+                extra = {
+                    'durability': durability,
+                    'server_flushes': flushes.get('flushes'),
+                    'commits_per_flush': round(flushes['commits_per_flush'], 3) if flushes.get('commits_per_flush') else None,
+                    'server_flush_s': round(flushes.get('flush_s', 0.0), 6)
+                }
+            results.append(summarize(scenario, size, concurrency, measured, server_stats, extra))
+    return results
+
+
+def bench_list(args, workdir, concurrency):
+    """Each client issues list_repeats list commands against a prepopulated store"""
+    storage_dir = os.path.join(workdir, 'storage')
+    io_stats.reset()
+    server = ServerProcess(workdir, storage_dir, args.storage_latency,
+                           prepopulate=args.list_objects, server_args=args.server_args)
+
+    def list_files(index, client):
+        nbytes = 0
+        for _ in range(args.list_repeats):
+            files = client.list_files()
+            if len(files) < args.list_objects:
+                return None
+            nbytes += len(json.dumps(files))
+        return nbytes
+
+    try:
+        measured = run_clients(server.port, workdir, concurrency, list_files)
+    finally:
+        server_stats = server.stop()
+
+    # Each op covers list_repeats requests; report per-request latency too
+    result = summarize('list', 0, concurrency, measured, server_stats, {
+        'list_objects': args.list_objects,
+        'list_repeats': args.list_repeats
+    })
+    if result['latency_p50_ms'] is not None:
+        result['request_p50_ms'] = round(result['latency_p50_ms'] / args.list_repeats, 3)
+    return result
+
+
+def generate_certificate(workdir):
+    """Create server.crt/server.key in workdir using the project's generator"""
+    subprocess.check_call([sys.executable, os.path.join(ROOT_DIR, 'server', 'generate_ssl.py')],
+                          cwd=workdir, stdout=subprocess.DEVNULL)
+
+
+def compare(before_path, after_path):
+    """Print per-scenario changes in throughput and latency between two result files"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def key(r):
+        return (r['scenario'], r['size'], r['concurrency'], r.get('durability'))
+
+    baseline = {key(r): r for r in before['results']}
+    print(f"{'scenario':<16}{'size':>8}{'conc':>6}{'MB/s':>12}{'p50 ms':>12}{'p99 ms':>12}")
+    for r in after['results']:
+        b = baseline.get(key(r))
+        if not b:
+            continue
+
+        def delta(field):
+            if not b.get(field) or r.get(field) is None:
+                return 'n/a'
+            return f"{(r[field] - b[field]) / b[field] * 100:+.1f}%"
+
+        label = f"{r['scenario']}/{r['durability']}" if r.get('durability') else r['scenario']
+        print(f"{label:<16}{r['size_label'] or '-':>8}{r['concurrency']:>6}"
+              f"{delta('mb_s'):>12}{delta('latency_p50_ms'):>12}{delta('latency_p99_ms'):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Loopback benchmarks for FileServer/FileClient')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick', help='Default sizes and concurrency levels')
+    parser.add_argument('--sizes', help='Comma-separated file sizes, e.g. 1K,1M,1G')
+    parser.add_argument('--concurrency', help='Comma-separated client counts, e.g. 1,8,512')
+    parser.add_argument('--scenarios', default='upload,download,list', help='Scenarios to run')
+    parser.add_argument('--backend', choices=['fake', 'local'], default='fake',
+                        help='fake: encrypted uploads to a fake Drive; local: plaintext upload_dir')
+    parser.add_argument('--storage-latency', type=float, default=0.0, help='Simulated storage latency in seconds')
+    parser.add_argument('--durability', help='Comma-separated durability policies to run the transfer scenarios '
+                                             'under, e.g. none,fsync,group (local backend)')
+    parser.add_argument('--list-objects', type=int, help='Objects in storage for the list scenario')
+    parser.add_argument('--list-repeats', type=int, default=5, help='List commands per client')
+    parser.add_argument('--max-scenario-bytes', default='8G',
+                        help='Skip size/concurrency pairs moving more than this many bytes')
+    parser.add_argument('--server-args', type=json.loads, default={}, help='Extra FileServer kwargs as JSON')
+    parser.add_argument('--workdir', help='Scratch directory (default: a temporary directory)')
+    parser.add_argument('--output', '-o', help='Write JSON results here (default: stdout)')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    preset = PRESETS[args.preset]
+    sizes = [parse_size(s) for s in (args.sizes or preset['sizes']).split(',')]
+    levels = [int(c) for c in (args.concurrency or preset['concurrency']).split(',')]
+    scenarios = set(args.scenarios.split(','))
+    policies = args.durability.split(',') if args.durability else [None]
+    max_bytes = parse_size(args.max_scenario_bytes)
+    if args.list_objects is None:
+        args.list_objects = preset['list_objects']
+
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    base_dir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='sft_bench_'))
+    os.makedirs(base_dir, exist_ok=True)
+    cert_dir = os.path.join(base_dir, 'certs')
+    os.makedirs(cert_dir, exist_ok=True)
+    generate_certificate(cert_dir)
+
+    results = []
+    started = time.time()
+    # FileClient loads server.crt from the working directory and logs with print()
+    os.chdir(cert_dir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) as quiet:
+            for concurrency in levels:
+                if scenarios & {'upload', 'download'}:
+                    for size in sizes:
+                        if size * concurrency > max_bytes:
+                            print(f"skip {format_size(size)} x {concurrency}", file=sys.stderr)
+                            continue
+                        for durability in policies:
+                            workdir = tempfile.mkdtemp(dir=base_dir)
+                            shutil.copy('server.crt', workdir)
+                            shutil.copy('server.key', workdir)
+                            results.extend(bench_transfer(args, workdir, size, concurrency, scenarios, durability))
+                            shutil.rmtree(workdir, ignore_errors=True)
+                            quiet.seek(0)
+                            quiet.truncate()
+                            print(f"done {format_size(size)} x {concurrency}"
+                                  + (f" ({durability})" if durability else ''), file=sys.stderr)
+
+                if 'list' in scenarios:
+                    workdir = tempfile.mkdtemp(dir=base_dir)
+                    shutil.copy('server.crt', workdir)
+                    shutil.copy('server.key', workdir)
+                    results.append(bench_list(args, workdir, concurrency))
+                    shutil.rmtree(workdir, ignore_errors=True)
+                    quiet.seek(0)
+                    quiet.truncate()
+                    print(f"done list x {concurrency}", file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(started)),
+            'duration_s': round(time.time() - started, 3),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'backend': args.backend,
+            'storage_latency': args.storage_latency,
+            'durability': args.durability,
+            'server_args': args.server_args
+        },
+        'results': results
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
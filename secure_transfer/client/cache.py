@@ -0,0 +1,198 @@
+import os
+import time
+import shutil
+import sqlite3
+import threading
+
+try:
+    import fcntl
+    # FICLONE from linux/fs.h: share the extents of another file (btrfs, XFS, ...)
+    FICLONE = 0x40049409
+except ImportError:
+    fcntl = None
+
+# Default size limit of the cache
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+
+
+def clone_file(source, destination):
+    """
+    Make destination a copy of source as cheaply as the filesystem allows
+
+    A reflink (copy-on-write clone) is tried first, then a hard link, then
+    a plain copy. Reflinks and copies are independent files; a hard link
+    shares the inode, which ContentCache detects if the file is edited
+    (see ContentCache.lookup()).
+
+    Returns:
+        'reflink', 'link' or 'copy'
+    """
+    if os.path.lexists(destination):
+        os.remove(destination)
+    if fcntl is not None:
+        try:
+            with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return 'reflink'
+        except OSError:
+            os.remove(destination)
+    try:
+        os.link(source, destination)
+        return 'link'
+    except OSError:
+        shutil.copyfile(source, destination)
+        return 'copy'
+
+
+class ContentCache:
+    """
+    Local cache of downloaded files, by remote object ID and checksum
+
+    Each entry is a copy of a downloaded (decrypted) file plus the checksum
+    the server reported for the stored object. Before downloading, the
+    client sends the cached checksum; when the server's copy still has that
+    checksum it answers 'not_modified' without sending any bytes, and the
+    file is restored from the cache with clone_file(), so a repeated
+    download costs one round trip and, on most filesystems, no data copy.
+
+    Entries are evicted least recently used first once the cache holds
+    more than max_size bytes. The index is SQLite, like the key store.
+
+    Args:
+        directory: Cache directory (created if needed); keep it on the same
+            filesystem as the download directory so entries can be linked
+        max_size: Size limit in bytes
+    """
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False, timeout=5.0)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.execute('''CREATE TABLE IF NOT EXISTS entries (
+                file_id TEXT PRIMARY KEY,
+                checksum TEXT NOT NULL,
+                checksum_algorithm TEXT,
+                name TEXT,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )''')
+            self.db.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)')
+
+    @classmethod
+    def open(cls, cache, download_dir):
+        """
+        Return cache if it is already a ContentCache, else open it
+
+        True uses download_dir/.cache; a string is the cache directory;
+        None or False disables caching (returns None).
+        """
+        if isinstance(cache, ContentCache) or not cache:
+            return cache or None
+        return cls(os.path.join(download_dir, '.cache') if cache is True else cache)
+
+    def blob_path(self, file_id):
+        # File IDs are Drive IDs or local file names; neither may name a path
+        return os.path.join(self.directory, os.path.basename(file_id) + '.data')
+
+    def lookup(self, file_id):
+        """
+        Cached entry for file_id as a dict, or None
+
+        Entries whose file is missing or was changed since it was cached
+        (size or modification time differ) are dropped.
+        """
+        with self.lock:
+            row = self.db.execute('SELECT checksum, checksum_algorithm, name, size, mtime_ns '
+                                  'FROM entries WHERE file_id = ?', (file_id,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        entry = dict(zip(('checksum', 'checksum_algorithm', 'name', 'size', 'mtime_ns'), row))
+        entry['file_id'] = file_id
+        entry['path'] = self.blob_path(file_id)
+        try:
+            st = os.stat(entry['path'])
+        except OSError:
+            st = None
+        if st is None or st.st_size != entry['size'] or st.st_mtime_ns != entry['mtime_ns']:
+            self.remove(file_id)
+            self.misses += 1
+            return None
+        return entry
+
+    def restore(self, entry, output_path):
+        """
+        Write a cached entry to output_path and mark it used
+
+        Returns:
+            True on success, False if the cached file is gone
+        """
+        try:
+            if not (os.path.exists(output_path) and os.path.samefile(entry['path'], output_path)):
+                clone_file(entry['path'], output_path)
+        except OSError as e:
+            print(f"Cache entry for {entry['file_id']} unusable: {e}")
+            self.remove(entry['file_id'])
+            return False
+        with self.lock, self.db:
+            self.db.execute('UPDATE entries SET last_used = ? WHERE file_id = ?', (time.time(), entry['file_id']))
+        self.hits += 1
+        return True
+
+    def add(self, file_id, checksum, checksum_algorithm, path):
+        """Cache the downloaded file at path under file_id and the server's checksum"""
+        size = os.path.getsize(path)
+        if size > self.max_size:
+            return
+        blob = self.blob_path(file_id)
+        try:
+            clone_file(path, blob)
+            mtime_ns = os.stat(blob).st_mtime_ns
+        except OSError as e:
+            print(f"Could not cache {path}: {e}")
+            return
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (file_id, checksum, checksum_algorithm, os.path.basename(path), size,
+                             mtime_ns, time.time()))
+        self.evict()
+
+    def remove(self, file_id):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM entries WHERE file_id = ?', (file_id,))
+        try:
+            os.remove(self.blob_path(file_id))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_size"""
+        with self.lock:
+            total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total <= self.max_size:
+                return
+            victims = []
+            for file_id, size in self.db.execute('SELECT file_id, size FROM entries ORDER BY last_used'):
+                if total <= self.max_size:
+                    break
+                victims.append(file_id)
+                total -= size
+        for file_id in victims:
+            self.remove(file_id)
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.max_size,
+                'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
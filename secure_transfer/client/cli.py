@@ -0,0 +1,535 @@
+#!/usr/bin/env python
+"""
+Headless command line client for scripted and bulk transfers
+
+Examples:
+    python cli.py upload 'reports/*.pdf' -j 8
+    python cli.py upload -r photos/
+    python cli.py download 1AbC... 2DeF... -o restored/
+    python cli.py download --all -o backup/
+    python cli.py list --json
+    python cli.py sync documents/ --delete
+
+Completed transfers are recorded in a journal, so re-running an interrupted
+command skips files that are already done (resume is per file; the protocol
+has no byte-range restart). Exit status: 0 success, 1 some transfers failed,
+2 usage error, 3 cannot connect, 130 interrupted.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pool import ConnectionPool
+from sync import DirectorySync
+from keystore import KeyStore
+from cache import ContentCache, DEFAULT_CACHE_SIZE
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_CONNECT = 3
+EXIT_INTERRUPTED = 130
+
+# Files up to this size are sent in batches (see --batch-size)
+BATCH_FILE_SIZE = 1024 * 1024
+
+
+def parse_size(text):
+    """Byte count from '512', '64K', '10M' or '2G'"""
+    text = text.strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    try:
+        if text and text[-1] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r}")
+
+
+def format_bytes(n):
+    if n < 1024:
+        return f"{int(n)} B"
+    for unit in ('KB', 'MB', 'GB'):
+        n /= 1024.0
+        if n < 1024 or unit == 'GB':
+            return f"{n:.1f} {unit}"
+
+
+class Journal:
+    """
+    Record of completed transfers, used to skip work on re-runs
+
+    Uploads are keyed by absolute path and only count as done while the
+    file's size and mtime are unchanged; downloads are keyed by file ID.
+    The file is an append-only JSON lines log, so recording a transfer costs
+    one small write however many entries there are; later lines win.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {'upload': {}, 'download': {}}
+        self.log = None
+        if not path:
+            return
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by an interrupted run
+                        continue
+                    self.data[entry.pop('type')][entry.pop('key')] = entry
+        self.log = open(path, 'a')
+
+    def uploaded(self, file_path):
+        """Return the file ID if file_path was uploaded and has not changed since"""
+        entry = self.data['upload'].get(os.path.abspath(file_path))
+        if not entry:
+            return None
+        st = os.stat(file_path)
+        if entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return entry['file_id']
+        return None
+
+    def downloaded(self, file_id):
+        """Return the local path if file_id was downloaded and the file is still there"""
+        entry = self.data['download'].get(file_id)
+        if entry and os.path.exists(entry['path']) and os.path.getsize(entry['path']) == entry['size']:
+            return entry['path']
+        return None
+
+    def record_upload(self, file_path, file_id):
+        st = os.stat(file_path)
+        self._record('upload', os.path.abspath(file_path),
+                     {'file_id': file_id, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns})
+
+    def record_download(self, file_id, path):
+        self._record('download', file_id, {'path': os.path.abspath(path), 'size': os.path.getsize(path)})
+
+    def _record(self, kind, key, entry):
+        with self.lock:
+            self.data[kind][key] = entry
+            if self.log:
+                self.log.write(json.dumps(dict(entry, type=kind, key=key)) + '\n')
+                self.log.flush()
+
+    def close(self):
+        if self.log:
+            self.log.close()
+
+
+class Progress:
+    """Aggregate progress across concurrent transfers, drawn on stderr"""
+    def __init__(self, total_files, total_bytes, quiet=False):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.quiet = quiet
+        self.tty = sys.stderr.isatty()
+        self.lock = threading.Lock()
+        self.files_done = 0
+        self.failed = 0
+        self.bytes_done = 0
+        self.started = time.time()
+        self.last_draw = 0.0
+
+    def add(self, nbytes):
+        with self.lock:
+            self.bytes_done += nbytes
+            now = time.time()
+            if self.tty and not self.quiet and now - self.last_draw >= 0.25:
+                self.last_draw = now
+                self._draw(now)
+
+    def skipped(self, nbytes, message):
+        """Count a file that needed no transfer"""
+        with self.lock:
+            self.total_bytes -= nbytes
+        self.finished(message)
+
+    def finished(self, message, ok=True):
+        with self.lock:
+            self.files_done += 1
+            if not ok:
+                self.failed += 1
+            if not self.quiet or not ok:
+                if self.tty:
+                    sys.stderr.write('\r\033[K')
+                sys.stderr.write(f"[{self.files_done}/{self.total_files}] {message}\n")
+            if self.tty and not self.quiet:
+                self._draw(time.time())
+
+    def _draw(self, now):
+        elapsed = max(now - self.started, 1e-6)
+        rate = self.bytes_done / elapsed
+        line = (f"{self.files_done}/{self.total_files} files  {format_bytes(self.bytes_done)}"
+                f" / {format_bytes(self.total_bytes)}  {format_bytes(rate)}/s")
+        if rate > 0 and self.total_bytes > self.bytes_done:
+            eta = int((self.total_bytes - self.bytes_done) / rate)
+            line += f"  ETA {eta // 60}:{eta % 60:02d}"
+        sys.stderr.write('\r\033[K' + line)
+        sys.stderr.flush()
+
+    def summary(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        if self.tty and not self.quiet:
+            sys.stderr.write('\r\033[K')
+        return (f"{self.files_done - self.failed} ok, {self.failed} failed, "
+                f"{format_bytes(self.bytes_done)} in {elapsed:.1f}s ({format_bytes(self.bytes_done / elapsed)}/s)")
+
+
+def expand_paths(patterns, recursive):
+    """Expand globs and (with recursive) directories into a sorted list of files"""
+    files = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=recursive) or ([pattern] if os.path.exists(pattern) else [])
+        if not matches:
+            print(f"warning: no match for {pattern}", file=sys.stderr)
+        for path in matches:
+            if os.path.isdir(path):
+                if not recursive:
+                    print(f"warning: skipping directory {path} (use -r)", file=sys.stderr)
+                    continue
+                for root, _, names in os.walk(path):
+                    files.extend(os.path.join(root, name) for name in names)
+            elif os.path.isfile(path):
+                files.append(path)
+    return sorted(set(files))
+
+
+def run_parallel(jobs, parallel):
+    """Run callables on a thread pool; returns once all have finished"""
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = [executor.submit(job) for job in jobs]
+        for future in as_completed(futures):
+            future.result()
+
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)] if size else []
+
+
+def upload_files(pool, journal, files, parallel, progress, batch_size=0):
+    """
+    Upload files concurrently, skipping ones the journal already has
+
+    With batch_size, files up to BATCH_FILE_SIZE are sent batch_size at a
+    time with upload_batch instead of one request each.
+    """
+    pending = []
+    for path in files:
+        done = journal.uploaded(path)
+        if done:
+            progress.skipped(os.path.getsize(path), f"up to date {path} ({done})")
+        else:
+            pending.append(path)
+
+    # The server stores uploads by base name, so same-named files go one after another
+    groups = {}
+    for path in pending:
+        groups.setdefault(os.path.basename(path), []).append(path)
+    batched = []
+    if batch_size:
+        batched = [paths[0] for paths in groups.values()
+                   if len(paths) == 1 and os.path.getsize(paths[0]) <= BATCH_FILE_SIZE]
+        for path in batched:
+            del groups[os.path.basename(path)]
+
+    def finish(path, file_id):
+        if file_id:
+            journal.record_upload(path, file_id)
+            progress.finished(f"uploaded {path} -> {file_id}")
+        else:
+            progress.finished(f"FAILED {path}", ok=False)
+
+    def upload_group(paths):
+        for path in paths:
+            ok = False
+            try:
+                with pool.connection() as client:
+                    ok = client.upload_file(path, progress=progress.add)
+                    file_id = client.last_file_id
+            except ConnectionError:
+                pass
+            finish(path, file_id if ok else None)
+
+    def upload_chunk(paths):
+        results = None
+        try:
+            with pool.connection() as client:
+                results = client.upload_batch(paths, progress=progress.add)
+        except ConnectionError:
+            pass
+        by_path = {r['path']: r for r in results or []}
+        for path in paths:
+            result = by_path.get(path, {})
+            ok = result.get('status') == 'success'
+            finish(path, (result.get('gdrive_file_id') or result.get('file_id')) if ok else None)
+
+    jobs = [lambda paths=paths: upload_chunk(paths) for paths in chunks(batched, batch_size)]
+    jobs += [lambda paths=paths: upload_group(paths) for paths in groups.values()]
+    run_parallel(jobs, parallel)
+
+
+def output_names(file_ids, listing_names):
+    """Local file names for downloads, made unique when several IDs share a name"""
+    names = {}
+    for file_id in file_ids:
+        name = os.path.basename(listing_names.get(file_id) or file_id)
+        if name.endswith('.enc'):
+            name = name[:-4]
+        names[file_id] = name
+    counts = {}
+    for name in names.values():
+        counts[name] = counts.get(name, 0) + 1
+    for file_id, name in names.items():
+        if counts[name] > 1:
+            stem, ext = os.path.splitext(name)
+            names[file_id] = f"{stem}-{file_id[:8]}{ext}"
+    return names
+
+
+def download_files(pool, journal, file_ids, names, output_dir, parallel, progress, sizes=None, batch_size=0):
+    """
+    Download file IDs concurrently into output_dir, named by names[file_id]
+
+    With batch_size, files of up to BATCH_FILE_SIZE (by sizes[file_id]) are
+    fetched batch_size at a time with download_batch.
+    """
+    pending = []
+    for file_id in file_ids:
+        done = journal.downloaded(file_id)
+        if done:
+            progress.skipped(os.path.getsize(done), f"up to date {done}")
+        else:
+            pending.append(file_id)
+
+    sizes = sizes or {}
+    batched = []
+    if batch_size:
+        batched = [f for f in pending if f in sizes and sizes[f] <= BATCH_FILE_SIZE]
+        pending = [f for f in pending if f not in batched]
+
+    def finish(file_id, output_path):
+        if output_path:
+            journal.record_download(file_id, output_path)
+            progress.finished(f"downloaded {file_id} -> {output_path}")
+        else:
+            progress.finished(f"FAILED {file_id}", ok=False)
+
+    def download_one(file_id):
+        output_path = os.path.join(output_dir, names[file_id])
+        ok = False
+        try:
+            with pool.connection() as client:
+                ok = client.download_file(file_id, output_path=output_path, progress=progress.add)
+        except ConnectionError:
+            pass
+        finish(file_id, output_path if ok else None)
+
+    def download_chunk(chunk):
+        results = None
+        try:
+            with pool.connection() as client:
+                results = client.download_batch(chunk, output_dir, names, progress=progress.add)
+        except ConnectionError:
+            pass
+        for file_id, result in zip(chunk, results or [{}] * len(chunk)):
+            finish(file_id, result.get('path') if result.get('status') == 'success' else None)
+
+    jobs = [lambda chunk=chunk: download_chunk(chunk) for chunk in chunks(batched, batch_size)]
+    jobs += [lambda file_id=file_id: download_one(file_id) for file_id in pending]
+    run_parallel(jobs, parallel)
+
+
+def cmd_upload(args, pool, journal):
+    files = expand_paths(args.paths, args.recursive)
+    if not files:
+        print("error: nothing to upload", file=sys.stderr)
+        return EXIT_USAGE
+    progress = Progress(len(files), sum(os.path.getsize(p) for p in files), args.quiet)
+    upload_files(pool, journal, files, args.parallel, progress, args.batch_size)
+    print(progress.summary(), file=sys.stderr)
+    return EXIT_FAILED if progress.failed else EXIT_OK
+
+
+def cmd_sync(args, pool, journal):
+    """Two-way sync of each directory with the server (see sync.DirectorySync)"""
+    status = EXIT_OK
+    for path in args.paths:
+        if not os.path.isdir(path):
+            print(f"error: {path} is not a directory", file=sys.stderr)
+            return EXIT_USAGE
+        progress = Progress(0, 0, quiet=True)
+        syncer = DirectorySync(pool, path, delete=args.delete, parallel=args.parallel)
+        try:
+            report = syncer.run(dry_run=args.dry_run, progress=progress.add)
+        finally:
+            syncer.close()
+        verb = 'would' if args.dry_run else 'did'
+        print(f"{path}: {verb} upload {report['upload']}, download {report['download']}, "
+              f"delete {report['delete_remote']} remote / {report['delete_local']} local, "
+              f"{report['unchanged']} unchanged ({format_bytes(progress.bytes_done)} in {report['elapsed']:.1f}s)",
+              file=sys.stderr)
+        for item in report['failed']:
+            print(f"FAILED {item}", file=sys.stderr)
+        if report['failed']:
+            status = EXIT_FAILED
+    return status
+
+
+def cmd_download(args, pool, journal):
+    with pool.connection() as client:
+        listing = client.list_files()
+    names = {f.get('id'): f.get('name') for f in listing}
+    sizes = {f.get('id'): int(f.get('size', 0) or 0) for f in listing}
+
+    file_ids = list(args.file_ids)
+    if args.all:
+        file_ids.extend(f for f in names if f not in file_ids)
+    if not file_ids:
+        print("error: give file IDs or --all", file=sys.stderr)
+        return EXIT_USAGE
+
+    os.makedirs(args.output, exist_ok=True)
+    progress = Progress(len(file_ids), sum(sizes.get(f, 0) for f in file_ids), args.quiet)
+    download_files(pool, journal, file_ids, output_names(file_ids, names), args.output, args.parallel, progress,
+                   sizes, args.batch_size)
+    print(progress.summary(), file=sys.stderr)
+    return EXIT_FAILED if progress.failed else EXIT_OK
+
+
+def cmd_list(args, pool, journal, out):
+    filters = {
+        'glob': args.pattern, 'owner': args.owner, 'min_size': args.min_size, 'max_size': args.max_size,
+        'created_after': args.since, 'created_before': args.until, 'sort': args.sort
+    }
+    fields = args.fields.split(',') if args.fields else None
+    with pool.connection() as client:
+        try:
+            # Filtered, sorted and projected by the server; entries are printed as pages arrive
+            files = client.iter_files(fields, limit=args.limit, **filters)
+            if args.json:
+                json.dump(list(files), out, indent=2)
+                out.write('\n')
+                return EXIT_OK
+            for f in files:
+                if fields:
+                    out.write('\t'.join(str(f.get(name, '')) for name in fields) + '\n')
+                else:
+                    out.write(f"{f.get('id', ''):<40} {str(f.get('size', '')):>12}  {f.get('name', '')}\n")
+        except ConnectionError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return EXIT_FAILED
+    return EXIT_OK
+
+
+def add_common_args(parser, default=None):
+    """Connection and output options; default=SUPPRESS keeps values given before the command"""
+    def d(value):
+        return value if default is None else default
+    parser.add_argument('--host', default=d('localhost'), help='Server host')
+    parser.add_argument('--port', type=int, default=d(5000), help='Server port')
+    parser.add_argument('--cert', default=d('server.crt'), help='Server certificate to trust')
+    parser.add_argument('--keys', default=d('file_keys.db'), help='Encryption key store (a .json key file is migrated)')
+    parser.add_argument('--cache', default=d(None), help='Download cache directory (default: <output>/.cache; "" disables)')
+    parser.add_argument('--cache-size', type=parse_size, default=d(DEFAULT_CACHE_SIZE), help='Download cache size limit (e.g. 2G)')
+    parser.add_argument('--journal', default=d('.sft_journal.jsonl'), help='Journal of completed transfers ("" disables resume)')
+    parser.add_argument('-j', '--parallel', type=int, default=d(4), help='Concurrent transfers')
+    parser.add_argument('--batch-size', type=int, default=d(100), help='Files per batch request for files up to 1 MB (0 = one request per file)')
+    parser.add_argument('-q', '--quiet', action='store_true', default=d(False), help='Only print errors and the summary')
+    parser.add_argument('-v', '--verbose', action='store_true', default=d(False), help='Show FileClient messages')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Secure file transfer command line client')
+    add_common_args(parser)
+    # Subcommands accept the same options, so they can follow the command name
+    common = argparse.ArgumentParser(add_help=False)
+    add_common_args(common, argparse.SUPPRESS)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('upload', parents=[common], help='Upload files, globs or directories')
+    p.add_argument('paths', nargs='+', help='Files, glob patterns or directories')
+    p.add_argument('-r', '--recursive', action='store_true', help='Descend into directories')
+
+    p = sub.add_parser('download', parents=[common], help='Download files by ID')
+    p.add_argument('file_ids', nargs='*', help='File IDs to download')
+    p.add_argument('--all', action='store_true', help='Download every file on the server')
+    p.add_argument('-o', '--output', default='downloads', help='Output directory')
+
+    p = sub.add_parser('list', parents=[common], help='List files on the server')
+    p.add_argument('--json', action='store_true', help='Print the listing as JSON')
+    p.add_argument('pattern', nargs='?', help="Only names matching this shell pattern, e.g. '*.pdf'")
+    p.add_argument('--owner', help='Only files uploaded from this client IP')
+    p.add_argument('--min-size', type=parse_size, help='Only files at least this large (e.g. 10M)')
+    p.add_argument('--max-size', type=parse_size, help='Only files at most this large')
+    p.add_argument('--since', help='Only files created at or after this UTC date/time (ISO 8601)')
+    p.add_argument('--until', help='Only files created before this UTC date/time')
+    p.add_argument('--sort', default='created', help="created, name or size; prefix '-' for descending (--sort=-size)")
+    p.add_argument('--limit', type=int, help='Print at most this many files')
+    p.add_argument('--fields', help='Comma-separated fields to fetch and print (e.g. id,name,size,checksum)')
+
+    p = sub.add_parser('sync', parents=[common], help='Two-way sync of directories with the server')
+    p.add_argument('paths', nargs='+', help='Directories to sync')
+    p.add_argument('--delete', action='store_true', help='Propagate deletions (default: restore deleted files)')
+    p.add_argument('--dry-run', action='store_true', help='Only show what would be done')
+
+    args = parser.parse_args(argv)
+    if args.parallel < 1:
+        parser.error('--parallel must be at least 1')
+    if not os.path.exists(args.cert):
+        print(f"error: certificate {args.cert} not found", file=sys.stderr)
+        return EXIT_USAGE
+
+    out = sys.stdout
+    journal = Journal(args.journal or None)
+    if args.keys.endswith('.json'):
+        # An old-style key file: keep using it through a key store beside it
+        keys = KeyStore(os.path.splitext(args.keys)[0] + '.db', legacy_json=args.keys)
+    else:
+        keys = args.keys
+    download_dir = getattr(args, 'output', 'downloads')
+    cache_dir = os.path.join(download_dir, '.cache') if args.cache is None else args.cache
+    cache = ContentCache(cache_dir, args.cache_size) if cache_dir else None
+    pool = ConnectionPool(args.host, args.port, size=args.parallel, download_dir=download_dir,
+                          cafile=args.cert, key_store=keys, cache=cache)
+
+    # FileClient reports through print(); keep stdout clean for command output
+    quiet_client = open(os.devnull, 'w') if not args.verbose else None
+    try:
+        with contextlib.redirect_stdout(quiet_client or sys.stderr):
+            if not pool.warm(1):
+                print(f"error: cannot connect to {args.host}:{args.port}", file=sys.stderr)
+                return EXIT_CONNECT
+            if args.command == 'upload':
+                status = cmd_upload(args, pool, journal)
+            elif args.command == 'sync':
+                status = cmd_sync(args, pool, journal)
+            elif args.command == 'download':
+                status = cmd_download(args, pool, journal)
+            else:
+                status = cmd_list(args, pool, journal, out)
+            pool.close()
+    except KeyboardInterrupt:
+        print("\ninterrupted; completed transfers are in the journal", file=sys.stderr)
+        status = EXIT_INTERRUPTED
+    finally:
+        pool.close()
+        journal.close()
+        pool.saved_keys.close()
+        if cache:
+            cache.close()
+        if quiet_client:
+            quiet_client.close()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,37 +5,82 @@ import sys
 import traceback
 import time
 import ssl
-import hashlib
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from server.encryption import FileEncryptor
+from server.encryption import FileEncryptor, file_checksum
+from server.buffers import ConnectionBuffer, DEFAULT_IO_SIZE, send_json, encode_json, configure_tls
+from keystore import KeyStore
+from cache import ContentCache
+
+
+class TransferStopped(Exception):
+    """Raised by a progress callback to abandon a transfer (e.g. the user cancelled it)"""
+
 
 class FileClient:
-    def __init__(self, host='localhost', port=5000, download_dir='downloads'):
+    def __init__(self, host='localhost', port=5000, download_dir='downloads', io_size=DEFAULT_IO_SIZE, trace=False,
+                 max_busy_retries=10, io_timeout=None, ssl_context=None, ciphers=None, tls_min_version=None,
+                 key_store='file_keys.db', cache=True):
         self.host = host
         self.port = port
         self.download_dir = download_dir
+        self.io_size = io_size
+        self.trace = trace
+        self.max_busy_retries = max_busy_retries
+        # Socket timeout once connected; None waits as long as the server needs
+        # (encrypting and uploading a large file to Drive can take minutes)
+        self.io_timeout = io_timeout
+        self.last_trace = None
         self.sock = None
+        self.buffer = None
         self.connected = False
         self.gdrive_files = []
-        self.saved_keys = {}  
+        # Keys and checksums of uploaded files: a KeyStore path, a shared KeyStore, or None (memory only)
+        self.saved_keys = KeyStore.open(key_store)
+        self.last_file_id = None
+        # Position in the server's change event stream (see watch())
+        self.event_epoch = None
+        self.event_seq = None
         
-        # SSL 
-        self.ssl_context = ssl.create_default_context()
-        self.ssl_context.load_verify_locations('server.crt')
+        # SSL; pass a shared ssl_context to resume sessions across clients (see pool.py)
+        self.ssl_context = ssl_context or self.create_ssl_context(ciphers, tls_min_version)
+        # Session from the last connection, offered on reconnect to skip the full handshake
+        self.tls_session = None
+        self.handshakes = 0
+        self.resumed_handshakes = 0
         
         
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir)
+        # Downloaded files by object ID and checksum: True (download_dir/.cache), a directory,
+        # a shared ContentCache, or None to always download
+        self.cache = ContentCache.open(cache, self.download_dir)
     
-    def calculate_checksum(self, file_path):
-        """Calculate SHA256 checksum of a file"""
-        sha256 = hashlib.sha256()
-        with open(file_path, 'rb') as f:
-            while chunk := f.read(8192):
-                sha256.update(chunk)
-        return sha256.hexdigest()
+    @staticmethod
+    def create_ssl_context(ciphers=None, tls_min_version=None, cafile='server.crt'):
+        """Create a client SSL context trusting the server certificate"""
+        context = ssl.create_default_context()
+        context.load_verify_locations(cafile)
+        return configure_tls(context, ciphers, min_version=tls_min_version)
+    
+    def calculate_checksum(self, file_path, algorithm='sha256'):
+        """Calculate the checksum of a file (SHA256 unless the server says otherwise)"""
+        return file_checksum(file_path, algorithm)
 
+    def show_trace(self, response):
+        """Print where the server spent its time, if the response carries a trace summary"""
+        summary = response.get('trace') if response else None
+        if not summary:
+            return
+        self.last_trace = summary
+        print(f"Server time: {summary['total_ms']:.1f} ms")
+        for name, stage in sorted(summary['stages'].items(), key=lambda item: -item[1]['ms']):
+            rate = f" ({stage['mb_s']} MB/s)" if 'mb_s' in stage else ''
+            print(f"  {name:<15}{stage['ms']:>10.1f} ms{rate}")
+    
     def connect(self):
         """Connect to the server with retry"""
         max_retries = 3
@@ -56,9 +101,15 @@ class FileClient:
                 
                 self.sock = self.ssl_context.wrap_socket(
                     plain_sock,
-                    server_hostname=self.host
+                    server_hostname=self.host,
+                    session=self.tls_session
                 )
                 self.sock.connect((self.host, self.port))
+                self.sock.settimeout(self.io_timeout)
+                self.handshakes += 1
+                if self.sock.session_reused:
+                    self.resumed_handshakes += 1
+                self.buffer = ConnectionBuffer(self.sock, self.io_size)
                 self.connected = True
                 print(f"Connected to server at {self.host}:{self.port}")
                 return True
@@ -77,14 +128,27 @@ class FileClient:
     def disconnect(self):
         """Disconnect from the server"""
         if self.sock:
+            # TLS 1.3 tickets arrive after the handshake, so keep the latest session
+            self.save_session()
             try:
                 self.sock.close()
             except:
                 pass
             self.sock = None
+            self.buffer = None
             self.connected = False
             print("Disconnected from server")
     
+    def save_session(self):
+        """Remember the current TLS session so the next connect can resume it"""
+        try:
+            session = self.sock.session if self.sock else None
+        except (OSError, ValueError):
+            session = None
+        if session is not None:
+            self.tls_session = session
+        return self.tls_session
+    
     def reconnect(self):
         """Try to reconnect to the server"""
         print("Attempting to reconnect...")
@@ -99,25 +163,35 @@ class FileClient:
         
         max_retries = 3
         retry_delay = 1  
+        busy_retries = 0
         
-        for attempt in range(max_retries):
+        attempt = 0
+        while attempt < max_retries:
             try:
                 
-                message_json = json.dumps(message_data)
-                message_bytes = message_json.encode('utf-8')
+                send_json(self.sock, message_data)
                 
                 
-                msg_len = len(message_bytes)
-                self.sock.sendall(msg_len.to_bytes(4, byteorder='big'))
-                
-
-                self.sock.sendall(message_bytes)
+                response = self.receive_response()
+                if response is None and not self.connected:
+                    # e.g. the server closed this connection after it sat idle
+                    raise ConnectionError("Connection closed by server")
                 
+                # The server is at capacity: nothing was transferred yet, so wait and resend
+                if response and response.get('status') == 'busy' and busy_retries < self.max_busy_retries:
+                    busy_retries += 1
+                    delay = response.get('retry_after', 1) * random.uniform(1.0, 1.5)
+                    print(f"Server busy, retrying in {delay:.1f}s ({busy_retries}/{self.max_busy_retries})")
+                    time.sleep(delay)
+                    if response.get('closing') and not self.reconnect():
+                        return None
+                    continue
                 
-                return self.receive_response()
+                return response
             
             except ConnectionError as e:
-                if attempt < max_retries - 1:
+                attempt += 1
+                if attempt < max_retries:
                     print(f"Connection error, attempting to reconnect... ({e})")
                     if self.reconnect():
                         continue
@@ -137,32 +211,15 @@ class FileClient:
         """Receive a response from the server with timeout"""
         try:
             
-            msg_len_bytes = self.sock.recv(4)
-            if not msg_len_bytes:
+            message = self.buffer.recv_frame()
+            if message is None:
                 raise ConnectionError("Connection closed by server")
             
-            msg_len = int.from_bytes(msg_len_bytes, byteorder='big')
-            
-            
-            message = b''
-            bytes_received = 0
-            
-            while bytes_received < msg_len:
-                try:
-                    chunk = self.sock.recv(min(4096, msg_len - bytes_received))
-                    if not chunk:
-                        raise ConnectionError("Connection lost while receiving response")
-                    message += chunk
-                    bytes_received += len(chunk)
-                except socket.timeout:
-                    print("Timeout while receiving response, retrying...")
-                    continue
-            
             if not message:
                 raise ConnectionError("Empty response received")
             
             
-            response_data = json.loads(message.decode('utf-8'))
+            response_data = json.loads(str(message, 'utf-8'))
             return response_data
         
         except Exception as e:
@@ -171,8 +228,19 @@ class FileClient:
             self.disconnect()
             return None
     
-    def upload_file(self, file_path):
-        """Upload a file to the server"""
+    def upload_file(self, file_path, progress=None, remote_name=None):
+        """
+        Upload a file to the server
+        
+        Args:
+            file_path: File to upload
+            progress: Optional callable(nbytes) called as file data is sent
+            remote_name: Name to store the file under (default: its base name)
+        
+        Returns:
+            True on success; the new file's ID is left in self.last_file_id
+        """
+        self.last_file_id = None
         if not os.path.exists(file_path):
             print(f"File not found: {file_path}")
             return False
@@ -183,9 +251,10 @@ class FileClient:
         
         response = self.send_message({
             'command': 'upload',
-            'filename': os.path.basename(file_path),
+            'filename': remote_name or os.path.basename(file_path),
             'file_size': file_size,
-            'checksum': checksum
+            'checksum': checksum,
+            'trace': self.trace
         })
         
         if not response or response.get('status') != 'ready':
@@ -194,12 +263,13 @@ class FileClient:
         
         try:
             
-            with open(file_path, 'rb') as f:
-                while True:
-                    chunk = f.read(4096)
-                    if not chunk:
-                        break
-                    self.sock.sendall(chunk)
+            self.buffer.progress = progress
+            try:
+                with open(file_path, 'rb') as f:
+                    self.buffer.send_from_file(f)
+            finally:
+                if self.buffer:
+                    self.buffer.progress = None
             
 
             response = self.receive_response()
@@ -209,26 +279,44 @@ class FileClient:
                 return False
             
             print(f"Upload successful: {response.get('message')}")
+            self.last_file_id = response.get('gdrive_file_id') or response.get('file_id')
+            self.show_trace(response)
             
             
-            if 'checksum' in response and response['checksum'] != checksum:
-                print("Warning: Server checksum doesn't match local checksum")
+            if 'checksum' in response:
+                algorithm = response.get('checksum_algorithm', 'sha256')
+                local_checksum = checksum if algorithm == 'sha256' else self.calculate_checksum(file_path, algorithm)
+                if response['checksum'] != local_checksum:
+                    print("Warning: Server checksum doesn't match local checksum")
             
             
             if 'gdrive_file_id' in response and 'key' in response:
-                self.saved_keys[response['gdrive_file_id']] = response['key']
+                self.saved_keys.put(response['gdrive_file_id'], response['key'], response.get('checksum'),
+                                    response.get('checksum_algorithm'), file_size, os.path.basename(file_path))
                 print(f"Saved encryption key for file ID: {response['gdrive_file_id']}")
             
             return True
         
+        except TransferStopped:
+            # The server is still expecting file data, so the connection can't be reused
+            print("Upload stopped")
+            self.disconnect()
+            return False
         except Exception as e:
             print(f"Error during upload: {e}")
             traceback.print_exc()
             self.disconnect()
             return False
     
-    def download_file(self, gdrive_file_id, output_path=None):
-        """Download a file from the server"""
+    def download_file(self, gdrive_file_id, output_path=None, progress=None):
+        """
+        Download a file from the server
+        
+        Args:
+            gdrive_file_id: ID returned by the upload
+            output_path: Where to write the file (default: download_dir/original name)
+            progress: Optional callable(nbytes) called as file data arrives
+        """
         if not gdrive_file_id:
             print("Missing Google Drive file ID")
             return False
@@ -238,26 +326,40 @@ class FileClient:
         if not encryption_key:
             print("Warning: No encryption key found for this file")
         
-        
-        response = self.send_message({
+        request = {
             'command': 'download',
             'gdrive_file_id': gdrive_file_id,
             'key': encryption_key,
-            'checksum': self.saved_keys.get(gdrive_file_id + '_checksum') if encryption_key else None
-        })
+            'trace': self.trace
+        }
+        # With a cached copy, the server answers not_modified instead of resending unchanged bytes
+        cached = self.cache.lookup(gdrive_file_id) if self.cache else None
+        if cached:
+            request['cached_checksum'] = cached['checksum']
+        
+        response = self.send_message(request)
+        
+        if response and response.get('status') == 'not_modified' and cached:
+            output_path = output_path or os.path.join(self.download_dir, cached['name'])
+            if self.cache.restore(cached, output_path):
+                print(f"Successfully downloaded: {output_path} (unchanged, from cache)")
+                return True
+            # The cached copy vanished; download it for real
+            return self.download_file(gdrive_file_id, output_path, progress)
         
         if not response or response.get('status') != 'ready':
             print(f"Failed to initiate download: {response.get('message') if response else 'No response'}")
             return False
         
+        temp_path = None
         try:
             file_size = response.get('file_size')
             filename = response.get('filename')
             server_checksum = response.get('checksum')
+            checksum_algorithm = response.get('checksum_algorithm', 'sha256')
+            encrypted = response.get('encrypted', True)
             
             
-            temp_path = os.path.join(self.download_dir, f"temp_{filename}")
-            
             if not output_path:
                 if filename.endswith('.enc'):
                     original_filename = filename[:-4]  
@@ -265,22 +367,20 @@ class FileClient:
                     original_filename = filename
                 output_path = os.path.join(self.download_dir, original_filename)
             
+            # Unique, so parallel downloads of files with the same name don't share it, and next to
+            # output_path, so moving it into place is a rename even when that is on another filesystem
+            fd, temp_path = tempfile.mkstemp(prefix='temp_', dir=os.path.dirname(output_path) or '.')
+            
             print(f"Downloading {os.path.basename(output_path)}...")
             
             
-            with open(temp_path, 'wb') as f:
-                bytes_received = 0
-                
-                while bytes_received < file_size:
-                    # data in chunks
-                    chunk_size = min(4096, file_size - bytes_received)
-                    chunk = self.sock.recv(chunk_size)
-                    
-                    if not chunk:
-                        break
-                    
-                    f.write(chunk)
-                    bytes_received += len(chunk)
+            self.buffer.progress = progress
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    bytes_received = self.buffer.recv_to_file(f, file_size)
+            finally:
+                if self.buffer:
+                    self.buffer.progress = None
             
             
             if bytes_received != file_size:
@@ -291,7 +391,7 @@ class FileClient:
             
 
             if server_checksum:
-                local_checksum = self.calculate_checksum(temp_path)
+                local_checksum = self.calculate_checksum(temp_path, checksum_algorithm)
                 if local_checksum != server_checksum:
                     print("Checksum verification failed - file may be corrupted")
                     os.remove(temp_path)
@@ -306,8 +406,14 @@ class FileClient:
                     os.remove(temp_path)
                 return False
             
+            self.show_trace(response)
 
-            if encryption_key:
+            if not encrypted:
+                
+                os.replace(temp_path, output_path)
+                print(f"Successfully downloaded: {output_path}")
+                self.cache_download(gdrive_file_id, server_checksum, checksum_algorithm, output_path)
+            elif encryption_key:
                 try:
                     print("Decrypting file...")
 
@@ -320,12 +426,11 @@ class FileClient:
                     os.remove(temp_path)
                     
 
-                    if 'checksum' in response:
-                        decrypted_checksum = self.calculate_checksum(output_path)
-                        if decrypted_checksum != response['checksum']:
-                            print("Warning: Decrypted file checksum doesn't match expected checksum")
+                    if not self.verify_plaintext(gdrive_file_id, output_path, decryptor.last_header['hash']):
+                        print("Warning: Decrypted file checksum doesn't match expected checksum")
                     
                     print(f"Successfully downloaded and decrypted: {output_path}")
+                    self.cache_download(gdrive_file_id, server_checksum, checksum_algorithm, output_path)
                 except Exception as e:
                     print(f"Error decrypting file: {e}")
                     if os.path.exists(temp_path):
@@ -341,33 +446,492 @@ class FileClient:
             return True
         
         except Exception as e:
-            print(f"Error during download: {e}")
-            traceback.print_exc()
+            if isinstance(e, TransferStopped):
+                print("Download stopped")
+            else:
+                print(f"Error during download: {e}")
+                traceback.print_exc()
             self.disconnect()
-            if os.path.exists(temp_path):
+            if temp_path and os.path.exists(temp_path):
                 os.remove(temp_path)
             return False
     
-    def list_files(self):
-        """List files available on the server"""
+    def cache_download(self, file_id, checksum, checksum_algorithm, path):
+        """Keep a downloaded file in the cache under the stored object's checksum"""
+        if self.cache and checksum:
+            self.cache.add(file_id, checksum, checksum_algorithm, path)
+    
+    def verify_plaintext(self, file_id, path, algorithm):
+        """
+        Compare a downloaded file with the checksum recorded when it was uploaded
+        
+        Returns:
+            False on a mismatch; True if it matches or no checksum was recorded
+        """
+        stored = self.saved_keys.info(file_id)
+        if not stored or not stored['checksum']:
+            return True
+        # The header of the stored file says which algorithm the upload checksum used
+        return self.calculate_checksum(path, stored['checksum_algorithm'] or algorithm) == stored['checksum']
+    
+    def upload_batch(self, file_paths, progress=None, names=None):
+        """
+        Upload many files in one request
+        
+        Each file is streamed as a JSON entry header followed by its bytes.
+        Headers and small files are coalesced into io_size writes, so a batch
+        of tiny files costs a few large TLS records instead of a round trip
+        per file.
+        
+        Args:
+            file_paths: Files to upload
+            progress: Optional callable(nbytes) called as file data is sent
+            names: Optional dict of path -> name to store the file under
+        
+        Returns:
+            List of per-file result dicts ('path', 'status' and the file ID,
+            checksum and key on success), or None if the batch failed
+        """
+        names = names or {}
+        files = []
+        for path in file_paths:
+            if os.path.isfile(path):
+                files.append((path, os.path.getsize(path)))
+            else:
+                print(f"File not found: {path}")
+        if not files:
+            return None
+        
         response = self.send_message({
-            'command': 'list'
+            'command': 'upload_batch',
+            'count': len(files),
+            'total_size': sum(size for _, size in files),
+            'trace': self.trace
         })
         
-        if not response or response.get('status') != 'success':
-            print(f"Failed to list files: {response.get('message') if response else 'No response'}")
-            return []
+        if not response or response.get('status') != 'ready':
+            print(f"Failed to initiate batch upload: {response.get('message') if response else 'No response'}")
+            return None
+        
+        try:
+            pending = bytearray()
+            for path, size in files:
+                pending += encode_json({'filename': names.get(path) or os.path.basename(path), 'file_size': size})
+                with open(path, 'rb') as f:
+                    if size <= self.io_size:
+                        pending += f.read(size)
+                        if progress:
+                            progress(size)
+                        if len(pending) >= self.io_size:
+                            self.sock.sendall(pending)
+                            pending.clear()
+                        continue
+                    self.sock.sendall(pending)
+                    pending.clear()
+                    self.buffer.progress = progress
+                    try:
+                        self.buffer.send_from_file(f, size)
+                    finally:
+                        self.buffer.progress = None
+            pending += encode_json({'end': True})
+            self.sock.sendall(pending)
+            
+            response = self.receive_response()
+            if not response or response.get('status') != 'success':
+                print(f"Batch upload failed: {response.get('message') if response else 'No response'}")
+                return None
+            
+            print(f"Batch upload: {response.get('message')}")
+            self.show_trace(response)
+            results = response.get('results', [])
+            keys = []
+            for result in results:
+                path, size = files[result['index']]
+                result['path'] = path
+                if result.get('status') == 'success' and 'gdrive_file_id' in result and 'key' in result:
+                    keys.append((result['gdrive_file_id'], result['key'], result.get('checksum'),
+                                 result.get('checksum_algorithm'), size, os.path.basename(path)))
+            self.saved_keys.put_many(keys)
+            return results
         
-        files = response.get('files', [])
+        except Exception as e:
+            print(f"Error during batch upload: {e}")
+            traceback.print_exc()
+            self.disconnect()
+            return None
+    
+    def download_batch(self, file_ids, output_dir=None, names=None, progress=None):
+        """
+        Download many files in one request
+        
+        The server sends files in the order they become ready. Checksum
+        verification and decryption run on worker threads while the next
+        files are received.
+        
+        Args:
+            file_ids: IDs to download
+            output_dir: Directory for the files (default: download_dir)
+            names: Optional dict of file ID -> path relative to output_dir
+            progress: Optional callable(nbytes) called as file data arrives
+        
+        Returns:
+            List of per-file result dicts ('id', 'status' and 'path' or
+            'message') in file_ids order, or None if the batch failed
+        """
+        file_ids = list(file_ids)
+        output_dir = output_dir or self.download_dir
+        names = names or {}
+        
+        # Files with a cached copy come back as not_modified, with no body, if unchanged
+        cached = {}
+        if self.cache:
+            for file_id in file_ids:
+                entry = self.cache.lookup(file_id)
+                if entry:
+                    cached[file_id] = entry
+        
+        response = self.send_message({
+            'command': 'download_batch',
+            'files': file_ids,
+            'cached': {file_id: entry['checksum'] for file_id, entry in cached.items()},
+            'trace': self.trace
+        })
+        
+        if not response or response.get('status') != 'ready':
+            print(f"Failed to initiate batch download: {response.get('message') if response else 'No response'}")
+            return None
+        
+        results = [None] * len(file_ids)
+        temp_path = None
+        try:
+            with ThreadPoolExecutor(max_workers=4) as workers:
+                futures = []
+                for _ in file_ids:
+                    header = self.buffer.recv_message()
+                    if header is None:
+                        raise ConnectionError("Connection closed during batch download")
+                    index, file_id = header['index'], header['id']
+                    if header['status'] == 'not_modified' and file_id in cached:
+                        output_path = os.path.join(output_dir, names.get(file_id) or cached[file_id]['name'])
+                        if self.cache.restore(cached[file_id], output_path):
+                            results[index] = {'id': file_id, 'status': 'success', 'path': output_path, 'cached': True}
+                        else:
+                            results[index] = {'id': file_id, 'status': 'error', 'message': 'Cached copy is gone'}
+                        continue
+                    if header['status'] != 'success':
+                        results[index] = {'id': file_id, 'status': 'error', 'message': header.get('message')}
+                        continue
+                    
+                    if file_id in names:
+                        output_path = os.path.join(output_dir, names[file_id])
+                    else:
+                        name = header['filename']
+                        if name.endswith('.enc'):
+                            name = name[:-4]
+                        output_path = os.path.join(output_dir, os.path.basename(name))
+                    fd, temp_path = tempfile.mkstemp(prefix='temp_', dir=os.path.dirname(output_path))
+                    self.buffer.progress = progress
+                    try:
+                        with os.fdopen(fd, 'wb') as f:
+                            bytes_received = self.buffer.recv_to_file(f, header['file_size'])
+                    finally:
+                        self.buffer.progress = None
+                    if bytes_received != header['file_size']:
+                        raise ConnectionError("Incomplete file transfer")
+                    futures.append(workers.submit(self.finish_batch_download, index, file_id, header, temp_path, output_path))
+                    temp_path = None
+                
+                response = self.receive_response()
+                for future in futures:
+                    index, result = future.result()
+                    results[index] = result
+            
+            if not response or response.get('status') != 'success':
+                print(f"Batch download failed: {response.get('message') if response else 'No response'}")
+                return None
+            print(f"Batch download: {response.get('message')}")
+            self.show_trace(response)
+            return results
+        
+        except Exception as e:
+            print(f"Error during batch download: {e}")
+            traceback.print_exc()
+            self.disconnect()
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+    
+    def finish_batch_download(self, index, file_id, header, temp_path, output_path):
+        """Verify and decrypt one received batch entry (runs on a worker thread)"""
+        try:
+            if self.calculate_checksum(temp_path, header.get('checksum_algorithm', 'sha256')) != header.get('checksum'):
+                raise ValueError("Checksum verification failed - file may be corrupted")
+            encryption_key = self.saved_keys.get(file_id)
+            if header.get('encrypted', True) and encryption_key:
+                decryptor = FileEncryptor(encryption_key)
+                decryptor.decrypt_file(temp_path, output_path)
+                os.remove(temp_path)
+                if not self.verify_plaintext(file_id, output_path, decryptor.last_header['hash']):
+                    raise ValueError("Decrypted file checksum doesn't match the checksum recorded at upload")
+                self.cache_download(file_id, header.get('checksum'), header.get('checksum_algorithm'), output_path)
+            else:
+                if header.get('encrypted', True):
+                    print(f"Warning: No encryption key found. File remains encrypted: {output_path}")
+                os.replace(temp_path, output_path)
+                if not header.get('encrypted', True):
+                    self.cache_download(file_id, header.get('checksum'), header.get('checksum_algorithm'), output_path)
+            return index, {'id': file_id, 'status': 'success', 'path': output_path}
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return index, {'id': file_id, 'status': 'error', 'message': str(e)}
+    
+    def list_files(self, fields=None, page_size=1000, limit=None, **filters):
+        """
+        List files available on the server
+        
+        Args:
+            fields: Optional list of entry fields to fetch (e.g. ['id', 'name'])
+            page_size: Entries per streamed page
+            limit: Optional maximum number of entries
+            filters: Optional server-side filters and sort: prefix, glob,
+                contains, owner, min_size, max_size, created_after,
+                created_before (epoch or ISO 8601) and sort ('created',
+                'name' or 'size', '-' prefix for descending)
+        
+        Returns:
+            List of file dicts ([] on failure)
+        """
+        try:
+            files = list(self.iter_files(fields, page_size, limit, **filters))
+        except ConnectionError as e:
+            print(f"Failed to list files: {e}")
+            return []
         self.gdrive_files = files
         
         return files
     
+    def iter_files(self, fields=None, page_size=1000, limit=None, **filters):
+        """
+        Stream the server's file listing, yielding entries as pages arrive
+        
+        Takes the same arguments as list_files(). Stopping early
+        disconnects, since the rest of the listing is still in flight.
+        
+        Raises:
+            ConnectionError: The listing could not be fetched
+        """
+        message = {'command': 'list', 'stream': True, 'page_size': page_size, 'trace': self.trace}
+        if limit:
+            message['limit'] = limit
+        message.update((name, value) for name, value in filters.items() if value is not None)
+        if fields:
+            message['fields'] = list(fields)
+        
+        response = self.send_message(message)
+        finished = False
+        try:
+            while response and response.get('status') == 'page':
+                yield from response.get('files', [])
+                response = self.receive_response()
+            # An error frame ends the listing too, so the connection is still usable
+            finished = response is not None
+            if not response or response.get('status') != 'success':
+                raise ConnectionError(response.get('message') if response else 'No response')
+            self.show_trace(response)
+        finally:
+            if not finished and self.connected:
+                self.disconnect()
+    
+    def list_page(self, limit=1000, cursor=None, fields=None, **filters):
+        """
+        Fetch one page of the server's file listing
+        
+        Args:
+            limit: Maximum number of files in the page
+            cursor: next_cursor returned with the previous page
+            fields, filters: As for list_files()
+        
+        Returns:
+            (files, next_cursor); next_cursor is None on the last page
+        """
+        message = {'command': 'list', 'limit': limit, 'trace': self.trace}
+        if cursor:
+            message['cursor'] = cursor
+        if fields:
+            message['fields'] = list(fields)
+        message.update((name, value) for name, value in filters.items() if value is not None)
+        response = self.send_message(message)
+        
+        if not response or response.get('status') != 'success':
+            print(f"Failed to list files: {response.get('message') if response else 'No response'}")
+            return [], None
+        
+        return response.get('files', []), response.get('next_cursor')
+    
+    def search(self, prefix=None, contains=None, owner=None, **filters):
+        """
+        Find files by name prefix, name substring and/or uploader IP
+        (plus any other list_files() filter)
+        
+        Returns:
+            List of matching files, oldest first
+        """
+        return self.list_files(prefix=prefix, contains=contains, owner=owner, **filters)
+
+    def watch(self, since=None, epoch=None):
+        """
+        Subscribe to object change events, yielding them as they arrive
+
+        Events are dicts with 'type' ('created', 'updated', 'deleted' or
+        'resync'), 'seq' and, except for resync, 'file' (a list entry). After
+        'resync' the listing must be fetched again. The subscription takes
+        over the connection, so use a FileClient of its own; closing the
+        generator disconnects. event_epoch/event_seq track the position, so
+        watch(client.event_seq, client.event_epoch) after a reconnect replays
+        the events that were missed.
+
+        Args:
+            since: Last seq already seen (None: only new events)
+            epoch: The epoch that since belongs to
+
+        Raises:
+            ConnectionError: The subscription could not be started or was lost
+        """
+        response = self.send_message({'command': 'subscribe', 'since': since, 'epoch': epoch})
+        if not response or response.get('status') != 'subscribed':
+            raise ConnectionError(response.get('message') if response else 'No response')
+
+        self.event_epoch = response['epoch']
+        self.event_seq = response['seq']
+        # Heartbeats arrive every 'heartbeat' seconds, so a longer silence means the server is gone
+        self.sock.settimeout(response['heartbeat'] * 3)
+        try:
+            if response.get('resync'):
+                yield {'type': 'resync', 'seq': self.event_seq}
+            while True:
+                frame = self.buffer.recv_message()
+                if frame is None:
+                    raise ConnectionError("Connection closed by server")
+                for event in frame.get('events', []):
+                    self.event_seq = event['seq']
+                    yield event
+        except OSError as e:
+            raise ConnectionError(f"Event stream lost: {e}")
+        finally:
+            self.disconnect()
+
+    def apply_event(self, event):
+        """
+        Apply a change event from watch() to gdrive_files (the last listing)
+
+        Returns:
+            False if the event was 'resync' and the listing must be fetched again
+        """
+        if event['type'] == 'resync':
+            return False
+        file_id = event['file']['id']
+        self.gdrive_files = [f for f in self.gdrive_files if f.get('id') != file_id]
+        if event['type'] != 'deleted':
+            self.gdrive_files.append(event['file'])
+        return True
+
+    def stat(self, gdrive_file_id):
+        """Metadata of one stored file (name, sizes, checksum, owner), or None"""
+        response = self.send_message({
+            'command': 'stat',
+            'gdrive_file_id': gdrive_file_id,
+            'trace': self.trace
+        })
+
+        if not response or response.get('status') != 'success':
+            print(f"Failed to stat file: {response.get('message') if response else 'No response'}")
+            return None
+
+        return response.get('file')
+
+    def sync_directory(self, local_dir, delete=False, parallel=4, dry_run=False, index_path=None):
+        """
+        Two-way sync of local_dir with the server (see sync.DirectorySync)
+        
+        Runs over a pool of parallel connections that shares this client's
+        TLS settings and encryption keys.
+        
+        Returns:
+            Dict with the counts of uploads, downloads and deletes, and the
+            paths or IDs that failed
+        """
+        from pool import ConnectionPool
+        from sync import DirectorySync
+        
+        pool = ConnectionPool(self.host, self.port, size=parallel, download_dir=self.download_dir,
+                              ssl_context=self.ssl_context, io_timeout=self.io_timeout, key_store=self.saved_keys,
+                              cache=self.cache)
+        pool.tls_session = self.save_session()
+        syncer = DirectorySync(pool, local_dir, index_path, delete, parallel)
+        try:
+            return syncer.run(dry_run)
+        finally:
+            syncer.close()
+            pool.close()
+    
+    def delete_file(self, gdrive_file_id):
+        """Delete a file from the server and forget its key"""
+        response = self.send_message({
+            'command': 'delete',
+            'gdrive_file_id': gdrive_file_id,
+            'trace': self.trace
+        })
+        
+        if not response or response.get('status') != 'success':
+            print(f"Failed to delete file: {response.get('message') if response else 'No response'}")
+            return False
+        
+        self.saved_keys.pop(gdrive_file_id, None)
+        self.show_trace(response)
+        return True
+    
+    def get_stats(self):
+        """Fetch server metrics via the stats command"""
+        response = self.send_message({
+            'command': 'stats'
+        })
+        
+        if not response or response.get('status') != 'success':
+            print(f"Failed to get stats: {response.get('message') if response else 'No response'}")
+            return None
+        
+        return response.get('stats')
+
+    def profile(self, action, token, include_stacks=False):
+        """
+        Control the server's sampling profiler (admin command)
+
+        Args:
+            action: 'start', 'stop' or 'status'
+            token: Admin token configured on the server
+            include_stacks: With 'stop', also return the collapsed stacks
+
+        Returns:
+            Server response dict, or None on failure
+        """
+        response = self.send_message({
+            'command': 'profile',
+            'action': action,
+            'token': token,
+            'include_stacks': include_stacks
+        })
+
+        if not response or response.get('status') != 'success':
+            print(f"Profile {action} failed: {response.get('message') if response else 'No response'}")
+            return None
+
+        return response
+
     def save_keys_to_file(self, file_path='file_keys.json'):
-        """Save encryption keys to a file"""
+        """Export encryption keys to a JSON file"""
         try:
-            with open(file_path, 'w') as f:
-                json.dump(self.saved_keys, f, indent=2)
+            self.saved_keys.export_json(file_path)
             print(f"Saved encryption keys to {file_path}")
             return True
         except Exception as e:
@@ -375,11 +939,10 @@ class FileClient:
             return False
     
     def load_keys_from_file(self, file_path='file_keys.json'):
-        """Load encryption keys from a file"""
+        """Import encryption keys from a JSON file into the key store"""
         try:
             if os.path.exists(file_path):
-                with open(file_path, 'r') as f:
-                    self.saved_keys = json.load(f)
+                self.saved_keys.import_json(file_path)
                 print(f"Loaded encryption keys from {file_path}")
                 return True
             else:
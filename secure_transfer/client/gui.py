@@ -1,77 +1,111 @@
 import sys
 import os
+import queue
+import socket
 import threading
 from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QPushButton, QLabel, QLineEdit, 
-                            QTextEdit, QFileDialog, QListWidget, QListWidgetItem,
-                            QMessageBox, QTabWidget, QGridLayout, QGroupBox,
-                            QFormLayout, QComboBox, QCheckBox, QProgressBar,
-                            QSplitter, QFrame)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize
-from PyQt5.QtGui import QIcon, QFont, QColor
+                            QTextEdit, QFileDialog, QMessageBox, QTabWidget, QGroupBox,
+                            QTableView, QHeaderView, QAbstractItemView, QSpinBox)
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
 
 # Add parent directory to path to import modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from client import FileClient
-from server.encryption import FileEncryptor
+from models import FileTableModel, KeyTableModel, TransferTableModel, ProgressDelegate
+from pool import ConnectionPool
+from transfers import TransferQueue, DONE, FAILED, CANCELLED, PAUSED
 
-class UploadWorker(QThread):
-    """Worker thread for uploading files"""
-    progress_signal = pyqtSignal(str)
-    finished_signal = pyqtSignal(bool, str)
+class ListPageWorker(QThread):
+    """
+    Worker thread that fetches pages of the file listing for FileTableModel
     
-    def __init__(self, client, file_path):
-        super().__init__()
-        self.client = client
-        self.file_path = file_path
-    
-    def run(self):
-        self.progress_signal.emit(f"Uploading {os.path.basename(self.file_path)}...")
-        success = self.client.upload_file(self.file_path)
-        
-        if success:
-            self.finished_signal.emit(True, f"Successfully uploaded {os.path.basename(self.file_path)}")
-        else:
-            self.finished_signal.emit(False, f"Failed to upload {os.path.basename(self.file_path)}")
-
-class DownloadWorker(QThread):
-    """Worker thread for downloading files"""
-    progress_signal = pyqtSignal(str)
-    finished_signal = pyqtSignal(bool, str)
+    Requests are queued; when several are waiting only the newest is
+    fetched, since typing in the filter box makes the older ones stale.
+    """
+    page_signal = pyqtSignal(int, list, object)
     
-    def __init__(self, client, file_id, filename):
+    def __init__(self, client):
         super().__init__()
-        self.client = client
-        self.file_id = file_id
-        self.filename = filename
+        # Own connection, so listing never interleaves with a transfer on the main client
+        self.fetcher = FileClient(client.host, client.port, download_dir=client.download_dir,
+                                  ssl_context=client.ssl_context, key_store=client.saved_keys, cache=None)
+        self.requests = queue.Queue()
+    
+    def request(self, generation, options, cursor):
+        self.requests.put((generation, options, cursor))
     
     def run(self):
-        self.progress_signal.emit(f"Downloading {self.filename}...")
-        success = self.client.download_file(self.file_id, output_path=os.path.join(self.client.download_dir, self.filename))
-        
-        if success:
-            self.finished_signal.emit(True, f"Successfully downloaded {self.filename}")
-        else:
-            self.finished_signal.emit(False, f"Failed to download {self.filename}")
+        while True:
+            request = self.requests.get()
+            while request is not None and not self.requests.empty():
+                request = self.requests.get()
+            if request is None:
+                break
+            generation, options, cursor = request
+            files, next_cursor = self.fetcher.list_page(cursor=cursor, **options)
+            self.page_signal.emit(generation, files, next_cursor)
+        self.fetcher.disconnect()
+    
+    def stop(self):
+        self.requests.put(None)
 
-class ListFilesWorker(QThread):
-    """Worker thread for listing files"""
-    finished_signal = pyqtSignal(list)
+class EventWorker(QThread):
+    """
+    Worker thread that keeps a subscribe connection open and forwards
+    the server's file change events, reconnecting (and resuming from the
+    last event seen) when the connection drops
+    """
+    event_signal = pyqtSignal(dict)
     
     def __init__(self, client):
         super().__init__()
-        self.client = client
+        # The subscription takes over its connection, so it gets its own client
+        self.watcher = FileClient(client.host, client.port, download_dir=client.download_dir,
+                                  ssl_context=client.ssl_context, key_store=client.saved_keys, cache=None)
+        self.stopped = threading.Event()
     
     def run(self):
-        files = self.client.list_files()
-        self.finished_signal.emit(files)
+        delay = 1
+        while not self.stopped.is_set():
+            try:
+                for event in self.watcher.watch(self.watcher.event_seq, self.watcher.event_epoch):
+                    delay = 1
+                    self.event_signal.emit(event)
+            except ConnectionError:
+                pass
+            self.stopped.wait(delay)
+            delay = min(delay * 2, 30)
+    
+    def stop(self):
+        self.stopped.set()
+        # Unblocks the receive in run(); the watch generator then disconnects
+        sock = self.watcher.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
 
 class MainWindow(QMainWindow):
+    # Transfer state changes, moved from queue threads to the UI thread
+    transfer_changed = pyqtSignal(object, str)
+    
     def __init__(self):
         super().__init__()
         
         self.client = FileClient()
+        self.event_worker = None
+        # Stopped event workers still finishing a connection attempt (kept alive until they exit)
+        self.stopping_workers = []
+        self.list_worker = None
+        # Server listing, paged in as the table scrolls
+        self.file_model = FileTableModel()
+        # Transfers run on pooled connections, created on connect
+        self.pool = None
+        self.transfer_queue = None
+        self.transfer_model = None
         
         self.setWindowTitle("Secure File Transfer")
         self.setMinimumSize(800, 600)
@@ -111,7 +145,7 @@ class MainWindow(QMainWindow):
         
         upload_file_layout = QHBoxLayout()
         self.upload_path_input = QLineEdit()
-        self.upload_path_input.setPlaceholderText("Select a file to upload")
+        self.upload_path_input.setPlaceholderText("Select files to upload")
         self.upload_browse_button = QPushButton("Browse")
         self.upload_button = QPushButton("Upload")
         self.upload_button.setEnabled(False)
@@ -133,12 +167,31 @@ class MainWindow(QMainWindow):
         download_widget = QWidget()
         download_layout = QVBoxLayout(download_widget)
         
+        refresh_layout = QHBoxLayout()
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("Filter by name (e.g. report or *.pdf)")
         self.refresh_button = QPushButton("Refresh File List")
-        download_layout.addWidget(self.refresh_button)
-        
-        self.file_list = QListWidget()
+        refresh_layout.addWidget(self.filter_input)
+        refresh_layout.addWidget(self.refresh_button)
+        download_layout.addLayout(refresh_layout)
+        
+        # Filter as the user types, once typing pauses
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(300)
+        
+        self.file_view = QTableView()
+        self.file_view.setModel(self.file_model)
+        self.file_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.file_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.file_view.verticalHeader().hide()
+        self.file_view.verticalHeader().setDefaultSectionSize(22)
+        self.file_view.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        # Clicking a header re-sorts on the server; start oldest first like the server default
+        self.file_view.horizontalHeader().setSortIndicator(2, Qt.AscendingOrder)
+        self.file_view.setSortingEnabled(True)
         download_layout.addWidget(QLabel("Available Files:"))
-        download_layout.addWidget(self.file_list)
+        download_layout.addWidget(self.file_view)
         
         self.download_button = QPushButton("Download Selected")
         self.download_button.setEnabled(False)
@@ -151,6 +204,41 @@ class MainWindow(QMainWindow):
         
         self.tabs.addTab(download_widget, "Download")
         
+        # Create transfers tab
+        transfers_widget = QWidget()
+        transfers_layout = QVBoxLayout(transfers_widget)
+        
+        transfer_actions_layout = QHBoxLayout()
+        self.pause_button = QPushButton("Pause")
+        self.resume_button = QPushButton("Resume")
+        self.cancel_button = QPushButton("Cancel")
+        self.retry_button = QPushButton("Retry")
+        self.clear_transfers_button = QPushButton("Clear Finished")
+        self.parallel_input = QSpinBox()
+        self.parallel_input.setRange(1, 16)
+        self.parallel_input.setValue(3)
+        for button in (self.pause_button, self.resume_button, self.cancel_button,
+                       self.retry_button, self.clear_transfers_button):
+            transfer_actions_layout.addWidget(button)
+        transfer_actions_layout.addStretch()
+        transfer_actions_layout.addWidget(QLabel("Parallel transfers:"))
+        transfer_actions_layout.addWidget(self.parallel_input)
+        transfers_layout.addLayout(transfer_actions_layout)
+        
+        self.transfer_view = QTableView()
+        self.transfer_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.transfer_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.transfer_view.verticalHeader().hide()
+        self.transfer_view.verticalHeader().setDefaultSectionSize(22)
+        self.transfer_view.setItemDelegateForColumn(TransferTableModel.PROGRESS_COLUMN, ProgressDelegate(self))
+        transfers_layout.addWidget(self.transfer_view)
+        
+        self.tabs.addTab(transfers_widget, "Transfers")
+        
+        # Progress is sampled on a timer rather than signalled per chunk
+        self.transfer_timer = QTimer(self)
+        self.transfer_timer.setInterval(250)
+        
         # Create encryption keys tab
         keys_widget = QWidget()
         keys_layout = QVBoxLayout(keys_widget)
@@ -164,10 +252,20 @@ class MainWindow(QMainWindow):
         
         keys_layout.addLayout(keys_actions_layout)
         
-        self.keys_text = QTextEdit()
-        self.keys_text.setReadOnly(True)
+        self.key_filter_input = QLineEdit()
+        self.key_filter_input.setPlaceholderText("Filter by file ID or name")
+        keys_actions_layout.addWidget(self.key_filter_input)
+        
+        # Rows are read from the key store as they are painted
+        self.keys_model = KeyTableModel(self.client.saved_keys)
+        self.keys_view = QTableView()
+        self.keys_view.setModel(self.keys_model)
+        self.keys_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.keys_view.verticalHeader().hide()
+        self.keys_view.verticalHeader().setDefaultSectionSize(22)
+        self.keys_view.horizontalHeader().setSectionResizeMode(3, QHeaderView.Stretch)
         keys_layout.addWidget(QLabel("Saved Encryption Keys:"))
-        keys_layout.addWidget(self.keys_text)
+        keys_layout.addWidget(self.keys_view)
         
         self.tabs.addTab(keys_widget, "Encryption Keys")
         
@@ -185,11 +283,24 @@ class MainWindow(QMainWindow):
         self.upload_browse_button.clicked.connect(self.browse_upload_file)
         self.upload_button.clicked.connect(self.upload_file)
         self.refresh_button.clicked.connect(self.refresh_file_list)
-        self.file_list.itemClicked.connect(self.enable_download_button)
+        self.filter_input.textChanged.connect(self.filter_timer.start)
+        self.filter_input.returnPressed.connect(self.refresh_file_list)
+        self.filter_timer.timeout.connect(lambda: self.client.connected and self.refresh_file_list())
+        self.file_view.selectionModel().selectionChanged.connect(self.enable_download_button)
+        self.key_filter_input.textChanged.connect(self.keys_model.set_search)
         self.download_button.clicked.connect(self.download_file)
         self.save_keys_button.clicked.connect(self.save_keys)
         self.load_keys_button.clicked.connect(self.load_keys)
         self.upload_path_input.textChanged.connect(self.check_upload_path)
+        self.transfer_changed.connect(self.transfer_state_changed)
+        self.transfer_timer.timeout.connect(self.refresh_transfers)
+        self.pause_button.clicked.connect(lambda: self.transfer_action('pause'))
+        self.resume_button.clicked.connect(lambda: self.transfer_action('resume'))
+        self.cancel_button.clicked.connect(lambda: self.transfer_action('cancel'))
+        self.retry_button.clicked.connect(lambda: self.transfer_action('retry'))
+        self.clear_transfers_button.clicked.connect(self.clear_finished_transfers)
+        self.parallel_input.valueChanged.connect(
+            lambda value: self.transfer_queue and self.transfer_queue.set_parallel(value))
         
         # Initialize
         self.update_keys_display()
@@ -213,11 +324,27 @@ class MainWindow(QMainWindow):
                 self.connect_button.setText("Disconnect")
                 self.status_bar.showMessage(f"Connected to {host}:{port}")
                 
+                self.start_transfer_queue()
+                
+                self.list_worker = ListPageWorker(self.client)
+                self.file_model.fetch_requested.connect(self.list_worker.request)
+                self.list_worker.page_signal.connect(self.file_model.add_page)
+                self.list_worker.start()
+                
+                # Subscribe before listing, so no change falls between the two
+                self.event_worker = EventWorker(self.client)
+                self.event_worker.event_signal.connect(self.apply_file_event)
+                self.event_worker.start()
+                
                 # Load the file list
                 self.refresh_file_list()
             else:
                 QMessageBox.warning(self, "Connection Failed", f"Failed to connect to {host}:{port}")
         else:
+            self.stop_event_worker()
+            self.stop_list_worker()
+            self.stop_transfer_queue()
+            self.file_model.clear()
             self.client.disconnect()
             self.connect_status.setText("Not Connected")
             self.connect_status.setStyleSheet("color: red")
@@ -225,137 +352,170 @@ class MainWindow(QMainWindow):
             self.status_bar.showMessage("Disconnected")
     
     def browse_upload_file(self):
-        """Open file dialog to select a file to upload"""
-        file_path, _ = QFileDialog.getOpenFileName(self, "Select File to Upload")
-        if file_path:
-            self.upload_path_input.setText(file_path)
+        """Open file dialog to select files to upload"""
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Select Files to Upload")
+        if file_paths:
+            self.upload_path_input.setText('; '.join(file_paths))
     
     def check_upload_path(self):
         """Enable or disable upload button based on path input"""
         self.upload_button.setEnabled(bool(self.upload_path_input.text().strip()))
     
     def upload_file(self):
-        """Upload the selected file to the server"""
+        """Queue the selected files for upload"""
         if not self.client.connected:
             QMessageBox.warning(self, "Not Connected", "Please connect to the server first.")
             return
         
-        file_path = self.upload_path_input.text().strip()
-        if not os.path.exists(file_path):
-            QMessageBox.warning(self, "File Not Found", f"The file {file_path} does not exist.")
+        file_paths = [path.strip() for path in self.upload_path_input.text().split(';') if path.strip()]
+        missing = [path for path in file_paths if not os.path.isfile(path)]
+        if missing:
+            QMessageBox.warning(self, "File Not Found", f"The file {missing[0]} does not exist.")
             return
         
-        # Create and start worker thread
-        self.upload_worker = UploadWorker(self.client, file_path)
-        self.upload_worker.progress_signal.connect(self.update_upload_log)
-        self.upload_worker.finished_signal.connect(self.upload_finished)
-        
-        # Disable upload button while uploading
-        self.upload_button.setEnabled(False)
-        self.upload_button.setText("Uploading...")
-        
-        # Start the worker thread
-        self.upload_worker.start()
+        for file_path in file_paths:
+            self.transfer_queue.add_upload(file_path)
+        self.update_upload_log(f"Queued {len(file_paths)} file(s) for upload")
+        self.upload_path_input.clear()
     
     def update_upload_log(self, message):
         """Update the upload log with a new message"""
         timestamp = datetime.now().strftime("%H:%M:%S")
         self.upload_log.append(f"[{timestamp}] {message}")
     
-    def upload_finished(self, success, message):
-        """Handle upload completion"""
-        self.update_upload_log(message)
-        
-        # Re-enable upload button
-        self.upload_button.setEnabled(True)
-        self.upload_button.setText("Upload")
-        
-        if success:
-            # Refresh file list
-            self.refresh_file_list()
-            # Update keys display
-            self.update_keys_display()
-    
     def refresh_file_list(self):
-        """Refresh the list of files from the server"""
+        """Reload the file list from the first page with the current filter"""
         if not self.client.connected:
             QMessageBox.warning(self, "Not Connected", "Please connect to the server first.")
             return
         
-        # Clear the list
-        self.file_list.clear()
-        
-        # Create and start worker thread
-        self.list_worker = ListFilesWorker(self.client)
-        self.list_worker.finished_signal.connect(self.update_file_list)
-        
-        # Update status
-        self.status_bar.showMessage("Refreshing file list...")
-        
-        # Start the worker thread
-        self.list_worker.start()
+        # Filtering and sorting are done by the server; the model keeps the sort
+        filters = {'sort': self.file_model.filters['sort']}
+        text = self.filter_input.text().strip()
+        if any(c in text for c in '*?['):
+            filters['glob'] = text
+        elif text:
+            filters['contains'] = text
+        self.download_button.setEnabled(False)
+        self.file_model.set_filters(filters)
     
-    def update_file_list(self, files):
-        """Update the file list with files from the server"""
-        for file_info in files:
-            file_id = file_info.get('id')
-            file_name = file_info.get('name')
-            created_time = file_info.get('createdTime', '')
-            
-            # Create item with file info
-            item = QListWidgetItem(f"{file_name} (ID: {file_id})")
-            item.setData(Qt.UserRole, file_id)  # Store file ID for download
-            item.setToolTip(f"Created: {created_time}")
-            
-            self.file_list.addItem(item)
-        
-        self.status_bar.showMessage(f"Found {len(files)} files")
+    def apply_file_event(self, event):
+        """Apply a created/updated/deleted event to the file list instead of listing again"""
+        if self.client.connected and not self.file_model.apply_event(event):
+            self.refresh_file_list()
+    
+    def stop_event_worker(self):
+        if self.event_worker is not None:
+            self.event_worker.stop()
+            if not self.event_worker.wait(2000):
+                self.stopping_workers.append(self.event_worker)
+            self.event_worker = None
+        self.stopping_workers = [w for w in self.stopping_workers if w.isRunning()]
+    
+    def stop_list_worker(self):
+        if self.list_worker is not None:
+            self.file_model.fetch_requested.disconnect(self.list_worker.request)
+            self.list_worker.stop()
+            if not self.list_worker.wait(2000):
+                self.stopping_workers.append(self.list_worker)
+            self.list_worker = None
     
-    def enable_download_button(self, item):
+    def closeEvent(self, event):
+        self.stop_event_worker()
+        self.stop_list_worker()
+        self.stop_transfer_queue()
+        super().closeEvent(event)
+    
+    def enable_download_button(self):
         """Enable the download button when a file is selected"""
-        self.download_button.setEnabled(True)
+        self.download_button.setEnabled(self.file_view.selectionModel().hasSelection())
     
     def download_file(self):
-        """Download the selected file from the server"""
+        """Queue the selected files for download"""
         if not self.client.connected:
             QMessageBox.warning(self, "Not Connected", "Please connect to the server first.")
             return
         
-        selected_items = self.file_list.selectedItems()
-        if not selected_items:
-            return
-        
-        selected_item = selected_items[0]
-        file_id = selected_item.data(Qt.UserRole)
-        filename = selected_item.text().split(" (ID:")[0]
-        
-        # Get the original filename without the .enc extension if present
-        original_filename = filename[:-4] if filename.endswith('.enc') else filename
-        
-        # Create and start worker thread
-        self.download_worker = DownloadWorker(self.client, file_id, original_filename)
-        self.download_worker.progress_signal.connect(self.update_download_log)
-        self.download_worker.finished_signal.connect(self.download_finished)
-        
-        # Disable download button while downloading
-        self.download_button.setEnabled(False)
-        self.download_button.setText("Downloading...")
-        
-        # Start the worker thread
-        self.download_worker.start()
+        selected_rows = self.file_view.selectionModel().selectedRows()
+        for index in sorted(selected_rows, key=lambda index: index.row()):
+            file_info = self.file_model.file_at(index.row())
+            file_id = file_info['id']
+            filename = file_info.get('name') or file_id
+            
+            # Get the original filename without the .enc extension if present
+            original_filename = filename[:-4] if filename.endswith('.enc') else filename
+            self.transfer_queue.add_download(file_id, original_filename, file_info.get('size'))
+        if selected_rows:
+            self.update_download_log(f"Queued {len(selected_rows)} file(s) for download")
     
     def update_download_log(self, message):
         """Update the download log with a new message"""
         timestamp = datetime.now().strftime("%H:%M:%S")
         self.download_log.append(f"[{timestamp}] {message}")
     
-    def download_finished(self, success, message):
-        """Handle download completion"""
-        self.update_download_log(message)
-        
-        # Re-enable download button
-        self.download_button.setEnabled(True)
-        self.download_button.setText("Download Selected")
+    def start_transfer_queue(self):
+        """Create the connection pool and transfer queue for a new connection"""
+        self.pool = ConnectionPool(self.client.host, self.client.port, size=self.parallel_input.maximum(),
+                                   download_dir=self.client.download_dir, ssl_context=self.client.ssl_context,
+                                   key_store=self.client.saved_keys, cache=self.client.cache)
+        # on_change runs on queue threads; the signal hands it to the UI thread
+        self.transfer_queue = TransferQueue(self.pool, self.parallel_input.value(), self.transfer_changed.emit)
+        self.transfer_model = TransferTableModel(self.transfer_queue)
+        self.transfer_view.setModel(self.transfer_model)
+        self.transfer_view.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+    
+    def stop_transfer_queue(self):
+        """Cancel unfinished transfers and close the pool"""
+        if self.transfer_queue is not None:
+            self.transfer_queue.cancel_all()
+            self.pool.close()
+            self.transfer_timer.stop()
+            self.transfer_queue = self.pool = None
+    
+    def transfer_state_changed(self, transfer, state):
+        """Show a transfer's new state and log it when it finishes"""
+        if self.transfer_model is None or transfer not in self.transfer_model.queue.transfers:
+            return
+        self.transfer_model.update(transfer)
+        if self.transfer_model.active():
+            self.transfer_timer.start()
+        
+        log = self.update_upload_log if transfer.kind == 'upload' else self.update_download_log
+        if state == DONE:
+            log(f"Successfully {transfer.kind}ed {transfer.name}")
+            if transfer.kind == 'upload':
+                # The new file arrives as a change event; poll only without a subscription
+                if self.event_worker is None and self.client.connected:
+                    self.refresh_file_list()
+                # Update keys display
+                self.update_keys_display()
+        elif state == FAILED:
+            log(f"Failed to {transfer.kind} {transfer.name}: {transfer.message}")
+        elif state == CANCELLED:
+            log(f"Cancelled {transfer.kind} of {transfer.name}")
+        elif state == PAUSED:
+            log(f"Paused {transfer.kind} of {transfer.name}")
+    
+    def refresh_transfers(self):
+        """Repaint the progress of running transfers (every 250 ms while any are active)"""
+        if self.transfer_model is None:
+            return
+        self.transfer_model.refresh()
+        if not self.transfer_model.active():
+            self.transfer_timer.stop()
+    
+    def transfer_action(self, action):
+        """Pause, resume, cancel or retry the selected transfers"""
+        if self.transfer_queue is None:
+            return
+        for index in self.transfer_view.selectionModel().selectedRows():
+            transfer = self.transfer_model.transfer_at(index.row())
+            if transfer is not None:
+                getattr(self.transfer_queue, action)(transfer)
+    
+    def clear_finished_transfers(self):
+        if self.transfer_queue is not None:
+            self.transfer_model.remove(self.transfer_queue.clear_finished())
     
     def save_keys(self):
         """Save encryption keys to a file"""
@@ -380,16 +540,7 @@ class MainWindow(QMainWindow):
     
     def update_keys_display(self):
         """Update the display of saved encryption keys"""
-        self.keys_text.clear()
-        
-        if not self.client.saved_keys:
-            self.keys_text.setText("No encryption keys saved")
-            return
-        
-        for file_id, key in self.client.saved_keys.items():
-            self.keys_text.append(f"File ID: {file_id}")
-            self.keys_text.append(f"Key: {key}")
-            self.keys_text.append("")
+        self.keys_model.reload()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
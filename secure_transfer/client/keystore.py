@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+
+
+class KeyStore(MutableMapping):
+    """
+    Persistent store of encryption keys and file metadata, by file ID
+
+    Backed by SQLite in WAL mode: every upload's key is committed as its own
+    small transaction, so a crash loses at most the upload in progress, and
+    lookups go through the primary key index instead of parsing a JSON file.
+    Besides the key, each entry keeps the checksum (and its algorithm), size
+    and name of the uploaded file.
+
+    Behaves as a dict of file ID -> hex key, so code written against the
+    old saved_keys dict keeps working; use put() and info() for metadata.
+
+    Args:
+        path: Database file, or ':memory:' for a store that is not saved
+        legacy_json: file_keys.json to import the first time the store is opened
+    """
+    def __init__(self, path='file_keys.db', legacy_json=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        if path != ':memory:':
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.execute('''CREATE TABLE IF NOT EXISTS keys (
+                file_id TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                checksum TEXT,
+                checksum_algorithm TEXT,
+                size INTEGER,
+                name TEXT,
+                created REAL
+            )''')
+            self.db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+        if legacy_json and os.path.exists(legacy_json) and not self._meta('migrated_from'):
+            count = self.import_json(legacy_json)
+            self._set_meta('migrated_from', os.path.abspath(legacy_json))
+            print(f"Migrated {count} encryption keys from {legacy_json} to {path}")
+
+    @classmethod
+    def open(cls, store):
+        """
+        Return store if it is already a KeyStore, else open the path (None: in memory)
+
+        A file_keys.json next to the database is imported on first use.
+        """
+        if isinstance(store, KeyStore):
+            return store
+        if not store or store == ':memory:':
+            return cls(':memory:')
+        return cls(store, legacy_json=os.path.join(os.path.dirname(os.path.abspath(store)), 'file_keys.json'))
+
+    def _meta(self, name):
+        with self.lock:
+            row = self.db.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (name, value))
+
+    def put(self, file_id, key, checksum=None, checksum_algorithm=None, size=None, name=None):
+        """Record the key and metadata of an uploaded file"""
+        self.put_many([(file_id, key, checksum, checksum_algorithm, size, name)])
+
+    def put_many(self, entries):
+        """Record many (file_id, key, checksum, checksum_algorithm, size, name) in one transaction"""
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO keys VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                [tuple(entry) + (now,) for entry in entries])
+
+    def info(self, file_id):
+        """All stored fields for file_id as a dict, or None"""
+        with self.lock:
+            row = self.db.execute('SELECT file_id, key, checksum, checksum_algorithm, size, name, created '
+                                  'FROM keys WHERE file_id = ?', (file_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('file_id', 'key', 'checksum', 'checksum_algorithm', 'size', 'name', 'created'), row))
+
+    def count(self, search=None):
+        """Number of entries, or of those whose file ID or name contains search"""
+        where, params = self._search(search)
+        with self.lock:
+            return self.db.execute(f'SELECT COUNT(*) FROM keys{where}', params).fetchone()[0]
+
+    def page(self, offset, limit, search=None):
+        """
+        Entries offset..offset+limit in insertion order, as info() dicts
+
+        For views that read the store a block at a time instead of loading it all.
+        """
+        where, params = self._search(search)
+        with self.lock:
+            rows = self.db.execute('SELECT file_id, key, checksum, checksum_algorithm, size, name, created '
+                                   f'FROM keys{where} ORDER BY rowid LIMIT ? OFFSET ?',
+                                   params + [limit, offset]).fetchall()
+        return [dict(zip(('file_id', 'key', 'checksum', 'checksum_algorithm', 'size', 'name', 'created'), row))
+                for row in rows]
+
+    @staticmethod
+    def _search(search):
+        if not search:
+            return '', []
+        pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return " WHERE file_id LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\'", [pattern, pattern]
+
+    def import_json(self, path):
+        """
+        Merge keys from a file_keys.json export
+
+        Returns:
+            Number of keys imported
+        """
+        with open(path) as f:
+            data = json.load(f)
+        entries = [(file_id, key, None, None, None, None) for file_id, key in data.items()
+                   if isinstance(key, str)]
+        self.put_many(entries)
+        return len(entries)
+
+    def export_json(self, path):
+        """Write file ID -> key as JSON (the file_keys.json format)"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(self.items()), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def __getitem__(self, file_id):
+        with self.lock:
+            row = self.db.execute('SELECT key FROM keys WHERE file_id = ?', (file_id,)).fetchone()
+        if row is None:
+            raise KeyError(file_id)
+        return row[0]
+
+    def __setitem__(self, file_id, key):
+        self.put(file_id, key)
+
+    def __delitem__(self, file_id):
+        with self.lock, self.db:
+            deleted = self.db.execute('DELETE FROM keys WHERE file_id = ?', (file_id,)).rowcount
+        if not deleted:
+            raise KeyError(file_id)
+
+    def __iter__(self):
+        with self.lock:
+            file_ids = [row[0] for row in self.db.execute('SELECT file_id FROM keys ORDER BY rowid')]
+        return iter(file_ids)
+
+    def items(self):
+        with self.lock:
+            return self.db.execute('SELECT file_id, key FROM keys ORDER BY rowid').fetchall()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM keys').fetchone()[0]
+
+    def update(self, other=(), **kwargs):
+        entries = dict(other, **kwargs)
+        self.put_many([(file_id, key, None, None, None, None) for file_id, key in entries.items()])
+
+    def close(self):
+        with self.lock:
+            self.db.close()
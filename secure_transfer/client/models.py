@@ -0,0 +1,399 @@
+import fnmatch
+from collections import OrderedDict
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QStyle, QStyledItemDelegate, QStyleOptionProgressBar
+
+from transfers import RUNNING, QUEUED
+
+
+def format_size(size):
+    if size is None or size == '':
+        return ''
+    size = float(size)
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return ''
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class FileTableModel(QAbstractTableModel):
+    """
+    Server file listing, loaded a page at a time as the view scrolls
+
+    Filtering and sorting are done by the server (list with a keyset
+    cursor), so the model only holds the rows fetched so far and changing
+    the filter or sort costs one page, not a full listing. Pages are
+    requested through fetch_requested and fetched on a worker thread;
+    add_page() appends them. Change events (see FileClient.watch()) are
+    applied in place with apply_event().
+
+    Because pages are keyset-paged, an event for a file that sorts after
+    the last loaded row can be ignored: the next page will include it.
+    """
+    # (generation, list filters, cursor); answered with add_page()
+    fetch_requested = pyqtSignal(int, dict, object)
+
+    COLUMNS = (('name', 'Name'), ('size', 'Size'), ('createdTime', 'Created'), ('id', 'ID'))
+    # Server sort key for each sortable column
+    SORTS = {'name': 'name', 'size': 'size', 'createdTime': 'created'}
+    FIELDS = ['id', 'name', 'size', 'createdTime']
+
+    def __init__(self, page_size=500, parent=None):
+        super().__init__(parent)
+        self.page_size = page_size
+        self.filters = {'sort': 'created'}
+        self.rows = []
+        self.keys = []
+        self.row_of = {}
+        self.generation = 0
+        self.cursor = None
+        self.more = False
+        self.loading = False
+        # Events that arrive while a page is in flight, applied once it lands
+        self.pending_events = []
+
+    # Qt model interface
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section][1]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        file_info = self.rows[index.row()]
+        field = self.COLUMNS[index.column()][0]
+        if role == Qt.DisplayRole:
+            if field == 'size':
+                return format_size(file_info.get('size'))
+            if field == 'createdTime':
+                return file_info.get('createdTime', '')[:19].replace('T', ' ')
+            return file_info.get(field, '')
+        if role == Qt.TextAlignmentRole and field == 'size':
+            return Qt.AlignRight | Qt.AlignVCenter
+        if role == Qt.ToolTipRole:
+            return f"{file_info.get('name')}\nID: {file_info.get('id')}\nCreated: {file_info.get('createdTime', '')}"
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self.more or self.loading:
+            return
+        self.loading = True
+        self.fetch_requested.emit(self.generation, dict(self.filters, fields=self.FIELDS, limit=self.page_size), self.cursor)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        sort = self.SORTS.get(self.COLUMNS[column][0])
+        if sort is None:
+            return
+        self.set_filters(dict(self.filters, sort=sort if order == Qt.AscendingOrder else '-' + sort))
+
+    # Loading
+
+    def set_filters(self, filters):
+        """Start over with new list filters (glob/contains/sort); the first page is requested at once"""
+        self.beginResetModel()
+        self.filters = dict(filters)
+        self.filters.setdefault('sort', 'created')
+        self.generation += 1
+        self.rows, self.keys, self.row_of = [], [], {}
+        self.cursor = None
+        self.more = True
+        self.loading = False
+        self.pending_events = []
+        self.endResetModel()
+        self.fetchMore()
+
+    def clear(self):
+        """Drop all rows and stop paging (e.g. on disconnect)"""
+        self.beginResetModel()
+        self.generation += 1
+        self.rows, self.keys, self.row_of = [], [], {}
+        self.more = self.loading = False
+        self.pending_events = []
+        self.endResetModel()
+
+    def add_page(self, generation, files, next_cursor):
+        """Append a fetched page; pages for an older filter are ignored"""
+        if generation != self.generation:
+            return
+        if files:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(files) - 1)
+            for file_info in files:
+                self.row_of[file_info['id']] = len(self.rows)
+                self.rows.append(file_info)
+                self.keys.append(self.sort_key(file_info))
+            self.endInsertRows()
+        self.cursor = next_cursor
+        self.more = bool(next_cursor)
+        self.loading = False
+
+        events, self.pending_events = self.pending_events, []
+        for event in events:
+            self.apply_event(event)
+
+    # Change events
+
+    def sort_key(self, file_info):
+        """Key ordering rows like the server's sort ('-' sorts use it in reverse)"""
+        sort = self.filters['sort'].lstrip('-')
+        if sort == 'name':
+            return (file_info.get('name') or '', file_info.get('id'))
+        if sort == 'size':
+            return (int(file_info.get('size') or 0), file_info.get('id'))
+        return (file_info.get('createdTime', ''), file_info.get('id'))
+
+    def matches(self, file_info):
+        """Whether a file passes the current name filter, as the server applies it"""
+        name = file_info.get('name') or ''
+        if 'glob' in self.filters:
+            return fnmatch.fnmatchcase(name, self.filters['glob'])
+        if 'contains' in self.filters:
+            return self.filters['contains'].lower() in name.lower()
+        return True
+
+    def apply_event(self, event):
+        """
+        Apply a change event from FileClient.watch()
+
+        Returns:
+            False for 'resync' (the caller should call set_filters again)
+        """
+        if event['type'] == 'resync':
+            return False
+        if self.loading:
+            self.pending_events.append(event)
+            return True
+
+        file_info = event['file']
+        row = self.row_of.get(file_info['id'])
+        if row is not None:
+            self.remove_row(row)
+        if event['type'] == 'deleted' or not self.matches(file_info):
+            return True
+
+        # Binary search for the row that keeps the server's order
+        key = self.sort_key(file_info)
+        descending = self.filters['sort'].startswith('-')
+        row, hi = 0, len(self.keys)
+        while row < hi:
+            mid = (row + hi) // 2
+            if (self.keys[mid] >= key) if descending else (self.keys[mid] <= key):
+                row = mid + 1
+            else:
+                hi = mid
+        # Past the last loaded row: the next page will bring it
+        if row == len(self.rows) and self.more:
+            return True
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.rows.insert(row, file_info)
+        self.keys.insert(row, key)
+        self.reindex(row)
+        self.endInsertRows()
+        return True
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.row_of[self.rows[row]['id']]
+        del self.rows[row]
+        del self.keys[row]
+        self.reindex(row)
+        self.endRemoveRows()
+
+    def reindex(self, start):
+        for i in range(start, len(self.rows)):
+            self.row_of[self.rows[i]['id']] = i
+
+    def file_at(self, row):
+        return self.rows[row] if 0 <= row < len(self.rows) else None
+
+
+class KeyTableModel(QAbstractTableModel):
+    """
+    Read-only view of a KeyStore that loads rows on demand
+
+    Only the row count is queried up front; rows are read from SQLite in
+    blocks of block_size as the view paints them, and at most max_blocks
+    blocks are cached, so 100k+ keys cost a few blocks of memory and the
+    view never waits for more than one small query.
+    """
+    COLUMNS = (('file_id', 'File ID'), ('name', 'Name'), ('size', 'Size'), ('key', 'Key'))
+
+    def __init__(self, store, block_size=500, max_blocks=20, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.search = None
+        self.blocks = OrderedDict()
+        self.total = store.count()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.total
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section][1]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        row = self.row(index.row())
+        if row is None:
+            return None
+        value = row[self.COLUMNS[index.column()][0]]
+        if self.COLUMNS[index.column()][0] == 'size':
+            return format_size(value)
+        return '' if value is None else str(value)
+
+    def row(self, number):
+        block_number, offset = divmod(number, self.block_size)
+        block = self.blocks.get(block_number)
+        if block is None:
+            block = self.store.page(block_number * self.block_size, self.block_size, self.search)
+            self.blocks[block_number] = block
+            if len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+        else:
+            self.blocks.move_to_end(block_number)
+        return block[offset] if offset < len(block) else None
+
+    def set_search(self, search):
+        """Show only keys whose file ID or name contains search"""
+        self.search = search or None
+        self.reload()
+
+    def reload(self):
+        """Re-read the count and drop cached rows (after uploads or a key import)"""
+        self.beginResetModel()
+        self.blocks.clear()
+        self.total = self.store.count(self.search)
+        self.endResetModel()
+
+
+class TransferTableModel(QAbstractTableModel):
+    """
+    Rows of a TransferQueue with their progress, speed and ETA
+
+    The model reads the queue's Transfer objects directly. Nothing is
+    signalled per chunk: refresh() is called on a timer and repaints only
+    the rows of transfers that are running, so the UI cost of progress is
+    bounded by the timer rate however fast the transfers go.
+    """
+    COLUMNS = ('Name', 'Type', 'Size', 'Progress', 'Speed', 'ETA', 'Status')
+    PROGRESS_COLUMN = 3
+
+    def __init__(self, queue, parent=None):
+        super().__init__(parent)
+        self.queue = queue
+        self.rows = []
+        self.row_of = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        transfer = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return transfer.name
+            if column == 1:
+                return transfer.kind.capitalize()
+            if column == 2:
+                return format_size(transfer.size)
+            if column == self.PROGRESS_COLUMN:
+                return int(transfer.fraction() * 100)
+            if column == 4:
+                return f"{transfer.rate / (1024 * 1024):.1f} MB/s" if transfer.state == RUNNING else ''
+            if column == 5:
+                return format_duration(transfer.eta())
+            if column == 6:
+                return f"{transfer.state}: {transfer.message}" if transfer.message else transfer.state
+        if role == Qt.TextAlignmentRole and column in (2, 4, 5):
+            return Qt.AlignRight | Qt.AlignVCenter
+        if role == Qt.ToolTipRole:
+            return transfer.message or transfer.output_path or transfer.source
+        return None
+
+    def transfer_at(self, row):
+        return self.rows[row] if 0 <= row < len(self.rows) else None
+
+    def update(self, transfer):
+        """Show a transfer's new state, adding a row for a new transfer"""
+        row = self.row_of.get(transfer.id)
+        if row is None:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows))
+            self.row_of[transfer.id] = len(self.rows)
+            self.rows.append(transfer)
+            self.endInsertRows()
+        else:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1))
+
+    def refresh(self):
+        """Repaint the progress of running transfers"""
+        for transfer in self.queue.sample():
+            row = self.row_of.get(transfer.id)
+            if row is not None:
+                self.dataChanged.emit(self.index(row, self.PROGRESS_COLUMN), self.index(row, 5))
+
+    def remove(self, transfers):
+        ids = {transfer.id for transfer in transfers}
+        if not ids:
+            return
+        self.beginResetModel()
+        self.rows = [transfer for transfer in self.rows if transfer.id not in ids]
+        self.row_of = {transfer.id: row for row, transfer in enumerate(self.rows)}
+        self.endResetModel()
+
+    def active(self):
+        return any(transfer.state in (RUNNING, QUEUED) for transfer in self.rows)
+
+
+class ProgressDelegate(QStyledItemDelegate):
+    """Paints an integer percentage as a progress bar"""
+    def paint(self, painter, option, index):
+        value = index.data(Qt.DisplayRole)
+        if not isinstance(value, int):
+            return super().paint(painter, option, index)
+        bar = QStyleOptionProgressBar()
+        bar.rect = option.rect.adjusted(2, 3, -2, -3)
+        bar.minimum = 0
+        bar.maximum = 100
+        bar.progress = value
+        bar.text = f"{value}%"
+        bar.textVisible = True
+        QApplication.style().drawControl(QStyle.CE_ProgressBar, bar, painter)
@@ -0,0 +1,146 @@
+import threading
+from contextlib import contextmanager
+
+from client import FileClient
+from keystore import KeyStore
+from cache import ContentCache
+
+
+class ConnectionPool:
+    """
+    Pool of connected FileClients for concurrent operations
+
+    All clients share one SSL context and the most recent TLS session, so
+    new connections resume the session instead of doing a full handshake,
+    and released connections stay open for the next operation. Encryption
+    keys are shared too: a file uploaded through one connection can be
+    downloaded through any other. So is the download cache (see cache.py).
+
+    Args:
+        host: Server host
+        port: Server port
+        size: Maximum number of connections
+        download_dir: Download directory for all clients
+        **client_args: Extra FileClient arguments (io_timeout, ciphers, key_store,
+            cache, ...), and cafile for the certificate to trust or an ssl_context to reuse
+    """
+    def __init__(self, host='localhost', port=5000, size=4, download_dir='downloads', **client_args):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.download_dir = download_dir
+        self.client_args = client_args
+        self.ssl_context = client_args.pop('ssl_context', None) or FileClient.create_ssl_context(
+            client_args.pop('ciphers', None), client_args.pop('tls_min_version', None),
+            client_args.pop('cafile', 'server.crt'))
+        # One key store for all clients (default: in memory)
+        self.saved_keys = KeyStore.open(client_args.pop('key_store', None))
+        # And one download cache
+        self.cache = ContentCache.open(client_args.pop('cache', True), download_dir)
+        self.tls_session = None
+        self.idle = []
+        self.created = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def _new_client(self):
+        return FileClient(self.host, self.port, download_dir=self.download_dir,
+                          ssl_context=self.ssl_context, key_store=self.saved_keys, cache=self.cache,
+                          **self.client_args)
+
+    def get(self, timeout=None):
+        """
+        Take a connected client from the pool, connecting a new one if allowed
+
+        Blocks while all size connections are in use.
+
+        Returns:
+            A connected FileClient, or None if connecting failed or timed out
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.closed or self.idle or self.created < self.size, timeout):
+                return None
+            if self.closed:
+                raise RuntimeError("Connection pool is closed")
+            if self.idle:
+                return self.idle.pop()
+            self.created += 1
+            session = self.tls_session
+
+        client = self._new_client()
+        client.tls_session = session
+        if not client.connect():
+            with self.cond:
+                self.created -= 1
+                self.cond.notify()
+            return None
+        return client
+
+    def put(self, client):
+        """Return a client to the pool; broken connections are dropped"""
+        session = client.save_session()
+        with self.cond:
+            if session is not None:
+                self.tls_session = session
+            if client.connected and not self.closed:
+                self.idle.append(client)
+            else:
+                client.disconnect()
+                self.created -= 1
+            self.cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Borrow a client for the duration of a with block
+
+        Example:
+            with pool.connection() as client:
+                client.upload_file(path)
+        """
+        client = self.get(timeout)
+        if client is None:
+            raise ConnectionError(f"No connection to {self.host}:{self.port} available")
+        try:
+            yield client
+        finally:
+            self.put(client)
+
+    def warm(self, count=None):
+        """Open connections ahead of time (default: up to the pool size)"""
+        count = self.size if count is None else min(count, self.size)
+        clients = []
+        for _ in range(count):
+            client = self.get(timeout=0)
+            if client is None:
+                break
+            clients.append(client)
+        for client in clients:
+            self.put(client)
+        return len(clients)
+
+    def stats(self):
+        """Connection and handshake counts for the pooled clients"""
+        with self.cond:
+            return {
+                'connections': self.created,
+                'idle': len(self.idle),
+                'size': self.size,
+                'tls_session': self.tls_session is not None
+            }
+
+    def close(self):
+        """Disconnect all idle clients; clients in use are closed when returned"""
+        with self.cond:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.created -= len(idle)
+            self.cond.notify_all()
+        for client in idle:
+            client.disconnect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
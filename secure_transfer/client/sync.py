@@ -0,0 +1,417 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Index file kept in the synced directory; never synced itself
+INDEX_NAME = '.sft_index.sqlite'
+# The client's download cache (see cache.ContentCache), also never synced
+CACHE_DIR = '.cache'
+
+# Files up to this size are transferred with the batch commands
+BATCH_FILE_SIZE = 1024 * 1024
+BATCH_SIZE = 100
+
+
+def remote_name(rel_path):
+    """
+    Server-side name for a file at rel_path in the synced directory
+
+    The server keeps a flat namespace, so directory separators are escaped
+    ('%' first, so the mapping can be reversed).
+    """
+    return rel_path.replace('%', '%25').replace('/', '%2F')
+
+
+def local_path(name):
+    """Inverse of remote_name for a name from the server listing"""
+    if name.endswith('.enc'):
+        name = name[:-4]
+    return name.replace('%2F', '/').replace('%25', '%')
+
+
+def safe_path(rel_path):
+    """
+    True if rel_path (from local_path) may be written in the synced directory
+
+    Names in the listing come from the server and other clients, so one
+    like '..%2F..%2F.bashrc' or '%2Fetc%2Fpasswd' must not turn into a path
+    outside the directory. The index and the download cache are refused
+    too, so a remote file can't overwrite them.
+    """
+    parts = rel_path.split('/')
+    if os.path.isabs(rel_path) or '\0' in rel_path or os.path.normpath(rel_path).startswith('..'):
+        return False
+    if any(part in ('', '.', '..') for part in parts):
+        return False
+    return parts[0] != CACHE_DIR and not parts[-1].startswith(INDEX_NAME)
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SyncIndex:
+    """
+    Local record of what the last sync left in place
+
+    One row per synced file: relative path, size, mtime (ns), SHA-256 of the
+    contents and the remote file ID. A file whose size and mtime still match
+    its row is known to be unchanged without reading it.
+
+    Args:
+        path: SQLite database file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            remote_id TEXT NOT NULL
+        )''')
+        self.db.commit()
+        self.pending = 0
+
+    def load(self):
+        """All rows as a dict of path -> (size, mtime_ns, sha256, remote_id)"""
+        with self.lock:
+            return {row[0]: row[1:] for row in self.db.execute(
+                'SELECT path, size, mtime_ns, sha256, remote_id FROM files')}
+
+    def put(self, path, size, mtime_ns, sha256, remote_id):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                            (path, size, mtime_ns, sha256, remote_id))
+            self._changed()
+
+    def remove(self, path):
+        with self.lock:
+            self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+            self._changed()
+
+    def _changed(self):
+        # Commit in groups: one transaction per file would dominate a large sync
+        self.pending += 1
+        if self.pending >= 500:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+
+class SyncPlan:
+    """
+    The operations needed to bring a directory and the server in line
+
+    uploads: (rel_path, remote IDs it replaces); downloads: (remote_id,
+    rel_path); remote_deletes: remote IDs; local_deletes and forget:
+    relative paths (forget only drops the index row).
+    """
+    def __init__(self):
+        self.uploads = []
+        self.downloads = []
+        self.remote_deletes = []
+        self.local_deletes = []
+        self.forget = []
+        self.refresh = []
+        self.unchanged = 0
+
+    def summary(self):
+        return {
+            'upload': len(self.uploads),
+            'download': len(self.downloads),
+            'delete_remote': len(self.remote_deletes),
+            'delete_local': len(self.local_deletes),
+            'unchanged': self.unchanged
+        }
+
+
+class DirectorySync:
+    """
+    Two-way sync of a local directory with the files on the server
+
+    Changes are found by comparing a scan of the directory and the server
+    listing against the index from the previous sync, so a sync with
+    nothing to do reads no file contents: only files whose size or mtime
+    moved are hashed, and a file that was touched but not modified is not
+    uploaded again. The resulting uploads, downloads and deletes run in
+    parallel over a ConnectionPool, with small files sent as batches.
+
+    Local changes win over remote ones. Deleting a file on one side deletes
+    it on the other only when delete is enabled; otherwise it is restored
+    from the side that still has it. Files are stored on the server under
+    their path relative to local_dir (see remote_name).
+
+    Args:
+        pool: ConnectionPool to the server
+        local_dir: Directory to sync
+        index_path: Index database (default: local_dir/.sft_index.sqlite)
+        delete: Propagate deletions instead of restoring deleted files
+        parallel: Concurrent transfers
+    """
+    def __init__(self, pool, local_dir, index_path=None, delete=False, parallel=4):
+        self.pool = pool
+        self.local_dir = os.path.realpath(local_dir)
+        self.index = SyncIndex(index_path or os.path.join(self.local_dir, INDEX_NAME))
+        self.delete = delete
+        self.parallel = parallel
+        self.lock = threading.Lock()
+        self.report = {}
+
+    def scan(self):
+        """Relative path -> (size, mtime_ns) for every regular file under local_dir"""
+        files = {}
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            with os.scandir(os.path.join(self.local_dir, rel_dir)) as entries:
+                for entry in entries:
+                    rel_path = rel_dir + entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if rel_path != CACHE_DIR:
+                            stack.append(rel_path + '/')
+                    elif entry.is_file(follow_symlinks=False) and not entry.name.startswith(INDEX_NAME):
+                        st = entry.stat(follow_symlinks=False)
+                        files[rel_path] = (st.st_size, st.st_mtime_ns)
+        return files
+
+    def plan(self, remote_files):
+        """
+        Work out the operations for this sync
+
+        Args:
+            remote_files: The server listing (FileClient.list_files())
+        """
+        plan = SyncPlan()
+        local = self.scan()
+        indexed = self.index.load()
+        remote_ids = {f['id'] for f in remote_files}
+        tracked = {row[3] for row in indexed.values()}
+
+        # Remote files this index doesn't know: created by another client,
+        # or a newer version uploaded elsewhere
+        untracked = {}
+        for f in remote_files:
+            if f['id'] not in tracked:
+                rel_path = local_path(f.get('name') or f['id'])
+                if not safe_path(rel_path):
+                    print(f"Sync: skipping remote file {f['id']} with unsafe name {f.get('name')!r}")
+                    continue
+                untracked.setdefault(rel_path, []).append(f['id'])
+
+        for rel_path in set(local) | set(indexed) | set(untracked):
+            row = indexed.get(rel_path)
+            others = untracked.get(rel_path, [])
+
+            if rel_path in local:
+                size, mtime_ns = local[rel_path]
+                if row is None:
+                    state = 'new'
+                elif (size, mtime_ns) == row[:2]:
+                    state = 'unchanged'
+                elif size == row[0] and sha256_file(os.path.join(self.local_dir, rel_path)) == row[2]:
+                    # Touched but not modified: remember the new mtime, nothing to send
+                    plan.refresh.append((rel_path, size, mtime_ns, row[2], row[3]))
+                    state = 'unchanged'
+                else:
+                    state = 'changed'
+            else:
+                state = 'deleted' if row else 'absent'
+
+            tracked_present = row is not None and row[3] in remote_ids
+            if state in ('new', 'changed'):
+                replaces = [row[3]] if tracked_present else []
+                if self.delete:
+                    replaces += others
+                plan.uploads.append((rel_path, replaces))
+            elif state == 'unchanged':
+                if tracked_present:
+                    plan.unchanged += 1
+                elif others:
+                    plan.downloads.append((others[0], rel_path))
+                elif self.delete:
+                    plan.local_deletes.append(rel_path)
+                else:
+                    plan.uploads.append((rel_path, []))
+            elif state == 'deleted':
+                if others:
+                    plan.downloads.append((others[0], rel_path))
+                elif tracked_present and self.delete:
+                    plan.remote_deletes.append(row[3])
+                    plan.forget.append(rel_path)
+                elif tracked_present:
+                    plan.downloads.append((row[3], rel_path))
+                else:
+                    plan.forget.append(rel_path)
+            else:
+                plan.downloads.append((others[0], rel_path))
+        return plan
+
+    def run(self, dry_run=False, progress=None):
+        """
+        Sync once
+
+        Args:
+            dry_run: Only compute the plan
+            progress: Optional callable(nbytes) for transferred file data
+
+        Returns:
+            Dict with the planned operation counts, 'failed' paths/IDs and
+            the elapsed seconds
+        """
+        start = time.time()
+        with self.pool.connection() as client:
+            # iter_files raises instead of returning [], which would look like every remote file was deleted
+            try:
+                remote_files = list(client.iter_files(fields=['id', 'name', 'size']))
+            except ConnectionError as e:
+                raise ConnectionError(f"Could not list files on the server: {e}")
+        plan = self.plan(remote_files)
+        self.report = dict(plan.summary(), failed=[])
+        if dry_run:
+            self.report['elapsed'] = time.time() - start
+            return self.report
+
+        for args in plan.refresh:
+            self.index.put(*args)
+        for rel_path in plan.forget:
+            self.index.remove(rel_path)
+        for rel_path in plan.local_deletes:
+            os.remove(os.path.join(self.local_dir, rel_path))
+            self.index.remove(rel_path)
+
+        sizes = {f['id']: int(f.get('size') or 0) for f in remote_files}
+        small_up, large_up = [], []
+        for upload in plan.uploads:
+            small = os.path.getsize(os.path.join(self.local_dir, upload[0])) <= BATCH_FILE_SIZE
+            (small_up if small else large_up).append(upload)
+        small_down, large_down = [], []
+        for download in plan.downloads:
+            (small_down if sizes.get(download[0], 0) <= BATCH_FILE_SIZE else large_down).append(download)
+
+        jobs = [lambda c=c: self.upload(c, progress) for c in self._chunks(small_up)]
+        jobs += [lambda u=u: self.upload([u], progress) for u in large_up]
+        jobs += [lambda c=c: self.download(c, progress) for c in self._chunks(small_down)]
+        jobs += [lambda d=d: self.download([d], progress) for d in large_down]
+        jobs += [lambda r=r: self.delete_remote(r) for r in plan.remote_deletes]
+        with ThreadPoolExecutor(max_workers=self.parallel) as executor:
+            for future in as_completed([executor.submit(job) for job in jobs]):
+                future.result()
+
+        self.report['elapsed'] = time.time() - start
+        return self.report
+
+    def _chunks(self, items):
+        return [items[i:i + BATCH_SIZE] for i in range(0, len(items), BATCH_SIZE)]
+
+    def _failed(self, item):
+        with self.lock:
+            self.report['failed'].append(item)
+
+    def upload(self, uploads, progress):
+        """Upload (rel_path, replaces) entries, then delete the remote files they replace"""
+        paths = {os.path.join(self.local_dir, rel_path): rel_path for rel_path, _ in uploads}
+        # Hash and stat before sending, so a write during the upload shows up next sync
+        states = {}
+        for path, rel_path in paths.items():
+            st = os.stat(path)
+            states[rel_path] = (st.st_size, st.st_mtime_ns, sha256_file(path))
+
+        results = {}
+        try:
+            with self.pool.connection() as client:
+                if len(uploads) == 1:
+                    path = next(iter(paths))
+                    if client.upload_file(path, progress, remote_name(paths[path])):
+                        results[path] = client.last_file_id
+                else:
+                    names = {path: remote_name(rel_path) for path, rel_path in paths.items()}
+                    for result in client.upload_batch(list(paths), progress, names) or []:
+                        if result.get('status') == 'success':
+                            results[result['path']] = result.get('gdrive_file_id') or result.get('file_id')
+
+                for rel_path, replaces in uploads:
+                    path = os.path.join(self.local_dir, rel_path)
+                    remote_id = results.get(path)
+                    if remote_id is None:
+                        self._failed(rel_path)
+                        continue
+                    self.index.put(rel_path, *states[rel_path], remote_id)
+                    for old_id in replaces:
+                        if old_id != remote_id:
+                            client.delete_file(old_id)
+        except ConnectionError:
+            for rel_path, _ in uploads:
+                if os.path.join(self.local_dir, rel_path) not in results:
+                    self._failed(rel_path)
+
+    def contains(self, path):
+        """True if path, with symlinks resolved, is inside local_dir"""
+        return os.path.commonpath([self.local_dir, os.path.realpath(path)]) == self.local_dir
+
+    def download(self, downloads, progress):
+        """Download (remote_id, rel_path) entries into local_dir"""
+        # plan() only yields safe names, but a symlinked directory could still lead outside
+        allowed = []
+        for remote_id, rel_path in downloads:
+            path = os.path.join(self.local_dir, rel_path)
+            if not safe_path(rel_path) or not self.contains(path):
+                print(f"Sync: not downloading {remote_id} to {rel_path!r}: outside {self.local_dir}")
+                self._failed(rel_path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            allowed.append((remote_id, rel_path))
+        downloads = allowed
+        if not downloads:
+            return
+        done = {}
+        try:
+            with self.pool.connection() as client:
+                if len(downloads) == 1:
+                    remote_id, rel_path = downloads[0]
+                    output_path = os.path.join(self.local_dir, rel_path)
+                    if client.download_file(remote_id, output_path, progress):
+                        done[remote_id] = output_path
+                else:
+                    names = dict(downloads)
+                    results = client.download_batch(list(names), self.local_dir, names, progress) or []
+                    for result in results:
+                        if result.get('status') == 'success':
+                            done[result['id']] = result['path']
+        except ConnectionError:
+            pass
+
+        for remote_id, rel_path in downloads:
+            path = done.get(remote_id)
+            if path is None:
+                self._failed(rel_path)
+                continue
+            st = os.stat(path)
+            self.index.put(rel_path, st.st_size, st.st_mtime_ns, sha256_file(path), remote_id)
+
+    def delete_remote(self, remote_id):
+        try:
+            with self.pool.connection() as client:
+                if client.delete_file(remote_id):
+                    return
+        except ConnectionError:
+            pass
+        self._failed(remote_id)
+
+    def close(self):
+        self.index.close()
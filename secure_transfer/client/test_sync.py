@@ -0,0 +1,207 @@
+import os
+import ssl
+import sys
+import errno
+import hashlib
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from sync import DirectorySync, SyncPlan, INDEX_NAME, remote_name, local_path, safe_path, sha256_file
+from client import FileClient
+
+
+@pytest.fixture
+def directory(tmp_path):
+    os.makedirs(tmp_path / 'dir')
+    directory = DirectorySync(None, str(tmp_path / 'dir'), str(tmp_path / 'index.sqlite'))
+    yield directory
+    directory.close()
+
+
+def write(syncer, rel_path, data=b'data'):
+    path = os.path.join(syncer.local_dir, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def track(syncer, rel_path, remote_id):
+    path = os.path.join(syncer.local_dir, rel_path)
+    st = os.stat(path)
+    syncer.index.put(rel_path, st.st_size, st.st_mtime_ns, sha256_file(path), remote_id)
+
+
+@pytest.mark.parametrize('name', [
+    '%2Ftmp%2Fpwned',
+    '..%2F..%2F.bashrc',
+    '..',
+    'a%2F..%2F..%2Fb',
+    'a%2F%2Fb',
+    'a%2F.%2Fb',
+    'dir%2F',
+    '.cache%2Fobjects%2Fx',
+    INDEX_NAME,
+    INDEX_NAME + '-wal',
+    'sub%2F' + INDEX_NAME,
+])
+def test_hostile_names_are_skipped(directory, name):
+    plan = directory.plan([{'id': 'evil', 'name': name, 'size': 4}])
+    assert plan.downloads == []
+    assert plan.summary()['download'] == 0
+
+
+def test_download_refuses_paths_outside(directory, tmp_path):
+    outside = tmp_path / 'outside'
+    os.makedirs(outside)
+    os.symlink(outside, os.path.join(directory.local_dir, 'link'))
+    directory.report = {'failed': []}
+    # The pool is never reached: every entry is refused before connecting
+    directory.download([('a', 'link/file'), ('b', '../escape'), ('c', '/tmp/pwned')], None)
+    assert directory.report['failed'] == ['link/file', '../escape', '/tmp/pwned']
+    assert os.listdir(outside) == []
+
+
+def test_names_round_trip():
+    for rel_path in ('a.txt', 'dir/sub/b.txt', '100%/c', 'x%2Fy'):
+        assert local_path(remote_name(rel_path)) == rel_path
+        assert local_path(remote_name(rel_path) + '.enc') == rel_path
+        assert safe_path(rel_path)
+
+
+def test_cache_and_index_are_not_scanned(directory):
+    write(directory, '.cache/blob')
+    write(directory, 'a.txt')
+    assert set(directory.scan()) == {'a.txt'}
+
+
+def test_plan_new_and_remote_only(directory):
+    write(directory, 'new.txt')
+    plan = directory.plan([{'id': 'r1', 'name': remote_name('dir/remote.txt'), 'size': 4}])
+    assert plan.uploads == [('new.txt', [])]
+    assert plan.downloads == [('r1', 'dir/remote.txt')]
+
+
+def test_plan_unchanged_and_touched(directory):
+    write(directory, 'same.txt')
+    write(directory, 'touched.txt')
+    track(directory, 'same.txt', 'r1')
+    track(directory, 'touched.txt', 'r2')
+    path = os.path.join(directory.local_dir, 'touched.txt')
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    plan = directory.plan([{'id': 'r1', 'name': 'same.txt'}, {'id': 'r2', 'name': 'touched.txt'}])
+    assert plan.unchanged == 2
+    assert plan.uploads == [] and plan.downloads == []
+    assert [entry[0] for entry in plan.refresh] == ['touched.txt']
+
+
+def test_plan_changed_replaces_remote(directory):
+    write(directory, 'a.txt')
+    track(directory, 'a.txt', 'r1')
+    write(directory, 'a.txt', b'modified')
+    plan = directory.plan([{'id': 'r1', 'name': 'a.txt'}])
+    assert plan.uploads == [('a.txt', ['r1'])]
+
+
+def test_plan_deleted_locally(directory):
+    remote = [{'id': 'r1', 'name': 'a.txt'}]
+    write(directory, 'a.txt')
+    track(directory, 'a.txt', 'r1')
+    os.remove(os.path.join(directory.local_dir, 'a.txt'))
+    # Restored without delete, deleted on the server with it
+    assert directory.plan(remote).downloads == [('r1', 'a.txt')]
+    directory.delete = True
+    plan = directory.plan(remote)
+    assert plan.remote_deletes == ['r1'] and plan.forget == ['a.txt']
+
+
+def test_plan_deleted_remotely(directory):
+    write(directory, 'a.txt')
+    track(directory, 'a.txt', 'r1')
+    assert directory.plan([]).uploads == [('a.txt', [])]
+    directory.delete = True
+    assert directory.plan([]).local_deletes == ['a.txt']
+
+
+def test_plan_deleted_on_both_sides(directory):
+    write(directory, 'a.txt')
+    track(directory, 'a.txt', 'r1')
+    os.remove(os.path.join(directory.local_dir, 'a.txt'))
+    plan = directory.plan([])
+    assert plan.forget == ['a.txt']
+    assert plan.uploads == [] and plan.downloads == []
+
+
+def test_plan_summary():
+    plan = SyncPlan()
+    plan.uploads.append(('a', []))
+    assert plan.summary() == {'upload': 1, 'download': 0, 'delete_remote': 0, 'delete_local': 0, 'unchanged': 0}
+
+
+class StoredFile:
+    """Stands in for the connection buffer: receives data as if it came from the server"""
+    def __init__(self, data):
+        self.data = data
+        self.progress = None
+
+    def recv_to_file(self, f, size):
+        f.write(self.data[:size])
+        return min(size, len(self.data))
+
+
+class ServerStub(FileClient):
+    """A FileClient answering a plaintext download from memory"""
+    def __init__(self, download_dir, data):
+        super().__init__(download_dir=download_dir, key_store=None, cache=None,
+                         ssl_context=ssl.create_default_context())
+        self.connected = True
+        self.buffer = StoredFile(data)
+        self.data = data
+
+    def send_message(self, message_data):
+        return {'status': 'ready', 'file_size': len(self.data), 'filename': 'big.bin', 'encrypted': False,
+                'checksum': hashlib.sha256(self.data).hexdigest(), 'checksum_algorithm': 'sha256'}
+
+    def receive_response(self):
+        return {'status': 'success'}
+
+
+class StubPool:
+    def __init__(self, client):
+        self.client = client
+
+    @contextmanager
+    def connection(self):
+        yield self.client
+
+
+def test_download_to_another_filesystem(tmp_path, monkeypatch):
+    # The pool's download_dir and the synced directory are on different
+    # filesystems: renaming between them fails the way it would there
+    replace = os.replace
+    def rename(src, dst):
+        if os.path.dirname(os.path.abspath(src)) != os.path.dirname(os.path.abspath(dst)):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        replace(src, dst)
+    monkeypatch.setattr(os, 'replace', rename)
+    monkeypatch.setattr(os, 'rename', rename)
+
+    data = os.urandom(3 * 1024 * 1024)
+    download_dir = tmp_path / 'downloads'
+    os.makedirs(tmp_path / 'dir')
+    directory = DirectorySync(StubPool(ServerStub(str(download_dir), data)), str(tmp_path / 'dir'),
+                              str(tmp_path / 'index.sqlite'))
+    try:
+        directory.report = {'failed': []}
+        directory.download([('r1', 'sub/big.bin')], None)
+        assert directory.report['failed'] == []
+        with open(os.path.join(directory.local_dir, 'sub', 'big.bin'), 'rb') as f:
+            assert f.read() == data
+        assert os.listdir(os.path.join(directory.local_dir, 'sub')) == ['big.bin']
+        assert os.listdir(download_dir) == []
+    finally:
+        directory.close()
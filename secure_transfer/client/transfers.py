@@ -0,0 +1,230 @@
+import os
+import time
+import itertools
+import threading
+
+from client import TransferStopped
+
+QUEUED = 'Queued'
+RUNNING = 'Running'
+PAUSED = 'Paused'
+DONE = 'Done'
+FAILED = 'Failed'
+CANCELLED = 'Cancelled'
+
+# Weight of the newest sample in the smoothed transfer rate
+RATE_SMOOTHING = 0.3
+
+
+class Transfer:
+    """
+    One queued upload or download and its live progress
+
+    done is advanced by the worker thread through progress(); readers
+    sample it (see TransferQueue.sample()) instead of being called per
+    chunk, so progress costs nothing on the UI thread between refreshes.
+
+    Args:
+        kind: 'upload' or 'download'
+        source: Local path (upload) or file ID (download)
+        name: Name shown for the transfer
+        size: Bytes to transfer, if known
+        output_path: Where a download is written
+    """
+    ids = itertools.count(1)
+
+    def __init__(self, kind, source, name, size=None, output_path=None):
+        self.id = next(self.ids)
+        self.kind = kind
+        self.source = source
+        self.name = name
+        self.size = size
+        self.output_path = output_path
+        self.state = QUEUED
+        self.message = ''
+        self.done = 0
+        self.rate = 0.0
+        self.started = None
+        self.finished = None
+        self.file_id = None
+        # 'pause' or 'cancel' while a stop is pending
+        self.stop_request = None
+        self.last_sample = (0, None)
+
+    def progress(self, nbytes):
+        """ConnectionBuffer progress hook; stops the transfer when asked to"""
+        self.done += nbytes
+        if self.stop_request:
+            raise TransferStopped(self.stop_request)
+
+    def eta(self):
+        """Seconds left at the current rate, or None"""
+        if self.state != RUNNING or not self.size or self.rate <= 0:
+            return None
+        return max(self.size - self.done, 0) / self.rate
+
+    def fraction(self):
+        if self.state == DONE:
+            return 1.0
+        return min(self.done / self.size, 1.0) if self.size else 0.0
+
+
+class TransferQueue:
+    """
+    Runs queued uploads and downloads on a connection pool
+
+    At most parallel transfers run at once, each on its own thread and
+    pooled connection; the rest wait in order. Transfers can be paused,
+    resumed, cancelled and retried. The protocol has no ranged transfers,
+    so pausing a running transfer stops it, and resuming starts it again
+    from the beginning.
+
+    on_change(transfer, state) is called, from worker threads too, whenever
+    a transfer changes state; state is passed because the transfer may have
+    moved on by the time a queued notification is handled. Byte progress
+    is read with sample().
+
+    Args:
+        pool: ConnectionPool to run transfers on
+        parallel: Concurrent transfers (at most pool.size)
+        on_change: Optional callable(transfer, state)
+    """
+    def __init__(self, pool, parallel=3, on_change=None):
+        self.pool = pool
+        self.parallel = parallel
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.transfers = []
+        self.running = 0
+
+    def add_upload(self, path):
+        return self.add(Transfer('upload', path, os.path.basename(path), os.path.getsize(path)))
+
+    def add_download(self, file_id, name, size=None, output_path=None):
+        output_path = output_path or os.path.join(self.pool.download_dir, os.path.basename(name))
+        return self.add(Transfer('download', file_id, name, size, output_path))
+
+    def add(self, transfer):
+        with self.lock:
+            self.transfers.append(transfer)
+        self.changed(transfer, QUEUED)
+        self.schedule()
+        return transfer
+
+    def set_parallel(self, parallel):
+        self.parallel = max(1, min(parallel, self.pool.size))
+        self.schedule()
+
+    def schedule(self):
+        """Start queued transfers while there are free slots"""
+        started = []
+        with self.lock:
+            for transfer in self.transfers:
+                if self.running >= self.parallel:
+                    break
+                if transfer.state == QUEUED:
+                    transfer.state = RUNNING
+                    transfer.started = time.time()
+                    transfer.done = 0
+                    transfer.rate = 0.0
+                    transfer.stop_request = None
+                    transfer.last_sample = (0, transfer.started)
+                    self.running += 1
+                    started.append(transfer)
+        for transfer in started:
+            self.changed(transfer, RUNNING)
+            threading.Thread(target=self.run, args=(transfer,), daemon=True,
+                             name=f'sft-transfer-{transfer.id}').start()
+
+    def run(self, transfer):
+        ok = False
+        try:
+            with self.pool.connection() as client:
+                if transfer.kind == 'upload':
+                    ok = client.upload_file(transfer.source, progress=transfer.progress)
+                    transfer.file_id = client.last_file_id
+                else:
+                    ok = client.download_file(transfer.source, transfer.output_path, progress=transfer.progress)
+        except Exception as e:
+            transfer.message = str(e)
+        with self.lock:
+            self.running -= 1
+            transfer.finished = time.time()
+            if ok:
+                transfer.state = DONE
+                transfer.message = ''
+            elif transfer.stop_request == 'pause':
+                transfer.state = PAUSED
+            elif transfer.stop_request == 'cancel':
+                transfer.state = CANCELLED
+            else:
+                transfer.state = FAILED
+                transfer.message = transfer.message or f"{transfer.kind.capitalize()} failed"
+            transfer.stop_request = None
+            state = transfer.state
+        self.changed(transfer, state)
+        self.schedule()
+
+    def pause(self, transfer):
+        self.stop(transfer, PAUSED, 'pause')
+
+    def cancel(self, transfer):
+        self.stop(transfer, CANCELLED, 'cancel')
+
+    def stop(self, transfer, state, request):
+        with self.lock:
+            if transfer.state == RUNNING:
+                # Takes effect at the next chunk (see Transfer.progress)
+                transfer.stop_request = request
+                return
+            if transfer.state not in (QUEUED, PAUSED):
+                return
+            transfer.state = state
+        self.changed(transfer, state)
+
+    def resume(self, transfer):
+        """Queue a paused, failed or cancelled transfer again"""
+        with self.lock:
+            if transfer.state not in (PAUSED, FAILED, CANCELLED):
+                return
+            transfer.state = QUEUED
+            transfer.message = ''
+            transfer.done = 0
+        self.changed(transfer, QUEUED)
+        self.schedule()
+
+    retry = resume
+
+    def clear_finished(self):
+        """Forget finished transfers; returns the ones removed"""
+        with self.lock:
+            removed = [t for t in self.transfers if t.state in (DONE, CANCELLED)]
+            self.transfers = [t for t in self.transfers if t.state not in (DONE, CANCELLED)]
+        return removed
+
+    def cancel_all(self):
+        for transfer in list(self.transfers):
+            self.cancel(transfer)
+
+    def sample(self, now=None):
+        """
+        Update the smoothed rate of running transfers from their byte counts
+
+        Returns:
+            The transfers that are running
+        """
+        now = now or time.time()
+        with self.lock:
+            running = [t for t in self.transfers if t.state == RUNNING]
+        for transfer in running:
+            done, then = transfer.last_sample
+            if now > then:
+                rate = (transfer.done - done) / (now - then)
+                transfer.rate = rate if transfer.rate == 0 else (
+                    RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * transfer.rate)
+                transfer.last_sample = (transfer.done, now)
+        return running
+
+    def changed(self, transfer, state):
+        if self.on_change:
+            self.on_change(transfer, state)
@@ -0,0 +1,181 @@
+import time
+import threading
+
+# Concurrent executions per command; 'control' covers stats, profile and unknown commands
+DEFAULT_COMMAND_LIMITS = {'upload': 32, 'download': 64, 'list': 64, 'control': 16}
+
+
+class Busy(Exception):
+    """
+    Raised when a request cannot be admitted within the queue timeout
+
+    Args:
+        reason: Which limit was hit ('connections', 'command', 'bytes')
+        retry_after: Suggested delay in seconds before the client retries
+    """
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Server busy ({reason}), retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Permit:
+    """Admission for one command; release() returns its slot and bytes"""
+    def __init__(self, controller, command, nbytes):
+        self.controller = controller
+        self.command = command
+        self.nbytes = nbytes
+        self.released = False
+
+    def reserve(self, nbytes):
+        """Add nbytes to this permit's budget once the real size is known (may raise Busy)"""
+        self.controller._reserve_bytes(nbytes)
+        self.nbytes += nbytes
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self.command, self.nbytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Server-wide limits on connections, concurrent commands and in-flight bytes
+
+    Requests over a limit wait up to queue_timeout for capacity and are then
+    refused with Busy, so overload turns into "retry later" responses instead
+    of unbounded threads, disk usage and memory.
+
+    Args:
+        max_connections: Open client connections (0 = unlimited)
+        command_limits: Dict of command -> max concurrent executions (missing = unlimited)
+        byte_budget: Bytes of file data in flight across all transfers (0 = unlimited)
+        queue_timeout: Seconds a request may wait for capacity before Busy
+        retry_after: Base retry delay suggested to refused clients
+        metrics: Optional Metrics instance to publish limits and usage to
+    """
+    def __init__(self, max_connections=0, command_limits=None, byte_budget=0,
+                 queue_timeout=5.0, retry_after=1.0, metrics=None):
+        self.max_connections = max_connections
+        self.command_limits = dict(command_limits or {})
+        self.byte_budget = byte_budget
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.metrics = metrics
+        self.cond = threading.Condition()
+        self.connections = 0
+        self.running = {}
+        self.bytes_in_flight = 0
+        self.waiting = 0
+
+        if metrics:
+            metrics.describe('sft_admission_limit', 'Configured admission limits (0 = unlimited)')
+            metrics.describe('sft_admission_in_flight', 'Admitted commands currently executing')
+            metrics.describe('sft_admission_bytes_in_flight', 'File bytes reserved by running transfers')
+            metrics.describe('sft_admission_waiting', 'Requests queued for capacity')
+            metrics.describe('sft_admission_rejected_total', 'Requests refused with a busy response, by limit')
+            metrics.set_gauge('sft_admission_limit', max_connections, resource='connections')
+            metrics.set_gauge('sft_admission_limit', byte_budget, resource='bytes')
+            for command, limit in self.command_limits.items():
+                metrics.set_gauge('sft_admission_limit', limit, resource=command)
+
+    def _busy(self, reason):
+        # Scale the suggested delay with the queue so retries spread out under load
+        retry_after = self.retry_after * (1 + self.waiting / max(1, self.max_connections or 16))
+        if self.metrics:
+            self.metrics.inc('sft_admission_rejected_total', reason=reason)
+        return Busy(reason, round(retry_after, 2))
+
+    def _publish(self):
+        if self.metrics:
+            self.metrics.set_gauge('sft_admission_bytes_in_flight', self.bytes_in_flight)
+            self.metrics.set_gauge('sft_admission_waiting', self.waiting)
+
+    def _wait_for(self, predicate, reason, timeout=None):
+        """Wait on the condition (held by the caller) until predicate() or timeout"""
+        if predicate():
+            return
+        self.waiting += 1
+        self._publish()
+        try:
+            if not self.cond.wait_for(predicate, self.queue_timeout if timeout is None else timeout):
+                raise self._busy(reason)
+        finally:
+            self.waiting -= 1
+            self._publish()
+
+    def _bytes_available(self, nbytes):
+        # A transfer larger than the whole budget is admitted when nothing else is in flight
+        return (not self.byte_budget or self.bytes_in_flight + nbytes <= self.byte_budget
+                or self.bytes_in_flight == 0)
+
+    def open_connection(self):
+        """Count a new connection; raises Busy immediately if over the limit"""
+        with self.cond:
+            if self.max_connections and self.connections >= self.max_connections:
+                raise self._busy('connections')
+            self.connections += 1
+
+    def close_connection(self):
+        with self.cond:
+            self.connections -= 1
+
+    def acquire(self, command, nbytes=0):
+        """
+        Wait for a command slot and nbytes of budget
+
+        Returns:
+            Permit to release when the command finishes (usable as a context manager)
+        """
+        limit = self.command_limits.get(command, 0)
+        deadline = time.monotonic() + self.queue_timeout
+        with self.cond:
+            self._wait_for(lambda: not limit or self.running.get(command, 0) < limit, 'command')
+            self.running[command] = self.running.get(command, 0) + 1
+            try:
+                # The byte budget gets whatever is left of the same queue timeout
+                self._wait_for(lambda: self._bytes_available(nbytes), 'bytes',
+                               max(0.0, deadline - time.monotonic()))
+                self.bytes_in_flight += nbytes
+            except Busy:
+                self.running[command] -= 1
+                self.cond.notify_all()
+                raise
+            if self.metrics:
+                self.metrics.set_gauge('sft_admission_in_flight', self.running[command], command=command)
+            self._publish()
+        return Permit(self, command, nbytes)
+
+    def _reserve_bytes(self, nbytes):
+        with self.cond:
+            self._wait_for(lambda: self._bytes_available(nbytes), 'bytes')
+            self.bytes_in_flight += nbytes
+            self._publish()
+
+    def _release(self, command, nbytes):
+        with self.cond:
+            self.running[command] -= 1
+            self.bytes_in_flight -= nbytes
+            if self.metrics:
+                self.metrics.set_gauge('sft_admission_in_flight', self.running[command], command=command)
+            self._publish()
+            self.cond.notify_all()
+
+    def snapshot(self):
+        """Current usage and limits, for the stats command"""
+        with self.cond:
+            return {
+                'connections': self.connections,
+                'max_connections': self.max_connections,
+                'running': dict(self.running),
+                'command_limits': dict(self.command_limits),
+                'bytes_in_flight': self.bytes_in_flight,
+                'byte_budget': self.byte_budget,
+                'waiting': self.waiting
+            }
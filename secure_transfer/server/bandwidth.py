@@ -0,0 +1,204 @@
+import time
+import heapq
+import threading
+from contextlib import contextmanager
+
+# Transfers up to this size are scheduled ahead of bulk data
+DEFAULT_SMALL_TRANSFER = 1024 * 1024
+
+# Bucket depth, in seconds of the configured rate
+BURST_SECONDS = 0.25
+
+
+class TokenBucket:
+    """
+    Rate limiter that lets callers go into debt instead of splitting requests
+
+    reserve(n) always succeeds and returns how long the caller must sleep so
+    that the long-run rate stays at rate bytes/s; up to burst bytes can be
+    sent without waiting after an idle period.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst if burst is not None else max(64 * 1024, rate * BURST_SECONDS)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, nbytes):
+        """Take nbytes of tokens and return the delay in seconds before sending them"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= nbytes
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class _User:
+    __slots__ = ('name', 'weight', 'bucket', 'finish', 'flows', 'bytes')
+
+    def __init__(self, name, weight, bucket):
+        self.name = name
+        self.weight = weight
+        self.bucket = bucket
+        self.finish = 0.0
+        self.flows = 0
+        self.bytes = 0
+
+
+class BandwidthScheduler:
+    """
+    Shares the server's outgoing bandwidth fairly between users
+
+    Three layers apply to every chunk of file data sent to a client:
+    a per-connection token bucket, a per-user token bucket, and a global link
+    of total_rate bytes/s shared by self-clocked fair queueing. Each user's
+    chunks carry virtual finish tags advanced by size / weight, and the
+    chunk with the smallest tag is sent next, so users with equal weights
+    get equal shares no matter how many connections they open, and idle
+    capacity goes to whoever is active. Transfers of at most small_transfer
+    bytes form a higher priority class, so small files and control traffic
+    (which is never shaped) are not stuck behind bulk downloads.
+
+    A user is identified by the client's IP address.
+
+    Args:
+        total_rate: Server-wide bytes/s for file data (0 = unlimited)
+        connection_rate: Bytes/s per connection (0 = unlimited)
+        user_rate: Bytes/s per user across their connections (0 = unlimited)
+        weights: Dict of user -> weight for the fair share (default 1.0)
+        small_transfer: Size in bytes up to which a transfer gets priority
+        metrics: Optional Metrics instance
+    """
+    def __init__(self, total_rate=0, connection_rate=0, user_rate=0, weights=None,
+                 small_transfer=DEFAULT_SMALL_TRANSFER, metrics=None):
+        self.total_rate = total_rate
+        self.connection_rate = connection_rate
+        self.user_rate = user_rate
+        self.weights = dict(weights or {})
+        self.small_transfer = small_transfer
+        self.metrics = metrics
+        self.enabled = bool(total_rate or connection_rate or user_rate)
+
+        self.cond = threading.Condition()
+        self.users = {}
+        self.queue = []
+        self.seq = 0
+        self.vtime = 0.0
+        self.link_free = time.monotonic()
+        self.link_burst = max(64 * 1024, total_rate * BURST_SECONDS) / total_rate if total_rate else 0.0
+
+        if metrics:
+            metrics.describe('sft_bandwidth_limit_bytes', 'Configured bandwidth limits in bytes/s (0 = unlimited)')
+            metrics.describe('sft_bandwidth_wait_seconds_total', 'Time transfers spent waiting for bandwidth, by layer')
+            metrics.set_gauge('sft_bandwidth_limit_bytes', total_rate, scope='total')
+            metrics.set_gauge('sft_bandwidth_limit_bytes', connection_rate, scope='connection')
+            metrics.set_gauge('sft_bandwidth_limit_bytes', user_rate, scope='user')
+
+    def connection(self, user):
+        """Create the shaper for a new connection from user"""
+        bucket = TokenBucket(self.connection_rate) if self.connection_rate else None
+        return ConnectionShaper(self, user, bucket)
+
+    def _join(self, name):
+        with self.cond:
+            user = self.users.get(name)
+            if user is None:
+                bucket = TokenBucket(self.user_rate) if self.user_rate else None
+                user = self.users[name] = _User(name, self.weights.get(name, 1.0), bucket)
+            user.flows += 1
+            return user
+
+    def _leave(self, user):
+        with self.cond:
+            user.flows -= 1
+            if user.flows == 0:
+                del self.users[user.name]
+
+    def _wait(self, layer, delay):
+        if delay > 0:
+            time.sleep(delay)
+            if self.metrics:
+                self.metrics.inc('sft_bandwidth_wait_seconds_total', delay, layer=layer)
+
+    def _send_slot(self, user, priority, nbytes):
+        """Block until the global link may carry nbytes for user"""
+        start = time.monotonic()
+        with self.cond:
+            # Self-clocked fair queueing: tags continue from the tag in service,
+            # so a user returning from idle does not get credit for the past
+            tag = max(self.vtime, user.finish) + nbytes / user.weight
+            user.finish = tag
+            self.seq += 1
+            entry = (priority, tag, self.seq)
+            heapq.heappush(self.queue, entry)
+            self.cond.notify_all()
+
+            while True:
+                now = time.monotonic()
+                if self.queue[0] == entry:
+                    if now >= self.link_free:
+                        heapq.heappop(self.queue)
+                        self.vtime = tag
+                        self.link_free = max(now - self.link_burst, self.link_free) + nbytes / self.total_rate
+                        self.cond.notify_all()
+                        break
+                    self.cond.wait(self.link_free - now)
+                else:
+                    self.cond.wait()
+        if self.metrics:
+            self.metrics.inc('sft_bandwidth_wait_seconds_total', time.monotonic() - start, layer='total')
+
+    def snapshot(self):
+        """Limits and per-user state, for the stats command"""
+        with self.cond:
+            return {
+                'enabled': self.enabled,
+                'total_rate': self.total_rate,
+                'connection_rate': self.connection_rate,
+                'user_rate': self.user_rate,
+                'queued_chunks': len(self.queue),
+                'active_users': {name: {'weight': u.weight, 'transfers': u.flows, 'bytes': u.bytes}
+                                 for name, u in self.users.items()}
+            }
+
+
+class ConnectionShaper:
+    """Bandwidth state of one client connection (see BandwidthScheduler)"""
+    def __init__(self, scheduler, user, bucket):
+        self.scheduler = scheduler
+        self.user = user
+        self.bucket = bucket
+
+    @contextmanager
+    def transfer(self, buffer, size):
+        """
+        Shape the file data sent through buffer for the duration of the block
+
+        Installs a throttle on the ConnectionBuffer; a no-op when no limits
+        are configured.
+        """
+        scheduler = self.scheduler
+        if not scheduler.enabled:
+            yield
+            return
+
+        user = scheduler._join(self.user)
+        priority = 0 if size <= scheduler.small_transfer else 1
+
+        def throttle(nbytes):
+            if self.bucket:
+                scheduler._wait('connection', self.bucket.reserve(nbytes))
+            if user.bucket:
+                scheduler._wait('user', user.bucket.reserve(nbytes))
+            if scheduler.total_rate:
+                scheduler._send_slot(user, priority, nbytes)
+            user.bytes += nbytes
+
+        buffer.throttle = throttle
+        try:
+            yield
+        finally:
+            buffer.throttle = None
+            scheduler._leave(user)
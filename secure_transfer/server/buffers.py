@@ -0,0 +1,485 @@
+import os
+import ssl
+import time
+import errno
+import socket
+import json
+import ctypes
+import ctypes.util
+import threading
+import selectors
+
+# Default size of the per-connection I/O buffer. TLS records are at most 16 KB,
+# so anything much smaller than this just multiplies syscalls and file writes.
+DEFAULT_IO_SIZE = 256 * 1024
+
+# Length prefix used by every control frame in the protocol
+HEADER_SIZE = 4
+
+# Upper bound for a single control frame; anything larger is treated as garbage
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+# Upper bound for a frame sent to the server. Requests are small JSON
+# commands (batches are split by the client), and any peer that completes
+# the TLS handshake can send one, so the server must not accept big frames
+MAX_REQUEST_SIZE = 1024 * 1024
+
+# Largest count handed to a single os.sendfile() call
+SENDFILE_CHUNK = 8 * 1024 * 1024
+
+# File writes are kept to multiples of this, so every write but the last
+# starts and ends on a filesystem block boundary
+WRITE_ALIGNMENT = 4096
+
+# fallocate(2) mode that reserves blocks without changing the file size (linux/falloc.h)
+FALLOC_FL_KEEP_SIZE = 0x01
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+    _fallocate = _libc.fallocate
+    _fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+except (OSError, AttributeError):
+    _fallocate = None
+
+# Minimum-throughput checks start once a transfer has spent this long in socket I/O
+THROUGHPUT_GRACE = 10.0
+
+# Linux kernel TLS socket options (linux/tls.h); not exported by the socket module
+SOL_TLS = 282
+TLS_TX = 1
+
+# SSL_OP_ENABLE_KTLS. Python 3.12 exposes it as ssl.OP_ENABLE_KTLS; older
+# interpreters linked against OpenSSL 3 accept the raw bit.
+if hasattr(ssl, 'OP_ENABLE_KTLS'):
+    KTLS_OPTION = ssl.OP_ENABLE_KTLS
+elif ssl.OPENSSL_VERSION_INFO >= (3, 0):
+    KTLS_OPTION = 0x8
+else:
+    KTLS_OPTION = 0
+
+
+def enable_ktls(ssl_context):
+    """
+    Ask OpenSSL to offload record encryption to the kernel where supported
+
+    This is only a request: OpenSSL silently keeps doing TLS in userspace when
+    the kernel lacks the tls module or the negotiated cipher is not supported.
+
+    Returns:
+        True if the option could be set on the context
+    """
+    if not KTLS_OPTION:
+        return False
+    try:
+        ssl_context.options |= KTLS_OPTION
+        return True
+    except (ValueError, ssl.SSLError):
+        return False
+
+
+def configure_tls(ssl_context, ciphers=None, curve=None, min_version=None):
+    """
+    Apply tunable handshake settings to an SSL context
+
+    Args:
+        ciphers: OpenSSL cipher string for TLS 1.2 (TLS 1.3 suites are fixed by OpenSSL)
+        curve: ECDH curve name for key exchange, e.g. 'prime256v1' (server side only)
+        min_version: Lowest protocol version, '1.2' or '1.3'
+    """
+    if ciphers:
+        ssl_context.set_ciphers(ciphers)
+    if curve:
+        ssl_context.set_ecdh_curve(curve)
+    if min_version:
+        ssl_context.minimum_version = {
+            '1.2': ssl.TLSVersion.TLSv1_2,
+            '1.3': ssl.TLSVersion.TLSv1_3
+        }[min_version]
+    return ssl_context
+
+
+def ktls_tx_active(sock):
+    """Return True if the kernel is encrypting outgoing TLS records for sock"""
+    try:
+        # The kernel only answers once TX crypto state has been installed
+        sock.getsockopt(SOL_TLS, TLS_TX, 64)
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def kernel_send_possible(sock):
+    """
+    Return True if file data may be written straight to the socket fd
+
+    For a plain TCP socket this is always the case. For a TLS socket it is only
+    safe once kTLS TX is active, otherwise the data would bypass encryption.
+    """
+    if not hasattr(os, 'sendfile'):
+        return False
+    if isinstance(sock, ssl.SSLSocket):
+        return ktls_tx_active(sock)
+    return True
+
+
+class PeerTimeout(ConnectionError):
+    """The peer sent or accepted nothing within the socket timeout"""
+
+
+class SlowPeerError(ConnectionError):
+    """The peer moves data slower than the configured minimum throughput"""
+
+
+class IOStats:
+    """Process-wide counters for buffer allocations and bytes moved"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset all counters to zero"""
+        with self.lock:
+            self.allocations = 0
+            self.allocated_bytes = 0
+            self.bytes_received = 0
+            self.bytes_sent = 0
+
+    def record_allocation(self, size):
+        with self.lock:
+            self.allocations += 1
+            self.allocated_bytes += size
+
+    def record_received(self, nbytes):
+        with self.lock:
+            self.bytes_received += nbytes
+
+    def record_sent(self, nbytes):
+        with self.lock:
+            self.bytes_sent += nbytes
+
+    def snapshot(self):
+        """Return the counters as a dict, including allocations per GB moved"""
+        with self.lock:
+            moved = self.bytes_received + self.bytes_sent
+            return {
+                'allocations': self.allocations,
+                'allocated_bytes': self.allocated_bytes,
+                'bytes_received': self.bytes_received,
+                'bytes_sent': self.bytes_sent,
+                'allocations_per_gb': (self.allocations * (1 << 30) / moved) if moved else 0.0
+            }
+
+
+io_stats = IOStats()
+
+
+def preallocate(f, size):
+    """
+    Reserve size bytes of disk for the file f is about to receive
+
+    Blocks allocated up front keep a large upload contiguous instead of
+    growing it one write at a time, and a disk without room fails before
+    any data is transferred. The file size itself only grows as data is
+    written. Does nothing where fallocate() is unsupported.
+
+    Raises:
+        OSError: The disk (or quota) can't hold size bytes
+    """
+    if size <= 0 or _fallocate is None:
+        return
+    if _fallocate(f.fileno(), FALLOC_FL_KEEP_SIZE, 0, size) != 0:
+        error = ctypes.get_errno()
+        if error in (errno.ENOSPC, errno.EDQUOT, errno.EFBIG):
+            raise OSError(error, os.strerror(error))
+
+
+def send_frame(sock, payload):
+    """Send one length-prefixed frame in a single write"""
+    sock.sendall(len(payload).to_bytes(HEADER_SIZE, byteorder='big') + payload)
+
+
+def encode_json(message_data):
+    """Serialize a dict as a length-prefixed JSON frame, for callers that coalesce writes"""
+    payload = json.dumps(message_data).encode('utf-8')
+    return len(payload).to_bytes(HEADER_SIZE, byteorder='big') + payload
+
+
+def send_json(sock, message_data):
+    """Serialize a dict as JSON and send it as a frame"""
+    send_frame(sock, json.dumps(message_data).encode('utf-8'))
+
+
+class ConnectionBuffer:
+    """
+    Preallocated I/O buffer bound to one connection
+
+    All receives go through recv_into() on a single bytearray, so steady-state
+    transfers do not allocate per chunk. The buffer never grows: a control
+    frame larger than it is collected in a bytearray of its own that grows
+    only as the frame's bytes arrive, and is dropped after use. The protocol
+    is strictly request/response, so the same buffer is reused for sending
+    file data.
+
+    Args:
+        sock: Connected socket
+        io_size: Buffer size
+        max_frame: Largest control frame accepted (MAX_REQUEST_SIZE on the server)
+    """
+    def __init__(self, sock, io_size=DEFAULT_IO_SIZE, max_frame=MAX_FRAME_SIZE):
+        self.sock = sock
+        self.io_size = io_size
+        self.max_frame = max_frame
+        # Optional callable(nbytes) that blocks until nbytes of file data may be
+        # sent; installed by the server's bandwidth scheduler during transfers
+        self.throttle = None
+        # Optional callable(nbytes) told about file data as it moves (progress display)
+        self.progress = None
+        # Bytes/s a file transfer must sustain (measured over time spent in
+        # socket calls, after THROUGHPUT_GRACE seconds); None disables the check
+        self.min_throughput = None
+        self._allocate(io_size)
+
+    def _allocate(self, size):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        io_stats.record_allocation(size)
+
+    def recv_exact(self, n, allow_eof=False):
+        """
+        Receive exactly n bytes into the buffer
+
+        Args:
+            n: Number of bytes to receive
+            allow_eof: Return None instead of raising if the peer closes before
+                       the first byte arrives
+
+        Returns:
+            Memoryview of the received bytes, valid until the next receive
+        """
+        if n > len(self.buf):
+            return self._recv_large(n, allow_eof)
+
+        view = self.view
+        received = 0
+        while received < n:
+            try:
+                count = self.sock.recv_into(view[received:n], n - received)
+            except socket.timeout:
+                raise PeerTimeout("Timed out waiting for data from peer")
+            if not count:
+                if received == 0 and allow_eof:
+                    return None
+                raise ConnectionError("Connection lost while receiving message")
+            received += count
+        return view[:n]
+
+    def _recv_large(self, n, allow_eof):
+        # Grown a buffer at a time, so a length prefix alone never costs memory
+        io_stats.record_allocation(n)
+        data = bytearray()
+        while len(data) < n:
+            chunk = self.recv_exact(min(len(self.buf), n - len(data)), allow_eof and not data)
+            if chunk is None:
+                return None
+            data += chunk
+        return memoryview(data)
+
+    def recv_frame(self):
+        """Receive one length-prefixed frame, or None if the peer closed cleanly"""
+        header = self.recv_exact(HEADER_SIZE, allow_eof=True)
+        if header is None:
+            return None
+
+        msg_len = int.from_bytes(header, byteorder='big')
+        if msg_len > self.max_frame:
+            raise ConnectionError(f"Frame of {msg_len} bytes exceeds limit")
+        return self.recv_exact(msg_len)
+
+    def recv_message(self):
+        """Receive one frame and decode it as JSON, or None if the peer closed"""
+        frame = self.recv_frame()
+        if frame is None:
+            return None
+        return json.loads(str(frame, 'utf-8'))
+
+    def recv_to_file(self, f, total, timing=None, digest=None):
+        """
+        Receive up to total bytes from the socket and write them to f
+
+        The buffer is filled completely before each write so that file writes
+        happen in io_size pieces (rounded down to WRITE_ALIGNMENT) rather
+        than one per TLS record.
+
+        Args:
+            f: Binary file object to write to
+            total: Number of bytes expected
+            timing: Optional dict; seconds spent in file writes are added to
+                    timing['file_io_s'] so callers can separate disk from socket time
+            digest: Optional hash object updated with the received bytes, so the
+                    file can be checksummed without reading it back
+
+        Returns:
+            Number of bytes received (less than total if the peer closed early)
+        """
+        view = self.view
+        # io_size need not be a multiple of the alignment
+        capacity = len(view)
+        if capacity > WRITE_ALIGNMENT:
+            capacity -= capacity % WRITE_ALIGNMENT
+        received = 0
+        eof = False
+        file_io = 0.0
+        socket_io = 0.0
+
+        while received < total and not eof:
+            filled = 0
+            want = min(capacity, total - received)
+            start = time.perf_counter()
+            while filled < want:
+                try:
+                    count = self.sock.recv_into(view[filled:want], want - filled)
+                except socket.timeout:
+                    raise PeerTimeout(f"Timed out after receiving {received + filled} of {total} bytes")
+                if not count:
+                    eof = True
+                    break
+                filled += count
+                # Checked per read so a trickling peer is caught without waiting for a full buffer
+                if self.min_throughput:
+                    self._check_throughput(received + filled, socket_io + time.perf_counter() - start)
+            socket_io += time.perf_counter() - start
+
+            if filled:
+                if digest is not None:
+                    digest.update(view[:filled])
+                if timing is not None:
+                    start = time.perf_counter()
+                    f.write(view[:filled])
+                    file_io += time.perf_counter() - start
+                else:
+                    f.write(view[:filled])
+                received += filled
+                if self.progress:
+                    self.progress(filled)
+
+        if timing is not None:
+            timing['file_io_s'] = timing.get('file_io_s', 0.0) + file_io
+        io_stats.record_received(received)
+        return received
+
+    def send_from_file(self, f, count=None, timing=None):
+        """
+        Send the contents of f (or its next count bytes) through the buffer
+
+        Args:
+            f: Binary file object to read from
+            count: Number of bytes to send (default: until EOF)
+            timing: Optional dict; seconds spent in file reads are added to timing['file_io_s']
+
+        Returns:
+            Number of bytes sent
+        """
+        view = self.view
+        capacity = len(view)
+        sent = 0
+        file_io = 0.0
+        socket_io = 0.0
+
+        while count is None or sent < count:
+            want = capacity if count is None else min(capacity, count - sent)
+            if timing is not None:
+                start = time.perf_counter()
+                n = f.readinto(view[:want])
+                file_io += time.perf_counter() - start
+            else:
+                n = f.readinto(view[:want])
+            if not n:
+                break
+            if self.throttle:
+                self.throttle(n)
+            start = time.perf_counter()
+            try:
+                self.sock.sendall(view[:n])
+            except socket.timeout:
+                raise PeerTimeout(f"Timed out after sending {sent} bytes")
+            socket_io += time.perf_counter() - start
+            sent += n
+            if self.progress:
+                self.progress(n)
+            self._check_throughput(sent, socket_io)
+
+        if timing is not None:
+            timing['file_io_s'] = timing.get('file_io_s', 0.0) + file_io
+        io_stats.record_sent(sent)
+        return sent
+
+    def send_file(self, f, count, use_kernel=True, timing=None):
+        """
+        Send count bytes of f starting at its current position
+
+        Uses os.sendfile() when the socket allows it, so the data never passes
+        through userspace. Falls back to send_from_file() if the kernel path is
+        unavailable or fails, resuming from wherever the kernel stopped.
+
+        Returns:
+            Number of bytes sent
+        """
+        sent = 0
+        if use_kernel and kernel_send_possible(self.sock):
+            offset = f.tell()
+            sent = self._kernel_sendfile(f.fileno(), offset, count)
+            io_stats.record_sent(sent)
+            f.seek(offset + sent)
+
+        if sent < count:
+            sent += self.send_from_file(f, count - sent, timing)
+        return sent
+
+    def _kernel_sendfile(self, in_fd, offset, count):
+        sock = self.sock
+        out_fd = sock.fileno()
+        timeout = sock.gettimeout()
+        # Shaped transfers go out in buffer-sized slices so the scheduler can interleave them
+        chunk = len(self.buf) if self.throttle else SENDFILE_CHUNK
+        sent = 0
+        pending = 0
+        socket_io = 0.0
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(out_fd, selectors.EVENT_WRITE)
+            while sent < count:
+                want = min(count - sent, chunk)
+                # A partial send leaves credit for the rest of the slice
+                if self.throttle and pending < want:
+                    self.throttle(want - pending)
+                    pending = want
+                start = time.perf_counter()
+                try:
+                    n = os.sendfile(out_fd, in_fd, offset + sent, want)
+                except BlockingIOError:
+                    # Sockets with a timeout are non-blocking at the fd level
+                    ready = selector.select(timeout)
+                    socket_io += time.perf_counter() - start
+                    if not ready:
+                        raise PeerTimeout(f"Timed out after sending {sent} bytes")
+                    self._check_throughput(sent, socket_io)
+                    continue
+                except ConnectionError:
+                    raise
+                except OSError as e:
+                    # e.g. EINVAL/ENOTSUP for files or sockets sendfile can't handle
+                    print(f"sendfile unavailable, falling back to buffered send: {e}")
+                    break
+                socket_io += time.perf_counter() - start
+                if n == 0:
+                    break
+                sent += n
+                pending = max(0, pending - n)
+                if self.progress:
+                    self.progress(n)
+                self._check_throughput(sent, socket_io)
+        return sent
+
+    def _check_throughput(self, nbytes, seconds):
+        if self.min_throughput and seconds > THROUGHPUT_GRACE and nbytes / seconds < self.min_throughput:
+            raise SlowPeerError(f"Peer too slow: {nbytes / seconds:.0f} B/s over {seconds:.1f}s "
+                                f"(minimum {self.min_throughput} B/s)")
@@ -0,0 +1,255 @@
+import json
+import time
+import base64
+import calendar
+import sqlite3
+import threading
+
+# Fields of a catalog record, in table column order
+FIELDS = ('id', 'name', 'size', 'stored_size', 'checksum', 'stored_checksum',
+          'checksum_algorithm', 'codec', 'created', 'owner')
+
+# Sort keys accepted by query(); objects imported without a plaintext size sort by their stored size
+SORT_KEYS = {
+    'created': 'created',
+    'name': 'name',
+    'size': 'COALESCE(size, stored_size, 0)'
+}
+
+TIME_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d')
+
+
+def parse_time(value):
+    """
+    Epoch seconds from a number or a UTC ISO 8601 date/time
+    ('2024-05-01', '2024-05-01T12:00:00Z'; fractions and offsets are ignored)
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        text = value.strip().rstrip('Z')[:19]
+        for fmt in TIME_FORMATS:
+            try:
+                return float(calendar.timegm(time.strptime(text, fmt)))
+            except ValueError:
+                continue
+    raise ValueError(f"Invalid time: {value!r}")
+
+
+def encode_cursor(values):
+    """Opaque pagination cursor for the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != 3:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+class Catalog:
+    """
+    Server-side metadata index of stored objects
+
+    One row per object: ID, original name, plaintext and stored sizes and
+    checksums, checksum algorithm, codec (cipher, or 'plain' for local
+    storage), creation time and owner (client IP). Rows are written in the
+    same step as the storage upload and removed on delete, so list, stat and
+    search are answered from SQLite indexes without calling the storage
+    backend, and downloads reuse the stored checksum instead of rehashing.
+
+    Pages use keyset pagination: the cursor encodes the sort key of the last
+    row returned, so fetching page N costs the same as fetching page 1.
+
+    Changes are reported to on_change, if set, as
+    on_change(event_type, record) with event_type 'created', 'updated' or
+    'deleted', or on_change('resync', None) after a bulk import. It is
+    called after the change commits but before the lock is released, so
+    changes are reported in commit order; it must not use the catalog.
+
+    Args:
+        path: SQLite database file
+    """
+    def __init__(self, path):
+        self.path = path
+        # Written on every commit; syncing it makes committed transactions durable
+        self.wal_path = path + '-wal'
+        self.lock = threading.Lock()
+        self.on_change = None
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.execute('''CREATE TABLE IF NOT EXISTS objects (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                size INTEGER,
+                stored_size INTEGER,
+                checksum TEXT,
+                stored_checksum TEXT,
+                checksum_algorithm TEXT,
+                codec TEXT,
+                created REAL NOT NULL,
+                owner TEXT
+            )''')
+            self.db.execute('CREATE INDEX IF NOT EXISTS objects_created ON objects (created, id)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS objects_name ON objects (name, id)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS objects_owner ON objects (owner, created, id)')
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS objects_size ON objects ({SORT_KEYS["size"]}, id)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+
+    def add(self, record):
+        """
+        Insert or replace the record for record['id']
+
+        Returns:
+            The record replaced, or None
+        """
+        record = dict(record)
+        record.setdefault('created', time.time())
+        with self.lock:
+            with self.db:
+                existed = self.db.execute(f'SELECT {", ".join(FIELDS)} FROM objects WHERE id = ?',
+                                          (record['id'],)).fetchone()
+                self.db.execute(f'INSERT OR REPLACE INTO objects VALUES ({", ".join("?" * len(FIELDS))})',
+                                [record.get(field) for field in FIELDS])
+            if self.on_change:
+                self.on_change('updated' if existed else 'created', {field: record.get(field) for field in FIELDS})
+        return dict(zip(FIELDS, existed)) if existed else None
+
+    def add_many(self, records):
+        """Insert many records in one transaction"""
+        now = time.time()
+        rows = [[dict(r, created=r.get('created') or now).get(field) for field in FIELDS] for r in records]
+        with self.lock:
+            with self.db:
+                self.db.executemany(f'INSERT OR REPLACE INTO objects VALUES ({", ".join("?" * len(FIELDS))})', rows)
+            if self.on_change:
+                self.on_change('resync', None)
+
+    def remove(self, object_id):
+        """Delete the record for object_id; returns the record removed, or None"""
+        with self.lock:
+            with self.db:
+                row = self.db.execute(f'SELECT {", ".join(FIELDS)} FROM objects WHERE id = ?', (object_id,)).fetchone()
+                if row is None:
+                    return None
+                self.db.execute('DELETE FROM objects WHERE id = ?', (object_id,))
+            record = dict(zip(FIELDS, row))
+            if self.on_change:
+                self.on_change('deleted', record)
+        return record
+
+    def get(self, object_id):
+        """Record for object_id as a dict, or None"""
+        with self.lock:
+            row = self.db.execute(f'SELECT {", ".join(FIELDS)} FROM objects WHERE id = ?', (object_id,)).fetchone()
+        return dict(zip(FIELDS, row)) if row else None
+
+    def references(self):
+        """Number of local ('plain') objects with each (checksum_algorithm, stored_checksum)"""
+        with self.lock:
+            rows = self.db.execute("SELECT checksum_algorithm, stored_checksum, COUNT(*) FROM objects "
+                                   "WHERE codec = 'plain' AND stored_checksum IS NOT NULL GROUP BY 1, 2").fetchall()
+        return {(algorithm, checksum): count for algorithm, checksum, count in rows}
+
+    def count(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM objects').fetchone()[0]
+
+    def query(self, prefix=None, glob=None, contains=None, owner=None, min_size=None, max_size=None,
+              created_after=None, created_before=None, sort='created', limit=None, cursor=None):
+        """
+        Records matching all the given filters, in sort order
+
+        Args:
+            prefix: Name starts with (uses the name index)
+            glob: Name matches a shell pattern (*, ?, [...]; case-sensitive)
+            contains: Name contains (case-insensitive scan)
+            owner: Only objects uploaded by this client
+            min_size, max_size: Inclusive size range in bytes
+            created_after, created_before: Creation time range (epoch seconds
+                or ISO 8601, see parse_time); after is inclusive, before is not
+            sort: 'created', 'name' or 'size', prefixed with '-' for descending
+            limit: Page size (None: all remaining rows)
+            cursor: next_cursor from the previous page (with the same sort)
+
+        Returns:
+            (records, next_cursor); next_cursor is None on the last page
+
+        Raises:
+            ValueError: Unknown sort key, bad time or a cursor from another sort
+        """
+        descending = sort.startswith('-')
+        key = sort.lstrip('-')
+        if key not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {key}")
+        column = SORT_KEYS[key]
+
+        where, params = [], []
+        if prefix:
+            # Range scan instead of LIKE, so the name index applies
+            where.append('name >= ? AND name < ?')
+            params += [prefix, prefix + '\U0010ffff']
+        if glob:
+            where.append('name GLOB ?')
+            params.append(glob)
+        if contains:
+            where.append("name LIKE ? ESCAPE '\\'")
+            params.append('%' + contains.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if owner:
+            where.append('owner = ?')
+            params.append(owner)
+        if min_size is not None:
+            where.append(f'{SORT_KEYS["size"]} >= ?')
+            params.append(int(min_size))
+        if max_size is not None:
+            where.append(f'{SORT_KEYS["size"]} <= ?')
+            params.append(int(max_size))
+        if created_after is not None:
+            where.append('created >= ?')
+            params.append(parse_time(created_after))
+        if created_before is not None:
+            where.append('created < ?')
+            params.append(parse_time(created_before))
+        if cursor:
+            cursor_sort, last_value, last_id = decode_cursor(cursor)
+            if cursor_sort != sort:
+                raise ValueError("Cursor belongs to a different sort order")
+            where.append(f'({column}, id) {"<" if descending else ">"} (?, ?)')
+            params += [last_value, last_id]
+
+        order = ' DESC' if descending else ''
+        sql = f'SELECT {", ".join(FIELDS)}, {column} FROM objects'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += f' ORDER BY {column}{order}, id{order}'
+        if limit:
+            sql += ' LIMIT ?'
+            # One extra row tells whether another page follows
+            params.append(limit + 1)
+
+        with self.lock:
+            rows = self.db.execute(sql, params).fetchall()
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([sort, rows[-1][-1], rows[-1][0]])
+        return [dict(zip(FIELDS, row)) for row in rows], next_cursor
+
+    def get_meta(self, name):
+        with self.lock:
+            row = self.db.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name, value):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (name, value))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
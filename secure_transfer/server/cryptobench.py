@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Microbenchmarks for the encryption and checksum code paths
+
+Measures throughput of every cipher mode / backend / chunk size combination
+available on this machine, and of each checksum algorithm reading a file in
+different chunk sizes. select_config() runs a short version of the same
+measurements so the server can pick the fastest acceptable configuration at
+startup (cipher='auto' / checksum='auto').
+
+Usage:
+    python cryptobench.py [--size 64M] [--json]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+
+from encryption import (CIPHERS, BACKENDS, DEFAULT_CHUNK_SIZE, available_backends, available_hashes,
+                        new_hash, file_checksum, _new_stream)
+
+CHUNK_SIZES = (8 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024)
+
+# What auto mode may choose from. Only authenticated modes are considered, and
+# only checksums every client can verify with hashlib.
+AUTO_CIPHERS = ('aes-256-gcm', 'chacha20-poly1305')
+AUTO_HASHES = ('sha256', 'blake2b')
+
+
+def _throughput(nbytes, seconds):
+    return nbytes / (1 << 20) / seconds if seconds > 0 else float('inf')
+
+
+def bench_cipher(cipher, backend, chunk_size, data, repeat=3):
+    """
+    Encrypt data in chunk_size pieces and return the best throughput in MB/s
+
+    Each repetition uses a fresh stream, exactly like encrypt_file() does.
+    """
+    key = os.urandom(32)
+    nonce = os.urandom(CIPHERS[cipher]['nonce_size'])
+    view = memoryview(data)
+    best = None
+
+    for _ in range(repeat):
+        stream = _new_stream(backend, cipher, key, nonce, encrypting=True)
+        start = time.perf_counter()
+        for offset in range(0, len(data), chunk_size):
+            stream.update(view[offset:offset + chunk_size])
+        stream.finalize()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return _throughput(len(data), best)
+
+
+def bench_hash(algorithm, chunk_size, file_path, file_size, repeat=3):
+    """Checksum a file read in chunk_size pieces and return the best MB/s"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        file_checksum(file_path, algorithm, chunk_size)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return _throughput(file_size, best)
+
+
+def run_all(size=64 * 1024 * 1024, chunk_sizes=CHUNK_SIZES, repeat=3):
+    """
+    Measure every available cipher/backend/chunk size and hash/chunk size
+
+    Returns:
+        Dict with 'ciphers' and 'hashes' lists of measurements
+    """
+    data = os.urandom(size)
+    results = {'ciphers': [], 'hashes': []}
+
+    for backend in available_backends():
+        for cipher in BACKENDS[backend]:
+            for chunk_size in chunk_sizes:
+                results['ciphers'].append({
+                    'cipher': cipher,
+                    'backend': backend,
+                    'chunk_size': chunk_size,
+                    'mb_s': round(bench_cipher(cipher, backend, chunk_size, data, repeat), 1)
+                })
+
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        f.write(data)
+        path = f.name
+    try:
+        for algorithm in available_hashes():
+            for chunk_size in chunk_sizes:
+                results['hashes'].append({
+                    'hash': algorithm,
+                    'chunk_size': chunk_size,
+                    'mb_s': round(bench_hash(algorithm, chunk_size, path, size, repeat), 1)
+                })
+    finally:
+        os.remove(path)
+
+    return results
+
+
+def select_config(cipher='auto', checksum='auto', backend='auto', chunk_size=None,
+                  sample_size=8 * 1024 * 1024, auto_ciphers=AUTO_CIPHERS, auto_hashes=AUTO_HASHES):
+    """
+    Resolve 'auto' settings by benchmarking the candidates on this machine
+
+    Explicit values are kept as they are. With everything on auto this takes
+    well under a second on a typical host.
+
+    Returns:
+        Dict with cipher, backend, chunk_size and hash
+    """
+    data = os.urandom(sample_size)
+    backends = available_backends() if backend == 'auto' else [backend]
+    ciphers = list(auto_ciphers) if cipher == 'auto' else [cipher]
+
+    # Pick cipher and backend at the default chunk size, then tune the chunk size
+    probe_chunk = chunk_size or DEFAULT_CHUNK_SIZE
+    candidates = [(c, b) for c in ciphers for b in backends if c in BACKENDS[b]]
+    if not candidates:
+        raise ValueError(f"No available backend supports {cipher}")
+    if len(candidates) == 1:
+        best_cipher, best_backend = candidates[0]
+    else:
+        best_cipher, best_backend = max(
+            candidates, key=lambda cb: bench_cipher(cb[0], cb[1], probe_chunk, data, repeat=2))
+
+    if chunk_size is None:
+        chunk_size = max(CHUNK_SIZES[1:],
+                         key=lambda cs: bench_cipher(best_cipher, best_backend, cs, data, repeat=2))
+
+    if checksum == 'auto':
+        hashes = [h for h in auto_hashes if h in available_hashes()]
+        checksum = max(hashes, key=lambda h: _bench_hash_memory(h, data))
+
+    return {'cipher': best_cipher, 'backend': best_backend, 'chunk_size': chunk_size, 'hash': checksum}
+
+
+def _bench_hash_memory(algorithm, data, repeat=2):
+    best = None
+    for _ in range(repeat):
+        digest = new_hash(algorithm)
+        start = time.perf_counter()
+        digest.update(data)
+        digest.hexdigest()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return _throughput(len(data), best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ciphers and checksums')
+    parser.add_argument('--size', default='64M', help='Amount of data per measurement (e.g. 16M, 1G)')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions per measurement (best is kept)')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable JSON')
+    args = parser.parse_args()
+
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    size_text = args.size.upper()
+    size = int(float(size_text[:-1]) * units[size_text[-1]]) if size_text[-1] in units else int(size_text)
+
+    results = run_all(size, repeat=args.repeat)
+    results['auto'] = select_config()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'cipher':<20}{'backend':<15}{'chunk':>10}{'MB/s':>10}")
+    for r in sorted(results['ciphers'], key=lambda r: -r['mb_s']):
+        print(f"{r['cipher']:<20}{r['backend']:<15}{r['chunk_size']:>10}{r['mb_s']:>10}")
+    print()
+    print(f"{'hash':<20}{'chunk':>10}{'MB/s':>10}")
+    for r in sorted(results['hashes'], key=lambda r: -r['mb_s']):
+        print(f"{r['hash']:<20}{r['chunk_size']:>10}{r['mb_s']:>10}")
+    print()
+    print(f"auto selection: {results['auto']}")
+
+
+if __name__ == "__main__":
+    main()
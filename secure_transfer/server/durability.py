@@ -0,0 +1,163 @@
+import os
+import time
+import ctypes
+import ctypes.util
+import threading
+
+POLICIES = ('none', 'fsync', 'group')
+DEFAULT_POLICY = 'none'
+
+# Seconds a group commit waits for more writers before flushing
+DEFAULT_GROUP_WINDOW = 0.002
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+    # syncfs(2) (Linux): flush every dirty file of one filesystem in one call
+    _syncfs = _libc.syncfs
+    _syncfs.argtypes = [ctypes.c_int]
+except (OSError, AttributeError):
+    _syncfs = None
+
+
+def fsync_path(path):
+    """fsync a file or directory by path"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def syncfs(path):
+    """Flush the whole filesystem holding path (requires syncfs)"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if _syncfs(fd) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+    finally:
+        os.close(fd)
+
+
+class Batch:
+    """Paths waiting for one group commit"""
+    def __init__(self):
+        self.paths = set()
+        self.done = False
+        self.error = None
+
+
+class Durability:
+    """
+    How received files are made durable before an upload is acknowledged
+
+    'none' leaves flushing to the OS: fastest, but an acknowledged upload
+    can be lost or truncated by a power failure. 'fsync' syncs each file
+    and directory entry as soon as it is written, so every upload pays for
+    its own disk flushes. 'group' makes concurrent uploads share them: the
+    first writer to ask waits group_window seconds for others to join,
+    then flushes the whole group with one syncfs() (or one fsync per
+    path where syncfs is unavailable) and wakes them all.
+
+    Args:
+        policy: One of POLICIES
+        group_window: Seconds a group commit waits for more writers
+    """
+    def __init__(self, policy=DEFAULT_POLICY, group_window=DEFAULT_GROUP_WINDOW):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown durability policy: {policy} (known: {', '.join(POLICIES)})")
+        self.policy = policy
+        self.group_window = group_window
+        self.cond = threading.Condition()
+        self.batch = Batch()
+        self.flushing = False
+        self.counts = {'commits': 0, 'flushes': 0, 'paths': 0, 'flush_s': 0.0}
+
+    @property
+    def enabled(self):
+        return self.policy != 'none'
+
+    def commit(self, *paths):
+        """
+        Make the given files and directories durable (according to the policy)
+
+        Directories make the entries created in them durable, e.g. a file
+        renamed into place.
+        """
+        paths = [path for path in paths if path]
+        if not self.enabled or not paths:
+            return
+        if self.policy == 'fsync':
+            self.flush(paths)
+            with self.cond:
+                self.counts['commits'] += 1
+            return
+
+        with self.cond:
+            self.counts['commits'] += 1
+            batch = self.batch
+            batch.paths.update(paths)
+            while not batch.done:
+                if not self.flushing:
+                    self.flushing = True
+                    break
+                self.cond.wait()
+            else:
+                if batch.error:
+                    raise batch.error
+                return
+
+        # This writer leads the group: give concurrent writers time to join it
+        if self.group_window:
+            time.sleep(self.group_window)
+        with self.cond:
+            batch = self.batch
+            self.batch = Batch()
+        try:
+            self.flush(sorted(batch.paths), group=True)
+        except OSError as e:
+            batch.error = e
+        with self.cond:
+            batch.done = True
+            self.flushing = False
+            self.cond.notify_all()
+        if batch.error:
+            raise batch.error
+
+    def makedirs(self, path):
+        """os.makedirs(path, exist_ok=True), making each directory created durable under the policy"""
+        if os.path.isdir(path):
+            return
+        parent = os.path.dirname(path)
+        self.makedirs(parent)
+        try:
+            os.mkdir(path)
+        except FileExistsError:
+            return
+        if self.enabled:
+            # Rare (a directory is only created once), so not worth grouping
+            fsync_path(parent)
+
+    def flush(self, paths, group=False):
+        start = time.perf_counter()
+        if group and _syncfs is not None:
+            # One call per filesystem (the catalog may live on another one)
+            filesystems = {}
+            for path in paths:
+                filesystems.setdefault(os.stat(path).st_dev, path)
+            for path in filesystems.values():
+                syncfs(path)
+        else:
+            for path in paths:
+                fsync_path(path)
+        with self.cond:
+            self.counts['flushes'] += 1
+            self.counts['paths'] += len(paths)
+            self.counts['flush_s'] += time.perf_counter() - start
+
+    def stats(self):
+        with self.cond:
+            stats = dict(self.counts)
+        stats['policy'] = self.policy
+        stats['commits_per_flush'] = stats['commits'] / stats['flushes'] if stats['flushes'] else None
+        return stats
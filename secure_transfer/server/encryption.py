@@ -1,11 +1,247 @@
-from Crypto.Cipher import AES
+from Crypto.Cipher import AES, ChaCha20_Poly1305
 from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import pad, unpad
 import os
+import struct
 import hashlib
 
+# Optional alternative crypto backend (OpenSSL via the cryptography package)
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.exceptions import InvalidTag
+except ImportError:
+    Cipher = None
+
+# Optional BLAKE3 checksums
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# Supported cipher modes. The id is what gets written to the file header.
+CIPHERS = {
+    'aes-256-cbc': {'id': 1, 'nonce_size': 16, 'tag_size': 0},
+    'aes-256-ctr': {'id': 2, 'nonce_size': 16, 'tag_size': 0},
+    'aes-256-gcm': {'id': 3, 'nonce_size': 12, 'tag_size': 16},
+    'chacha20-poly1305': {'id': 4, 'nonce_size': 12, 'tag_size': 16},
+}
+
+# Supported checksum algorithms, also recorded in the file header
+HASHES = {
+    'sha256': 1,
+    'blake2b': 2,
+    'blake3': 3,
+}
+
+# Cipher modes each backend can stream
+BACKENDS = {
+    'pycryptodome': ('aes-256-cbc', 'aes-256-ctr', 'aes-256-gcm', 'chacha20-poly1305'),
+    'cryptography': ('aes-256-cbc', 'aes-256-ctr', 'aes-256-gcm'),
+}
+
+DEFAULT_CIPHER = 'aes-256-cbc'
+DEFAULT_HASH = 'sha256'
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Stored file layout: MAGIC | version | cipher id | hash id | nonce length | nonce | ciphertext | tag
+# Files without the magic are the original format: 16-byte IV followed by AES-256-CBC ciphertext.
+MAGIC = b'SFTE'
+FORMAT_VERSION = 1
+HEADER_FORMAT = '>4sBBBB'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+def available_hashes():
+    """Return the checksum algorithms usable on this machine"""
+    return [name for name in HASHES if name != 'blake3' or blake3 is not None]
+
+
+def available_backends():
+    """Return the crypto backends usable on this machine"""
+    return [name for name in BACKENDS if name != 'cryptography' or Cipher is not None]
+
+
+def new_hash(algorithm=DEFAULT_HASH):
+    """Create a hash object with update()/hexdigest() for the given algorithm"""
+    if algorithm == 'sha256':
+        return hashlib.sha256()
+    if algorithm == 'blake2b':
+        return hashlib.blake2b()
+    if algorithm == 'blake3':
+        if blake3 is None:
+            raise ValueError("blake3 checksums require the blake3 package")
+        return blake3.blake3()
+    raise ValueError(f"Unsupported checksum algorithm: {algorithm}")
+
+
+def file_checksum(file_path, algorithm=DEFAULT_HASH, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Calculate the checksum of a file, reading it in chunk_size pieces"""
+    digest = new_hash(algorithm)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(file_path, 'rb') as f:
+        while n := f.readinto(buf):
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def read_header(input_file_path):
+    """
+    Read the format header of an encrypted file
+
+    Returns:
+        Dict with cipher, hash, nonce and header_size. Files in the original
+        format are reported as aes-256-cbc/sha256.
+    """
+    with open(input_file_path, 'rb') as f:
+        return _read_header(f)
+
+
+def _read_header(f):
+    start = f.read(HEADER_SIZE)
+    if len(start) == HEADER_SIZE:
+        magic, version, cipher_id, hash_id, nonce_len = struct.unpack(HEADER_FORMAT, start)
+        if magic == MAGIC and version == FORMAT_VERSION:
+            cipher = next((name for name, info in CIPHERS.items() if info['id'] == cipher_id), None)
+            hash_name = next((name for name, hid in HASHES.items() if hid == hash_id), None)
+            if cipher is None or hash_name is None:
+                raise ValueError("Encrypted file uses an unknown cipher or checksum")
+            nonce = f.read(nonce_len)
+            return {'cipher': cipher, 'hash': hash_name, 'nonce': nonce,
+                    'header_size': HEADER_SIZE + nonce_len}
+
+    # Original format
+    f.seek(0)
+    return {'cipher': 'aes-256-cbc', 'hash': 'sha256', 'nonce': f.read(16), 'header_size': 16}
+
+
+class _CryptodomeStream:
+    """Incremental encrypt/decrypt using pycryptodome"""
+    def __init__(self, cipher, key, nonce, encrypting, tag=None):
+        self.cipher_name = cipher
+        self.encrypting = encrypting
+        self.tag = tag
+        self.pending = b''
+
+        if cipher == 'aes-256-cbc':
+            self.cipher = AES.new(key, AES.MODE_CBC, nonce)
+        elif cipher == 'aes-256-ctr':
+            self.cipher = AES.new(key, AES.MODE_CTR, nonce=b'', initial_value=nonce)
+        elif cipher == 'aes-256-gcm':
+            self.cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        elif cipher == 'chacha20-poly1305':
+            self.cipher = ChaCha20_Poly1305.new(key=key, nonce=nonce)
+        else:
+            raise ValueError(f"Unsupported cipher: {cipher}")
+
+    def update(self, data):
+        if self.cipher_name != 'aes-256-cbc':
+            return self.cipher.encrypt(data) if self.encrypting else self.cipher.decrypt(data)
+
+        # CBC works on whole blocks; when decrypting, keep the last block back for unpadding
+        if self.pending:
+            data = self.pending + bytes(data)
+        if self.encrypting:
+            usable = len(data) - len(data) % AES.block_size
+        else:
+            usable = max(0, (len(data) - 1) // AES.block_size * AES.block_size)
+        self.pending = bytes(data[usable:])
+        if not usable:
+            return b''
+        block = data[:usable]
+        return self.cipher.encrypt(block) if self.encrypting else self.cipher.decrypt(block)
+
+    def finalize(self):
+        if self.cipher_name == 'aes-256-cbc':
+            if self.encrypting:
+                return self.cipher.encrypt(pad(self.pending, AES.block_size))
+            return unpad(self.cipher.decrypt(self.pending), AES.block_size)
+        if self.cipher_name == 'aes-256-ctr':
+            return b''
+        if self.encrypting:
+            self.tag = self.cipher.digest()
+        else:
+            self.cipher.verify(self.tag)
+        return b''
+
+
+class _CryptographyStream:
+    """Incremental encrypt/decrypt using the cryptography package (OpenSSL)"""
+    def __init__(self, cipher, key, nonce, encrypting, tag=None):
+        if Cipher is None:
+            raise ValueError("The cryptography backend is not installed")
+        if cipher == 'aes-256-cbc':
+            mode = modes.CBC(nonce)
+        elif cipher == 'aes-256-ctr':
+            mode = modes.CTR(nonce)
+        elif cipher == 'aes-256-gcm':
+            mode = modes.GCM(nonce) if encrypting else modes.GCM(nonce, tag)
+        else:
+            raise ValueError(f"Cipher {cipher} is not supported by the cryptography backend")
+
+        self.cipher_name = cipher
+        self.encrypting = encrypting
+        self.tag = tag
+        self.pending = b''
+        context = Cipher(algorithms.AES(key), mode)
+        self.context = context.encryptor() if encrypting else context.decryptor()
+
+    def update(self, data):
+        if self.cipher_name != 'aes-256-cbc':
+            return self.context.update(data)
+
+        if self.encrypting:
+            # Padding is applied in finalize(), so only feed whole blocks here
+            if self.pending:
+                data = self.pending + bytes(data)
+            usable = len(data) - len(data) % AES.block_size
+            self.pending = bytes(data[usable:])
+            return self.context.update(data[:usable]) if usable else b''
+
+        # Hold back the last plaintext block so padding can be removed in finalize()
+        out = self.pending + self.context.update(data)
+        self.pending = out[-AES.block_size:]
+        return out[:-AES.block_size]
+
+    def finalize(self):
+        if self.cipher_name == 'aes-256-cbc':
+            if self.encrypting:
+                return self.context.update(pad(self.pending, AES.block_size)) + self.context.finalize()
+            return unpad(self.pending + self.context.finalize(), AES.block_size)
+
+        try:
+            out = self.context.finalize()
+        except InvalidTag:
+            raise ValueError("MAC check failed")
+        if self.encrypting and self.cipher_name == 'aes-256-gcm':
+            self.tag = self.context.tag
+        return out
+
+
+def _new_stream(backend, cipher, key, nonce, encrypting, tag=None):
+    if backend == 'pycryptodome':
+        return _CryptodomeStream(cipher, key, nonce, encrypting, tag)
+    if backend == 'cryptography':
+        return _CryptographyStream(cipher, key, nonce, encrypting, tag)
+    raise ValueError(f"Unknown crypto backend: {backend}")
+
+
 class FileEncryptor:
-    def __init__(self, key=None):
+    def __init__(self, key=None, cipher=DEFAULT_CIPHER, hash_algorithm=DEFAULT_HASH,
+                 chunk_size=DEFAULT_CHUNK_SIZE, backend='pycryptodome'):
+        if cipher not in CIPHERS:
+            raise ValueError(f"Unsupported cipher: {cipher}")
+        if hash_algorithm not in HASHES:
+            raise ValueError(f"Unsupported checksum algorithm: {hash_algorithm}")
+        if cipher not in BACKENDS.get(backend, ()):
+            raise ValueError(f"Backend {backend} does not support {cipher}")
+
+        self.cipher = cipher
+        self.hash_algorithm = hash_algorithm
+        self.chunk_size = chunk_size
+        self.backend = backend
+        self.last_header = None
+
         # If no key is provided, generate a random one
         if key is None:
             self.key = get_random_bytes(32)  # 256-bit key for AES-256
@@ -31,67 +267,77 @@ class FileEncryptor:
                     self.key = key
             else:
                 raise ValueError("Key must be a string, hex string, or bytes")
-    
+
     def get_key(self):
         """Get the encryption key in bytes"""
         return self.key
-    
+
     def get_key_hex(self):
         """Get the encryption key as a hex string"""
         return ''.join(f'{b:02x}' for b in self.key)
-    
-    def encrypt_file(self, input_file_path, output_file_path=None):
+
+    def encrypt_file(self, input_file_path, output_file_path=None, output_hash=None):
         """
-        Encrypt a file using AES-256-CBC
-        
+        Encrypt a file with the configured cipher, streaming it in chunks
+
         Args:
             input_file_path: Path to the file to encrypt
             output_file_path: Path where to save the encrypted file (default: input_file_path + '.enc')
-            
+            output_hash: Optional hash object (see new_hash) updated with every byte
+                written, so the encrypted file's checksum needs no second read
+
         Returns:
             Path to the encrypted file
         """
         if output_file_path is None:
             output_file_path = input_file_path + '.enc'
-        
-        # Generate a random IV (Initialization Vector)
-        iv = get_random_bytes(16)
-        
-        # Create cipher object
-        cipher = AES.new(self.key, AES.MODE_CBC, iv)
-        
+
+        info = CIPHERS[self.cipher]
+
+        # Generate a random IV/nonce
+        nonce = get_random_bytes(info['nonce_size'])
+        stream = _new_stream(self.backend, self.cipher, self.key, nonce, encrypting=True)
+
         try:
-            # Read the entire file into memory
-            with open(input_file_path, 'rb') as infile:
-                data = infile.read()
-            
-            # Pad the data
-            padded_data = pad(data, AES.block_size)
-            
-            # Encrypt the data
-            encrypted_data = cipher.encrypt(padded_data)
-            
-            # Write IV and encrypted data
-            with open(output_file_path, 'wb') as outfile:
-                outfile.write(iv)
-                outfile.write(encrypted_data)
-            
+            buf = bytearray(self.chunk_size)
+            view = memoryview(buf)
+
+            with open(input_file_path, 'rb') as infile, open(output_file_path, 'wb') as outfile:
+                if output_hash is None:
+                    write = outfile.write
+                else:
+                    def write(data):
+                        output_hash.update(data)
+                        outfile.write(data)
+
+                # The header records the cipher and checksum so downloads can decode it
+                write(struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, info['id'],
+                                  HASHES[self.hash_algorithm], len(nonce)))
+                write(nonce)
+
+                while n := infile.readinto(buf):
+                    write(stream.update(view[:n]))
+                write(stream.finalize())
+
+                if info['tag_size']:
+                    write(stream.tag)
+
             return output_file_path
-        
+
         except Exception as e:
             if os.path.exists(output_file_path):
                 os.remove(output_file_path)
             raise
-    
+
     def decrypt_file(self, input_file_path, output_file_path=None):
         """
-        Decrypt a file using AES-256-CBC
-        
+        Decrypt a file written by encrypt_file (any supported cipher or the original format)
+
         Args:
             input_file_path: Path to the encrypted file
             output_file_path: Path where to save the decrypted file
                             (default: remove .enc extension if present or add .dec)
-            
+
         Returns:
             Path to the decrypted file
         """
@@ -103,28 +349,40 @@ class FileEncryptor:
                 output_path = input_file_path + '.dec'
         else:
             output_path = output_file_path
-        
+
         try:
-            # Read the entire file
             with open(input_file_path, 'rb') as infile:
-                # Read the IV from the beginning of the file
-                iv = infile.read(16)
-                # Read the rest of the file
-                encrypted_data = infile.read()
-            
-            # Create cipher object for decryption
-            cipher = AES.new(self.key, AES.MODE_CBC, iv)
-            
-            # Decrypt and unpad the data
-            decrypted_data = unpad(cipher.decrypt(encrypted_data), AES.block_size)
-            
-            # Write the decrypted data
-            with open(output_path, 'wb') as outfile:
-                outfile.write(decrypted_data)
-            
+                header = _read_header(infile)
+                self.last_header = header
+                cipher = header['cipher']
+                tag_size = CIPHERS[cipher]['tag_size']
+
+                # AEAD tags sit at the end of the file
+                file_size = os.fstat(infile.fileno()).st_size
+                remaining = file_size - header['header_size'] - tag_size
+                if remaining < 0:
+                    raise ValueError("Encrypted file is truncated")
+                tag = None
+                if tag_size:
+                    infile.seek(file_size - tag_size)
+                    tag = infile.read(tag_size)
+                    infile.seek(header['header_size'])
+
+                backend = self.backend if cipher in BACKENDS.get(self.backend, ()) else 'pycryptodome'
+                stream = _new_stream(backend, cipher, self.key, header['nonce'], encrypting=False, tag=tag)
+
+                with open(output_path, 'wb') as outfile:
+                    while remaining:
+                        chunk = infile.read(min(self.chunk_size, remaining))
+                        if not chunk:
+                            raise ValueError("Encrypted file is truncated")
+                        outfile.write(stream.update(chunk))
+                        remaining -= len(chunk)
+                    outfile.write(stream.finalize())
+
             return output_path
-        
+
         except Exception as e:
             if os.path.exists(output_path):
                 os.remove(output_path)
-            raise 
\ No newline at end of file
+            raise
@@ -0,0 +1,123 @@
+import os
+import threading
+from collections import deque
+
+# Events kept for clients that resubscribe with 'since'
+DEFAULT_HISTORY = 10000
+# Undelivered events per subscriber before it is told to resync instead
+DEFAULT_QUEUE_SIZE = 10000
+
+
+class Subscription:
+    """
+    One subscriber's queue of pending events
+
+    A subscriber that falls more than queue_size events behind loses its
+    queue and gets a single 'resync' event, so a stalled client costs a
+    bounded amount of memory.
+    """
+    def __init__(self, hub, queue_size):
+        self.hub = hub
+        self.queue_size = queue_size
+        self.pending = []
+        self.cond = threading.Condition(threading.Lock())
+        self.closed = False
+
+    def push(self, events):
+        with self.cond:
+            if self.pending and self.pending[-1]['type'] == 'resync':
+                return
+            self.pending.extend(events)
+            if len(self.pending) > self.queue_size:
+                self.pending = [{'type': 'resync', 'seq': self.pending[-1]['seq']}]
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Wait for events
+
+        Returns:
+            List of all pending events, oldest first ([] on timeout or close)
+        """
+        with self.cond:
+            if not self.pending and not self.closed:
+                self.cond.wait(timeout)
+            events, self.pending = self.pending, []
+            return events
+
+    def close(self):
+        self.hub.unsubscribe(self)
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+
+class EventHub:
+    """
+    Fan-out of object change events to subscribed connections
+
+    Events are {'type': 'created'|'updated'|'deleted'|'resync', 'seq': n,
+    'file': list entry}. seq increases by one per event; together with
+    epoch (random per server start) it lets a reconnecting client ask for
+    the events it missed instead of listing everything again. When those
+    are no longer in the history, or the server restarted, it gets
+    'resync' and must list again.
+
+    Args:
+        history: Events kept for replay
+        queue_size: Pending events per subscriber before it must resync
+    """
+    def __init__(self, history=DEFAULT_HISTORY, queue_size=DEFAULT_QUEUE_SIZE):
+        self.lock = threading.Lock()
+        self.epoch = os.urandom(8).hex()
+        self.seq = 0
+        self.history = deque(maxlen=history)
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.published = 0
+
+    def publish(self, event_type, file=None):
+        """Record an event and queue it for every subscriber"""
+        with self.lock:
+            self.seq += 1
+            self.published += 1
+            event = {'type': event_type, 'seq': self.seq}
+            if file is not None:
+                event['file'] = file
+            self.history.append(event)
+            for subscription in self.subscribers:
+                subscription.push([event])
+
+    def subscribe(self, since=None, epoch=None):
+        """
+        Start receiving events
+
+        Args:
+            since: Last seq the client has seen, to replay what it missed
+            epoch: The epoch that seq belongs to
+
+        Returns:
+            (Subscription, seq at subscription time, True if the client
+            must list again because the missed events are gone)
+        """
+        subscription = Subscription(self, self.queue_size)
+        with self.lock:
+            resync = False
+            if since is not None:
+                oldest = self.history[0]['seq'] if self.history else self.seq + 1
+                if epoch != self.epoch or since > self.seq or since < oldest - 1:
+                    resync = True
+                else:
+                    missed = [event for event in self.history if event['seq'] > since]
+                    if missed:
+                        subscription.push(missed)
+            self.subscribers.add(subscription)
+            return subscription, self.seq, resync
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def stats(self):
+        with self.lock:
+            return {'subscribers': len(self.subscribers), 'seq': self.seq, 'published': self.published}
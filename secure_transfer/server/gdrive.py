@@ -3,6 +3,7 @@ import pickle
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
 import io
 
@@ -37,13 +38,14 @@ class GoogleDriveAPI:
         # Build the service
         self.service = build('drive', 'v3', credentials=creds)
     
-    def upload_file(self, file_path, folder_id=None):
+    def upload_file(self, file_path, folder_id=None, properties=None):
         """
         Upload a file to Google Drive
         
         Args:
             file_path: Path to the file to upload
             folder_id: ID of the folder to upload to (None for root)
+            properties: Optional dict of appProperties to store with the file
             
         Returns:
             ID of the uploaded file
@@ -57,6 +59,8 @@ class GoogleDriveAPI:
         
         if folder_id:
             file_metadata['parents'] = [folder_id]
+        if properties:
+            file_metadata['appProperties'] = properties
         
         media = MediaFileUpload(file_path, resumable=True)
         
@@ -99,6 +103,57 @@ class GoogleDriveAPI:
         
         return output_path
     
+    def read_chunks(self, file_id, chunk_size=1024 * 1024):
+        """
+        Read a file from Google Drive without saving it
+        
+        Args:
+            file_id: ID of the file to read
+            chunk_size: Bytes fetched per request
+            
+        Returns:
+            Iterator over the file's bytes; each chunk is fetched only when
+            the previous one has been consumed
+            
+        Raises:
+            FileNotFoundError: No file has this ID
+        """
+        if not self.service:
+            self.authenticate()
+        
+        try:
+            self.service.files().get(fileId=file_id, fields='id').execute()
+        except HttpError as e:
+            if e.resp.status == 404:
+                raise FileNotFoundError(f"No file {file_id} in Google Drive")
+            raise
+        
+        request = self.service.files().get_media(fileId=file_id)
+        return self._chunks(request, chunk_size)
+    
+    def _chunks(self, request, chunk_size):
+        buffer = io.BytesIO()
+        downloader = MediaIoBaseDownload(buffer, request, chunksize=chunk_size)
+        done = False
+        while not done:
+            status, done = downloader.next_chunk()
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    def set_properties(self, file_id, properties):
+        """
+        Add or replace appProperties of a file
+        
+        Args:
+            file_id: ID of the file
+            properties: Dict of appProperties
+        """
+        if not self.service:
+            self.authenticate()
+        
+        self.service.files().update(fileId=file_id, body={'appProperties': properties}, fields='id').execute()
+    
     def delete_file(self, file_id):
         """
         Delete a file from Google Drive
@@ -142,10 +197,17 @@ class GoogleDriveAPI:
                 q += " and "
             q += query
         
-        results = self.service.files().list(
-            q=q, 
-            pageSize=100, 
-            fields="nextPageToken, files(id, name, mimeType, createdTime)"
-        ).execute()
-        
-        return results.get('files', []) 
\ No newline at end of file
+        # Drive returns at most pageSize files per call; follow nextPageToken for the rest
+        files = []
+        page_token = None
+        while True:
+            results = self.service.files().list(
+                q=q, 
+                pageSize=1000, 
+                pageToken=page_token,
+                fields="nextPageToken, files(id, name, mimeType, createdTime, size, appProperties)"
+            ).execute()
+            files.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return files
\ No newline at end of file
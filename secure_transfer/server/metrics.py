@@ -0,0 +1,222 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from sub-millisecond control commands to multi-minute transfers
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """
+    Thread-safe counters, gauges and histograms with Prometheus text output
+
+    Every update is a dict lookup and a few additions under one lock, so it is
+    cheap enough to leave on for every request. Label values must come from a
+    small fixed set (command names, storage operations), never from clients.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+        self.started = time.time()
+
+    def describe(self, name, text):
+        """Set the HELP text for a metric"""
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """Set a gauge to an absolute value"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def add_gauge(self, name, delta, **labels):
+        """Move a gauge up or down"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = self.gauges.get(key, 0) + delta
+
+    def observe(self, name, value, **labels):
+        """Record one observation in a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = _Histogram(len(self.buckets) + 1)
+            hist.counts[index] += 1
+            hist.sum += value
+            hist.count += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Context manager that observes the elapsed time of its block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _quantile(self, hist, q):
+        """Estimate a quantile from histogram buckets by linear interpolation"""
+        if not hist.count:
+            return None
+        rank = q * hist.count
+        cumulative = 0
+        lower = 0.0
+        for i, count in enumerate(hist.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if count and cumulative + count >= rank:
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = upper
+        return self.buckets[-1]
+
+    def snapshot(self):
+        """Return all metrics as a JSON-friendly dict (used by the stats command)"""
+        with self.lock:
+            counters = {name + _format_labels(labels): value for (name, labels), value in self.counters.items()}
+            gauges = {name + _format_labels(labels): value for (name, labels), value in self.gauges.items()}
+            histograms = {}
+            for (name, labels), hist in self.histograms.items():
+                histograms[name + _format_labels(labels)] = {
+                    'count': hist.count,
+                    'sum': hist.sum,
+                    'p50': self._quantile(hist, 0.50),
+                    'p90': self._quantile(hist, 0.90),
+                    'p99': self._quantile(hist, 0.99)
+                }
+        return {
+            'uptime_s': time.time() - self.started,
+            'counters': counters,
+            'gauges': gauges,
+            'histograms': histograms
+        }
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for kind, series in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in series}):
+                    if name in self.help:
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (metric, labels), value in sorted(series.items()):
+                        if metric == name:
+                            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+            for name in sorted({name for name, _ in self.histograms}):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), hist in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {hist.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+
+        lines.append(f"sft_uptime_seconds {time.time() - self.started}")
+        return '\n'.join(lines) + '\n'
+
+
+class InstrumentedStorage:
+    """
+    Wraps a storage backend (GoogleDriveAPI or compatible) to time every call
+
+    Records sft_storage_call_duration_seconds and sft_storage_errors_total per
+    operation; everything else is passed through unchanged.
+    """
+    OPERATIONS = {
+        'upload_file': 'upload',
+        'download_file': 'download',
+        'list_files': 'list',
+        'delete_file': 'delete',
+        'set_properties': 'update'
+    }
+
+    def __init__(self, backend, metrics):
+        self.backend = backend
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        operation = self.OPERATIONS.get(name)
+        if operation is None:
+            return attr
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            except Exception:
+                self.metrics.inc('sft_storage_errors_total', operation=operation)
+                raise
+            finally:
+                self.metrics.observe('sft_storage_call_duration_seconds',
+                                     time.perf_counter() - start, operation=operation)
+        return timed
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.server.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the server log
+        pass
+
+
+def start_metrics_server(render, host='127.0.0.1', port=9100):
+    """
+    Serve render() as Prometheus text on http://host:port/metrics in a daemon thread
+
+    Returns:
+        The HTTP server (call shutdown() to stop it)
+    """
+    httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+    httpd.daemon_threads = True
+    httpd.render = render
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd
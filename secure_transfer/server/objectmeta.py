@@ -0,0 +1,119 @@
+import os
+import json
+import base64
+import hashlib
+
+from objectstore import shard_path
+
+# Object metadata kept with the stored bytes, so it survives a lost or rebuilt catalog
+FIELDS = ('size', 'checksum', 'stored_size', 'stored_checksum', 'checksum_algorithm')
+
+# Drive appProperties key for each field. Drive limits a key plus its value to
+# 124 bytes, so keys are short and checksums are stored as base64 digests.
+PROPERTY_KEYS = {
+    'size': 'sft_size',
+    'checksum': 'sft_sum',
+    'stored_size': 'sft_ssize',
+    'stored_checksum': 'sft_ssum',
+    'checksum_algorithm': 'sft_alg'
+}
+
+# Directory in upload_dir holding one sidecar file per local object
+SIDECAR_DIR = '.sft-meta'
+# A sidecar also records what the catalog knows of a local object beyond its bytes
+SIDECAR_FIELDS = ('id', 'name', 'created', 'owner') + FIELDS
+
+
+def to_properties(meta):
+    """Drive appProperties for an object's metadata (fields that are None are left out)"""
+    properties = {}
+    for field, key in PROPERTY_KEYS.items():
+        value = meta.get(field)
+        if value is None:
+            continue
+        if field in ('checksum', 'stored_checksum'):
+            value = base64.urlsafe_b64encode(bytes.fromhex(value)).decode('ascii').rstrip('=')
+        properties[key] = str(value)
+    return properties
+
+
+def from_properties(properties):
+    """Metadata from Drive appProperties written by to_properties(); unknown or bad values are skipped"""
+    meta = {}
+    for field, key in PROPERTY_KEYS.items():
+        value = (properties or {}).get(key)
+        if value is None:
+            continue
+        try:
+            if field in ('size', 'stored_size'):
+                value = int(value)
+            elif field in ('checksum', 'stored_checksum'):
+                value = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).hex()
+        except ValueError:
+            continue
+        meta[field] = value
+    return meta
+
+
+def sidecar_path(upload_dir, object_id):
+    """Sidecar of a local object, sharded by a hash of its ID (see objectstore.shard_path())"""
+    key = hashlib.sha1(object_id.encode('utf-8')).hexdigest()
+    return shard_path(os.path.join(upload_dir, SIDECAR_DIR), key) + '.json'
+
+
+def flat_sidecar_path(upload_dir, name):
+    """Sidecar of a file stored flat in upload_dir, before the object store"""
+    return os.path.join(upload_dir, SIDECAR_DIR, os.path.basename(name) + '.json')
+
+
+def read_sidecar(path):
+    """Metadata in the sidecar file at path, or None"""
+    try:
+        with open(path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return {field: meta.get(field) for field in SIDECAR_FIELDS} if isinstance(meta, dict) else None
+
+
+def write_sidecar(upload_dir, record, durability=None):
+    """
+    Store a local object's record beside it (written to a temporary file, then renamed)
+
+    Returns:
+        The sidecar's path
+    """
+    path = sidecar_path(upload_dir, record['id'])
+    if durability:
+        durability.makedirs(os.path.dirname(path))
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.urandom(4).hex()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({field: record.get(field) for field in SIDECAR_FIELDS}, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def remove_sidecar(upload_dir, object_id):
+    try:
+        os.remove(sidecar_path(upload_dir, object_id))
+    except FileNotFoundError:
+        pass
+
+
+def iter_sidecars(upload_dir):
+    """Yield the metadata of every local object's sidecar"""
+    root = os.path.join(upload_dir, SIDECAR_DIR)
+    if not os.path.isdir(root):
+        return
+    for top in sorted(os.listdir(root)):
+        if len(top) != 2 or not os.path.isdir(os.path.join(root, top)):
+            continue  # Flat sidecars are read when their file is moved into the store
+        for sub in sorted(os.listdir(os.path.join(root, top))):
+            with os.scandir(os.path.join(root, top, sub)) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.json'):
+                        meta = read_sidecar(entry.path)
+                        if meta and meta['id']:
+                            yield meta
@@ -0,0 +1,241 @@
+import os
+import time
+import shutil
+import sqlite3
+import threading
+
+from durability import Durability
+
+# Directory in upload_dir holding the local object store
+OBJECTS_DIR = '.sft-objects'
+
+# Seconds a blob is kept after its last reference goes, so a download that
+# looked it up just before still finds it; and the collector's interval
+DEFAULT_GC_GRACE = 60.0
+DEFAULT_GC_INTERVAL = 60.0
+# Blobs removed per collector transaction
+GC_BATCH = 1000
+
+
+def shard_path(root, key):
+    """
+    root/ab/cd/key for a hex key
+
+    Two levels of 256 directories keep each directory to a few hundred
+    entries at tens of millions of keys, so lookups never search a huge
+    directory.
+    """
+    return os.path.join(root, key[:2], key[2:4], key)
+
+
+def blob_address(algorithm, checksum):
+    """Address of the blob with this checksum"""
+    return f'{algorithm}:{checksum}'
+
+
+class ObjectStore:
+    """
+    Content-addressed store for the bytes of local objects
+
+    Each distinct content is stored once, as a blob named by its checksum
+    under root/<algorithm>/ab/cd/. Blobs are put in place with a rename
+    (or a hard link) of a fully written file, so readers never see a
+    partial blob and two uploads of the same content can't overwrite each
+    other: the second finds the blob already there.
+
+    Every catalog record of a local object holds one reference to its blob;
+    put() adds a reference and release() drops one. Blobs left without
+    references are deleted by collect(), run periodically by the collector
+    thread once they have been unreferenced for gc_grace seconds.
+    Reference counts live in SQLite (root/index.db); after an unclean
+    shutdown they may be off by the objects being written at the time, so
+    needs_reconcile is set and the owner recounts them with reconcile().
+
+    A blob's data is made durable (per the durability policy) before it is
+    renamed into place; making the rename itself durable is up to the
+    caller, by committing the blob's directory (see blob_dir()).
+
+    Args:
+        root: Store directory (created if needed); must be on the same
+            filesystem as the files passed to put()
+        gc_grace: Seconds to keep unreferenced blobs
+        gc_interval: Seconds between collector runs
+        durability: Durability policy for blob writes (default: none)
+    """
+    def __init__(self, root, gc_grace=DEFAULT_GC_GRACE, gc_interval=DEFAULT_GC_INTERVAL, durability=None):
+        self.root = root
+        self.durability = durability or Durability()
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.gc_grace = gc_grace
+        self.gc_interval = gc_interval
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.stored = 0
+        self.deduplicated = 0
+        self.collected = 0
+        self.collected_bytes = 0
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, 'index.db'), check_same_thread=False, timeout=10.0)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.execute('''CREATE TABLE IF NOT EXISTS blobs (
+                address TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                refs INTEGER NOT NULL,
+                released REAL
+            )''')
+            self.db.execute('CREATE INDEX IF NOT EXISTS blobs_released ON blobs (released) WHERE refs <= 0')
+            self.db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+            row = self.db.execute("SELECT value FROM meta WHERE name = 'clean'").fetchone()
+            # Cleared while open, set again by close()
+            self.needs_reconcile = row is None or row[0] != '1'
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('clean', '0')")
+
+    def path(self, address):
+        """Path of the blob at address (which may not exist)"""
+        algorithm, checksum = address.split(':', 1)
+        return shard_path(os.path.join(self.root, algorithm), checksum)
+
+    def blob_dir(self, address):
+        return os.path.dirname(self.path(address))
+
+    def put(self, path, algorithm, checksum, keep_source=False):
+        """
+        Store the file at path as the blob for checksum and reference it
+
+        The file is moved into the store, or deleted if the store already
+        has the content. With keep_source it is left in place and the blob
+        is a hard link to it (or a copy).
+
+        Returns:
+            The blob's address
+        """
+        address = blob_address(algorithm, checksum)
+        blob = self.path(address)
+        size = os.path.getsize(path)
+        if not keep_source:
+            # Before the rename, so a blob is never visible with data that may not survive a crash
+            self.durability.commit(path)
+        with self.lock:
+            if os.path.exists(blob):
+                self.deduplicated += 1
+                if not keep_source:
+                    os.remove(path)
+            else:
+                self.stored += 1
+                self.durability.makedirs(os.path.dirname(blob))
+                if not keep_source:
+                    os.replace(path, blob)
+                else:
+                    try:
+                        os.link(path, blob)
+                    except OSError:
+                        tmp_path = os.path.join(self.tmp_dir, f'{checksum}.{os.urandom(4).hex()}')
+                        shutil.copyfile(path, tmp_path)
+                        self.durability.commit(tmp_path)
+                        os.replace(tmp_path, blob)
+            with self.db:
+                self.db.execute('INSERT INTO blobs VALUES (?, ?, 1, NULL) ON CONFLICT (address) '
+                                'DO UPDATE SET refs = MAX(refs, 0) + 1, released = NULL', (address, size))
+        return address
+
+    def release(self, address):
+        """Drop a reference to a blob; it is collected once none are left"""
+        with self.lock, self.db:
+            self.db.execute('UPDATE blobs SET refs = refs - 1, released = CASE WHEN refs <= 1 THEN ? END '
+                            'WHERE address = ?', (time.time(), address))
+
+    def reconcile(self, references):
+        """
+        Set the reference counts to references ({address: count})
+
+        Blobs missing from references are left for collection; referenced
+        blobs missing from the index are added if their file exists.
+        """
+        now = time.time()
+        rows = []
+        for address, refs in references.items():
+            try:
+                rows.append((address, os.path.getsize(self.path(address)), refs))
+            except OSError:
+                continue
+        with self.lock, self.db:
+            self.db.execute('UPDATE blobs SET refs = 0, released = COALESCE(released, ?)', (now,))
+            self.db.executemany('INSERT INTO blobs VALUES (?, ?, ?, NULL) ON CONFLICT (address) '
+                                'DO UPDATE SET refs = excluded.refs, released = NULL', rows)
+        self.needs_reconcile = False
+        print(f"Object store: reference counts reconciled for {len(rows)} blobs")
+
+    def collect(self, grace=None):
+        """
+        Delete blobs unreferenced for more than grace seconds, and temporary
+        files left by interrupted writes
+
+        Returns:
+            (blobs deleted, bytes freed)
+        """
+        cutoff = time.time() - (self.gc_grace if grace is None else grace)
+        deleted = freed = 0
+        while True:
+            with self.lock:
+                rows = self.db.execute('SELECT address, size FROM blobs WHERE refs <= 0 AND released <= ? LIMIT ?',
+                                       (cutoff, GC_BATCH)).fetchall()
+                for address, size in rows:
+                    try:
+                        os.remove(self.path(address))
+                        freed += size
+                    except FileNotFoundError:
+                        pass
+                with self.db:
+                    self.db.executemany('DELETE FROM blobs WHERE address = ? AND refs <= 0',
+                                        [(address,) for address, _ in rows])
+            deleted += len(rows)
+            if len(rows) < GC_BATCH:
+                break
+        with os.scandir(self.tmp_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+        with self.lock:
+            self.collected += deleted
+            self.collected_bytes += freed
+        return deleted, freed
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True, name='sft-object-gc')
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def run(self):
+        while not self.stopped.wait(self.gc_interval):
+            try:
+                deleted, freed = self.collect()
+                if deleted:
+                    print(f"Object store: collected {deleted} unreferenced blobs ({freed} bytes)")
+            except Exception as e:
+                print(f"Object store: collection failed: {e}")
+
+    def stats(self):
+        with self.lock:
+            # Uses the partial index; totals over all blobs would scan the whole table
+            unreferenced = self.db.execute('SELECT COUNT(*) FROM blobs WHERE refs <= 0').fetchone()[0]
+            return {'stored': self.stored, 'deduplicated': self.deduplicated, 'unreferenced': unreferenced,
+                    'collected': self.collected, 'collected_bytes': self.collected_bytes}
+
+    def close(self):
+        with self.lock:
+            if self.db is None:
+                return
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('clean', '1')")
+            self.db.close()
+            self.db = None
@@ -1,7 +1,13 @@
 #!/usr/bin/env python
 import sys
+import signal
 import argparse
 from server import FileServer
+from buffers import DEFAULT_IO_SIZE
+from admission import DEFAULT_COMMAND_LIMITS
+from bandwidth import DEFAULT_SMALL_TRANSFER
+from durability import POLICIES, DEFAULT_POLICY, DEFAULT_GROUP_WINDOW
+from encryption import CIPHERS, HASHES, BACKENDS, DEFAULT_CIPHER, DEFAULT_HASH, DEFAULT_CHUNK_SIZE
 
 def main():
     parser = argparse.ArgumentParser(description='Secure File Transfer Server')
@@ -9,6 +15,46 @@ def main():
     parser.add_argument('--port', type=int, default=5000, help='Port to listen on')
     parser.add_argument('--upload-dir', type=str, default='uploads', help='Directory to store uploaded files')
     parser.add_argument('--no-gdrive', action='store_true', help='Disable Google Drive integration')
+    parser.add_argument('--io-size', type=int, default=DEFAULT_IO_SIZE, help='Per-connection socket/file I/O buffer size in bytes')
+    parser.add_argument('--no-sendfile', action='store_true', help='Disable the os.sendfile fast path for local downloads')
+    parser.add_argument('--no-ktls', action='store_true', help='Do not request kernel TLS offload from OpenSSL')
+    parser.add_argument('--cipher', choices=['auto'] + list(CIPHERS), default=DEFAULT_CIPHER, help='Cipher for stored files (auto: fastest authenticated mode)')
+    parser.add_argument('--checksum', choices=['auto'] + list(HASHES), default=DEFAULT_HASH, help='Checksum algorithm (auto: fastest of sha256/blake2b)')
+    parser.add_argument('--crypto-backend', choices=['auto'] + list(BACKENDS), default='pycryptodome', help='Crypto library used for encryption')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics over HTTP on this port')
+    parser.add_argument('--metrics-host', default='127.0.0.1', help='Address for the metrics endpoint')
+    parser.add_argument('--trace-log', help='Write sampled per-transfer traces to this rotating JSONL file')
+    parser.add_argument('--trace-sample-rate', type=float, default=0.01, help='Fraction of commands to trace (0.0-1.0)')
+    parser.add_argument('--admin-token', help='Shared secret that enables admin commands (profile)')
+    parser.add_argument('--profile-dir', default='profiles', help='Directory for profiler output')
+    parser.add_argument('--profile-rate', type=int, default=100, help='Profiler samples per second')
+    parser.add_argument('--max-connections', type=int, default=1024, help='Maximum open client connections (0 = unlimited)')
+    parser.add_argument('--max-uploads', type=int, default=DEFAULT_COMMAND_LIMITS['upload'], help='Maximum concurrent uploads (0 = unlimited)')
+    parser.add_argument('--max-downloads', type=int, default=DEFAULT_COMMAND_LIMITS['download'], help='Maximum concurrent downloads (0 = unlimited)')
+    parser.add_argument('--max-lists', type=int, default=DEFAULT_COMMAND_LIMITS['list'], help='Maximum concurrent list commands (0 = unlimited)')
+    parser.add_argument('--byte-budget-mb', type=int, default=4096, help='File data in flight across all transfers, in MB (0 = unlimited)')
+    parser.add_argument('--admission-timeout', type=float, default=10.0, help='Seconds a request may queue before a busy response')
+    parser.add_argument('--backlog', type=int, default=128, help='Listen backlog for pending connections')
+    parser.add_argument('--bandwidth-limit', type=float, default=0, help='Total outgoing file bandwidth in MB/s (0 = unlimited)')
+    parser.add_argument('--connection-bandwidth', type=float, default=0, help='Outgoing bandwidth per connection in MB/s (0 = unlimited)')
+    parser.add_argument('--user-bandwidth', type=float, default=0, help='Outgoing bandwidth per client IP in MB/s (0 = unlimited)')
+    parser.add_argument('--bandwidth-weight', action='append', default=[], metavar='IP=WEIGHT', help='Fair-share weight for a client IP (repeatable)')
+    parser.add_argument('--small-transfer', type=int, default=DEFAULT_SMALL_TRANSFER, help='Transfers up to this many bytes are sent ahead of bulk data')
+    parser.add_argument('--handshake-timeout', type=float, default=10.0, help='Seconds allowed for the TLS handshake')
+    parser.add_argument('--idle-timeout', type=float, default=300.0, help='Close connections idle between commands for this many seconds')
+    parser.add_argument('--io-timeout', type=float, default=60.0, help='Seconds a socket read/write may stall during a command')
+    parser.add_argument('--min-throughput', type=int, default=1024, help='Drop transfers slower than this many bytes/s (0 disables)')
+    parser.add_argument('--tls-ciphers', help='OpenSSL cipher string for TLS 1.2 connections')
+    parser.add_argument('--tls-curve', help='ECDH curve for key exchange, e.g. prime256v1 or X25519')
+    parser.add_argument('--tls-min-version', choices=['1.2', '1.3'], help='Lowest TLS version to accept')
+    parser.add_argument('--batch-workers', type=int, default=8, help='Threads processing the files of batch uploads and downloads')
+    parser.add_argument('--catalog', help='Metadata catalog database (default: <upload dir>.catalog.db)')
+    parser.add_argument('--rebuild-catalog', action='store_true', help='Re-import the catalog from a storage listing at startup')
+    parser.add_argument('--event-heartbeat', type=float, default=15.0, help='Seconds between keepalive frames on idle subscribe connections')
+    parser.add_argument('--scrub-rate', type=float, default=0, help='Re-verify stored objects against their checksums in the background at this many MB/s (0 = off)')
+    parser.add_argument('--durability', choices=POLICIES, default=DEFAULT_POLICY, help='When local uploads are flushed to disk before they are acknowledged: none, fsync (each upload) or group (concurrent uploads share flushes)')
+    parser.add_argument('--durability-window', type=float, default=DEFAULT_GROUP_WINDOW * 1000, help='Milliseconds a group commit waits for more uploads to join it')
+    parser.add_argument('--crypto-chunk-size', type=lambda v: v if v == 'auto' else int(v), default=DEFAULT_CHUNK_SIZE, help='Chunk size for streaming encryption and hashing, or auto')
     
     args = parser.parse_args()
     
@@ -20,9 +66,52 @@ def main():
         host=args.host,
         port=args.port,
         upload_dir=args.upload_dir,
-        gdrive_enabled=not args.no_gdrive
+        gdrive_enabled=not args.no_gdrive,
+        io_size=args.io_size,
+        sendfile_enabled=not args.no_sendfile,
+        ktls_enabled=not args.no_ktls,
+        cipher=args.cipher,
+        checksum=args.checksum,
+        crypto_backend=args.crypto_backend,
+        crypto_chunk_size=args.crypto_chunk_size,
+        metrics_port=args.metrics_port,
+        metrics_host=args.metrics_host,
+        trace_log=args.trace_log,
+        trace_sample_rate=args.trace_sample_rate,
+        admin_token=args.admin_token,
+        profile_dir=args.profile_dir,
+        profile_rate=args.profile_rate,
+        max_connections=args.max_connections,
+        command_limits=dict(DEFAULT_COMMAND_LIMITS, upload=args.max_uploads,
+                            download=args.max_downloads, list=args.max_lists),
+        byte_budget=args.byte_budget_mb * 1024 * 1024,
+        admission_timeout=args.admission_timeout,
+        backlog=args.backlog,
+        bandwidth_limit=int(args.bandwidth_limit * 1024 * 1024),
+        connection_bandwidth=int(args.connection_bandwidth * 1024 * 1024),
+        user_bandwidth=int(args.user_bandwidth * 1024 * 1024),
+        bandwidth_weights={ip: float(weight) for ip, weight in (w.split('=', 1) for w in args.bandwidth_weight)},
+        small_transfer=args.small_transfer,
+        handshake_timeout=args.handshake_timeout,
+        idle_timeout=args.idle_timeout,
+        io_timeout=args.io_timeout,
+        min_throughput=args.min_throughput,
+        tls_ciphers=args.tls_ciphers,
+        tls_curve=args.tls_curve,
+        tls_min_version=args.tls_min_version,
+        batch_workers=args.batch_workers,
+        catalog_path=args.catalog,
+        rebuild_catalog=args.rebuild_catalog,
+        event_heartbeat=args.event_heartbeat,
+        scrub_rate=int(args.scrub_rate * 1024 * 1024),
+        durability=args.durability,
+        durability_window=args.durability_window / 1000
     )
     
+    # kill -USR2 <pid> starts the profiler; a second signal stops it and writes the profile
+    if hasattr(signal, 'SIGUSR2'):
+        signal.signal(signal.SIGUSR2, lambda signum, frame: server.toggle_profiler())
+    
     try:
         server.start()
     except KeyboardInterrupt:
@@ -0,0 +1,141 @@
+import threading
+from collections import deque
+
+from encryption import new_hash
+from bandwidth import TokenBucket
+
+# Seconds to wait after a full pass (or when there is nothing to check)
+DEFAULT_PASS_INTERVAL = 3600.0
+# Catalog rows fetched per query
+PAGE_SIZE = 100
+
+
+def file_chunks(f, chunk_size):
+    """Iterate over the contents of binary file f, chunk_size bytes at a time, reusing one buffer"""
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    while n := f.readinto(buf):
+        yield view[:n]
+
+
+class Scrubber:
+    """
+    Background re-verification of stored objects against their checksums
+
+    Walks the catalog in creation order, hashes each object's stored bytes
+    and compares them with the stored checksum recorded at ingest. Reading
+    is paced by a token bucket at rate bytes/s, so scrubbing never takes
+    more than a fixed share of disk (or Drive) bandwidth: the next chunk
+    is only read once the previous one has been paid for, and Drive objects
+    are hashed as they download instead of being copied to disk first. The position is
+    saved in the catalog, so a restarted server carries on where it left off.
+
+    Objects without a stored checksum (imported from storage listings) get
+    one recorded instead, through on_backfill. Mismatches are reported
+    through on_mismatch and kept in stats().
+
+    Args:
+        catalog: Catalog of the objects to check
+        fetch: fetch(record, chunk_size), a context manager yielding an
+            iterator over the object's stored bytes in chunks of about
+            chunk_size (None if storage no longer has it)
+        algorithm: Checksum algorithm of new checksums
+        rate: Bytes/s to read
+        chunk_size: Read size
+        on_backfill: Optional callable(record, stored_checksum)
+        on_mismatch: Optional callable(record, actual_checksum)
+        pass_interval: Seconds to rest between passes
+    """
+    def __init__(self, catalog, fetch, algorithm, rate, chunk_size=1024 * 1024, on_backfill=None,
+                 on_mismatch=None, pass_interval=DEFAULT_PASS_INTERVAL):
+        self.catalog = catalog
+        self.fetch = fetch
+        self.algorithm = algorithm
+        self.bucket = TokenBucket(rate)
+        self.chunk_size = chunk_size
+        self.on_backfill = on_backfill
+        self.on_mismatch = on_mismatch
+        self.pass_interval = pass_interval
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.counts = {'checked': 0, 'bytes': 0, 'ok': 0, 'mismatched': 0, 'missing': 0, 'backfilled': 0,
+                       'error': 0, 'passes': 0}
+        self.mismatched = deque(maxlen=100)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True, name='sft-scrubber')
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def run(self):
+        cursor = self.catalog.get_meta('scrub_cursor') or None
+        while not self.stopped.is_set():
+            try:
+                records, cursor = self.catalog.query(sort='created', limit=PAGE_SIZE, cursor=cursor)
+            except ValueError:
+                records, cursor = [], None
+            for record in records:
+                if self.stopped.is_set():
+                    return
+                self.check(record)
+            if self.stopped.is_set():
+                return
+            self.catalog.set_meta('scrub_cursor', cursor or '')
+            if cursor is None:
+                with self.lock:
+                    self.counts['passes'] += 1
+                self.stopped.wait(self.pass_interval)
+
+    def check(self, record):
+        """Verify one object; returns 'ok', 'mismatched', 'missing', 'backfilled' or 'error'"""
+        try:
+            with self.fetch(record, self.chunk_size) as chunks:
+                if chunks is None:
+                    result = 'missing'
+                else:
+                    checksum = self.hash_chunks(chunks)
+                    if checksum is None:
+                        return None
+                    if not record['stored_checksum'] or record['checksum_algorithm'] != self.algorithm:
+                        result = 'backfilled'
+                        if self.on_backfill:
+                            self.on_backfill(record, checksum)
+                    elif checksum == record['stored_checksum']:
+                        result = 'ok'
+                    else:
+                        result = 'mismatched'
+                        self.mismatched.append(record['id'])
+                        if self.on_mismatch:
+                            self.on_mismatch(record, checksum)
+        except Exception as e:
+            print(f"Scrubber: error checking {record['id']}: {e}")
+            result = 'error'
+        with self.lock:
+            self.counts['checked'] += 1
+            self.counts[result] += 1
+        return result
+
+    def hash_chunks(self, chunks):
+        """Checksum of the bytes from chunks, read at the configured rate (None if stopped)"""
+        digest = new_hash(self.algorithm)
+        for chunk in chunks:
+            n = len(chunk)
+            delay = self.bucket.reserve(n)
+            if delay and self.stopped.wait(delay):
+                return None
+            digest.update(chunk)
+            with self.lock:
+                self.counts['bytes'] += n
+        return digest.hexdigest()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+        stats['rate'] = self.bucket.rate
+        stats['recent_mismatches'] = list(self.mismatched)
+        return stats
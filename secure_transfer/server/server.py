@@ -6,68 +6,279 @@ import sys
 import traceback
 import time
 import ssl
-import hashlib
+import hmac
+import shutil
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from encryption import FileEncryptor
+from encryption import FileEncryptor, file_checksum, new_hash, DEFAULT_CIPHER, DEFAULT_HASH, DEFAULT_CHUNK_SIZE
 from gdrive import GoogleDriveAPI
+from buffers import (ConnectionBuffer, DEFAULT_IO_SIZE, send_json, enable_ktls, configure_tls,
+                     PeerTimeout, SlowPeerError, preallocate, MAX_REQUEST_SIZE)
+from cryptobench import select_config
+from metrics import Metrics, InstrumentedStorage, start_metrics_server
+from buffers import io_stats
+from tracing import Tracer
+from profiler import SamplingProfiler
+from admission import AdmissionController, Busy, DEFAULT_COMMAND_LIMITS
+from bandwidth import BandwidthScheduler, DEFAULT_SMALL_TRANSFER
+from catalog import Catalog, parse_time
+from events import EventHub
+from objectmeta import (to_properties, from_properties, read_sidecar, write_sidecar, remove_sidecar,
+                        sidecar_path, flat_sidecar_path, iter_sidecars)
+from objectstore import ObjectStore, OBJECTS_DIR, blob_address
+from durability import Durability, DEFAULT_POLICY, DEFAULT_GROUP_WINDOW
+from scrubber import Scrubber, file_chunks
+
+# Commands that get their own label in metrics; anything else is counted as 'unknown'
+COMMANDS = ('upload', 'download', 'upload_batch', 'download_batch', 'list', 'stat', 'search', 'delete',
+            'subscribe', 'stats', 'profile')
+
+# Fields of a list entry, for the 'fields' projection of list and search
+LIST_FIELDS = ('id', 'name', 'size', 'createdTime', 'storedSize', 'checksum', 'checksumAlgorithm', 'codec', 'owner')
+
+# Filters accepted by list and search, with their JSON types
+LIST_FILTERS = {
+    'prefix': str, 'glob': str, 'contains': str, 'owner': str,
+    'min_size': int, 'max_size': int,
+    'created_after': (str, int, float), 'created_before': (str, int, float),
+    'sort': str
+}
+
+# Entries per frame of a streamed listing, and the largest page a client may ask for
+LIST_PAGE_SIZE = 1000
+MAX_LIST_PAGE_SIZE = 10000
+
+
+def valid_size(value):
+    """True if value from a request is a usable byte count (JSON true/false are not)"""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
 
 class FileServer:
-    def __init__(self, host='0.0.0.0', port=5000, upload_dir='uploads', gdrive_enabled=True):
+    def __init__(self, host='0.0.0.0', port=5000, upload_dir='uploads', gdrive_enabled=True,
+                 io_size=DEFAULT_IO_SIZE, sendfile_enabled=True, ktls_enabled=True, storage=None,
+                 cipher=DEFAULT_CIPHER, checksum=DEFAULT_HASH, crypto_backend='pycryptodome',
+                 crypto_chunk_size=DEFAULT_CHUNK_SIZE, metrics_port=None, metrics_host='127.0.0.1',
+                 trace_log=None, trace_sample_rate=0.01, admin_token=None,
+                 profile_dir='profiles', profile_rate=100, max_connections=1024,
+                 command_limits=DEFAULT_COMMAND_LIMITS, byte_budget=4 * 1024 ** 3,
+                 admission_timeout=10.0, backlog=128, bandwidth_limit=0, connection_bandwidth=0,
+                 user_bandwidth=0, bandwidth_weights=None, small_transfer=DEFAULT_SMALL_TRANSFER,
+                 handshake_timeout=10.0, idle_timeout=300.0, io_timeout=60.0, min_throughput=1024,
+                 tls_ciphers=None, tls_curve=None, tls_min_version=None, batch_workers=8,
+                 catalog_path=None, rebuild_catalog=False, event_heartbeat=15.0, scrub_rate=0,
+                 durability=DEFAULT_POLICY, durability_window=DEFAULT_GROUP_WINDOW):
         self.host = host
         self.port = port
         self.upload_dir = upload_dir
         self.gdrive_enabled = gdrive_enabled
+        self.io_size = io_size
+        self.sendfile_enabled = sendfile_enabled
+        self.backlog = backlog
+        # Seconds allowed for the TLS handshake, between commands, and per socket
+        # operation during a command; min_throughput is in bytes/s (0 disables)
+        self.handshake_timeout = handshake_timeout
+        self.idle_timeout = idle_timeout
+        self.io_timeout = io_timeout
+        self.min_throughput = min_throughput
         self.sock = None
         self.clients = []
         self.running = False
+        self.stopped = False
+        
+        # Instrumentation, exposed via the stats command and optionally over HTTP
+        self.metrics = Metrics()
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.metrics_httpd = None
+        self.describe_metrics()
+        
+        # Per-transfer stage tracing, sampled into a rotating JSONL file
+        self.tracer = Tracer(trace_log, trace_sample_rate)
+        
+        # Sampling profiler for client handler and batch pool threads, toggled at runtime
+        self.profiler = SamplingProfiler(profile_rate, thread_prefix=('sft-handler', 'sft-batch'))
+        self.profile_dir = profile_dir
+        # Admin commands (profile) are refused unless a token is configured
+        self.admin_token = admin_token
+        
+        # Limits on connections, concurrent commands and file bytes in flight
+        self.admission = AdmissionController(
+            max_connections=max_connections,
+            command_limits=command_limits,
+            byte_budget=byte_budget,
+            queue_timeout=admission_timeout,
+            metrics=self.metrics
+        )
+        
+        # Fair sharing of outgoing file data between users (bytes/s, 0 = unlimited)
+        self.bandwidth = BandwidthScheduler(
+            total_rate=bandwidth_limit,
+            connection_rate=connection_bandwidth,
+            user_rate=user_bandwidth,
+            weights=bandwidth_weights,
+            small_transfer=small_transfer,
+            metrics=self.metrics
+        )
+        
+        # Workers that checksum, encrypt and store (or fetch) the entries of batch
+        # commands while the connection thread keeps streaming
+        self.batch_workers = batch_workers
+        self.batch_pool = ThreadPoolExecutor(max_workers=batch_workers, thread_name_prefix='sft-batch')
+        
+        # Crypto configuration; 'auto' values are resolved by benchmarking at startup
+        if 'auto' in (cipher, checksum, crypto_backend, crypto_chunk_size):
+            self.crypto = select_config(
+                cipher=cipher,
+                checksum=checksum,
+                backend=crypto_backend,
+                chunk_size=None if crypto_chunk_size == 'auto' else crypto_chunk_size
+            )
+            print(f"Auto-selected crypto configuration: {self.crypto}")
+        else:
+            self.crypto = {'cipher': cipher, 'backend': crypto_backend,
+                           'chunk_size': crypto_chunk_size, 'hash': checksum}
+        # Fail at startup rather than on the first upload if the combination is invalid
+        self.new_encryptor()
         
         # SSL Configuration
         self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
         self.ssl_context.load_cert_chain('server.crt', 'server.key')
+        configure_tls(self.ssl_context, tls_ciphers, tls_curve, tls_min_version)
+        if ktls_enabled and sendfile_enabled:
+            enable_ktls(self.ssl_context)
         
        
         if not os.path.exists(self.upload_dir):
             os.makedirs(self.upload_dir)
         
        
-        self.gdrive = None
-        if self.gdrive_enabled:
+        # storage: any object with the GoogleDriveAPI interface (used by benchmarks)
+        self.gdrive = storage
+        if storage is not None:
+            self.gdrive_enabled = True
+        elif self.gdrive_enabled:
             try:
                 self.gdrive = GoogleDriveAPI()
             except Exception as e:
                 print(f"Failed to initialize Google Drive API: {e}")
                 self.gdrive_enabled = False
+        if self.gdrive is not None:
+            self.gdrive = InstrumentedStorage(self.gdrive, self.metrics)
+        
+        # When local uploads are flushed to disk: 'none', 'fsync' or 'group' (see durability.py).
+        # Drive uploads are durable once Drive has them
+        self.durability = Durability(durability, durability_window)
+        
+        # Without Drive, object bytes are kept in a content-addressed store in upload_dir
+        self.objects = None
+        if not (self.gdrive_enabled and self.gdrive):
+            self.objects = ObjectStore(os.path.join(self.upload_dir, OBJECTS_DIR), durability=self.durability)
+        
+        # Metadata of stored objects; list/stat/search are answered from here.
+        # Kept beside (not inside) upload_dir so it can't be downloaded as a file
+        self.catalog = Catalog(catalog_path or os.path.abspath(self.upload_dir) + '.catalog.db')
+        # Catalog changes are pushed to 'subscribe' connections
+        self.events = EventHub()
+        self.event_heartbeat = event_heartbeat
+        self.catalog.on_change = self.catalog_changed
+        if self.objects:
+            self.migrate_flat_files()
+        if rebuild_catalog or not self.catalog.get_meta('imported'):
+            self.import_catalog()
+        elif self.objects and self.objects.needs_reconcile:
+            self.reconcile_objects()
+        
+        # Background re-verification of stored objects at scrub_rate bytes/s (0 = off)
+        self.scrubber = None
+        if scrub_rate:
+            self.scrubber = Scrubber(self.catalog, self.object_chunks, self.crypto['hash'], scrub_rate,
+                                     self.crypto['chunk_size'], on_backfill=self.scrub_backfill,
+                                     on_mismatch=self.scrub_mismatch)
+    
+    def describe_metrics(self):
+        """Register HELP text for the metrics the server records"""
+        m = self.metrics
+        m.describe('sft_commands_total', 'Commands received, by command')
+        m.describe('sft_command_duration_seconds', 'Time to handle a command, including data transfer')
+        m.describe('sft_responses_total', 'Responses sent, by status')
+        m.describe('sft_bytes_received_total', 'File payload bytes received from clients')
+        m.describe('sft_bytes_sent_total', 'File payload bytes sent to clients')
+        m.describe('sft_scrub_mismatches_total', 'Stored objects whose bytes no longer match their checksum')
+        m.describe('sft_active_connections', 'Currently connected clients')
+        m.describe('sft_connections_total', 'Accepted client connections')
+        m.describe('sft_storage_call_duration_seconds', 'Storage backend (Google Drive) call latency')
+        m.describe('sft_storage_errors_total', 'Storage backend calls that raised')
+        m.describe('sft_encryption_duration_seconds', 'Time spent encrypting uploaded files')
+        m.describe('sft_checksum_duration_seconds', 'Time spent calculating checksums')
+        m.describe('sft_handshake_failures_total', 'TLS handshakes that failed or timed out')
+        m.describe('sft_connections_dropped_total', 'Connections closed by the server, by reason (idle, timeout, slow)')
+        m.describe('sft_batch_entries_total', 'Files processed by batch commands, by command and status')
+        m.describe('sft_subscribers', 'Connections subscribed to change events')
+        m.describe('sft_events_sent_total', 'Change events sent to subscribers')
+    
+    def get_stats(self):
+        """Return a snapshot of server metrics and buffer counters"""
+        stats = self.metrics.snapshot()
+        stats['io'] = io_stats.snapshot()
+        stats['crypto'] = self.crypto
+        stats['profiler'] = self.profiler.status()
+        stats['admission'] = self.admission.snapshot()
+        stats['bandwidth'] = self.bandwidth.snapshot()
+        stats['events'] = self.events.stats()
+        if self.scrubber:
+            stats['scrub'] = self.scrubber.stats()
+        if self.objects:
+            stats['objects'] = self.objects.stats()
+            stats['durability'] = self.durability.stats()
+        return stats
     
     def calculate_checksum(self, file_path):
-        """Calculate SHA256 checksum of a file"""
-        sha256 = hashlib.sha256()
-        with open(file_path, 'rb') as f:
-            while chunk := f.read(8192):
-                sha256.update(chunk)
-        return sha256.hexdigest()
+        """Calculate the checksum of a file with the configured algorithm"""
+        with self.metrics.timer('sft_checksum_duration_seconds'):
+            return file_checksum(file_path, self.crypto['hash'], self.crypto['chunk_size'])
+    
+    def new_encryptor(self):
+        """Create a FileEncryptor with a fresh key and the configured cipher"""
+        return FileEncryptor(
+            cipher=self.crypto['cipher'],
+            hash_algorithm=self.crypto['hash'],
+            chunk_size=self.crypto['chunk_size'],
+            backend=self.crypto['backend']
+        )
 
     def start(self):
         """Start the server"""
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.sock.bind((self.host, self.port))
-        self.sock.listen(5)
+        self.sock.listen(self.backlog)
         self.running = True
         
+        if self.metrics_port is not None:
+            self.metrics_httpd = start_metrics_server(self.metrics.render_prometheus, self.metrics_host, self.metrics_port)
+            print(f"Metrics available at http://{self.metrics_host}:{self.metrics_port}/metrics")
+        
+        if self.scrubber:
+            self.scrubber.start()
+        if self.objects:
+            self.objects.start()
+        
         print(f"Server started on {self.host}:{self.port}")
         
         try:
             while self.running:
                 client, address = self.sock.accept()
                 print(f"Client connected: {address}")
+                self.metrics.inc('sft_connections_total')
                 
-                # Wrap socket with SSL
-                secure_sock = self.ssl_context.wrap_socket(client, server_side=True)
-                self.clients.append(secure_sock)
-                
-                # Start a new thread to handle the client
-                client_thread = threading.Thread(target=self.handle_client, args=(secure_sock, address))
+                # The TLS handshake runs in the connection's own thread, so a
+                # client that stalls mid-handshake cannot block the accept loop
+                client_thread = threading.Thread(target=self.accept_client, args=(client, address),
+                                                 name=f'sft-handler-{address[0]}:{address[1]}')
                 client_thread.daemon = True
                 client_thread.start()
         except KeyboardInterrupt:
@@ -76,7 +287,11 @@ class FileServer:
             self.stop()
     
     def stop(self):
-        """Stop the server"""
+        """Stop the server (only the first call does anything)"""
+        # start() stops the server on its way out, and run_server.py again
+        if self.stopped:
+            return
+        self.stopped = True
         self.running = False
         
       
@@ -90,63 +305,138 @@ class FileServer:
         if self.sock:
             self.sock.close()
         
+        if self.metrics_httpd:
+            self.metrics_httpd.shutdown()
+            self.metrics_httpd = None
+        
+        self.tracer.close()
+        self.batch_pool.shutdown(wait=False)
+        if self.scrubber:
+            self.scrubber.stop()
+        if self.objects:
+            self.objects.stop()
+            self.objects.close()
+        self.catalog.close()
+        
+        if self.profiler.running:
+            self.stop_profiler()
+        
         print("Server stopped")
     
+    def accept_client(self, client, address):
+        """Complete the TLS handshake within handshake_timeout, then serve the connection"""
+        client.settimeout(self.handshake_timeout)
+        try:
+            secure_sock = self.ssl_context.wrap_socket(client, server_side=True)
+        except (ssl.SSLError, OSError) as e:
+            print(f"TLS handshake with {address} failed: {e}")
+            self.metrics.inc('sft_handshake_failures_total')
+            client.close()
+            return
+        
+        # Over the connection limit: tell the client when to come back instead of serving it
+        try:
+            self.admission.open_connection()
+        except Busy as e:
+            self.reject_client(secure_sock, e)
+            return
+        self.clients.append(secure_sock)
+        self.handle_client(secure_sock, address)
+    
     def handle_client(self, client, address):
         """Handle client connection"""
+        buffer = ConnectionBuffer(client, self.io_size, MAX_REQUEST_SIZE)
+        buffer.min_throughput = self.min_throughput or None
+        shaper = self.bandwidth.connection(address[0])
+        self.metrics.add_gauge('sft_active_connections', 1)
         try:
             while self.running:
                 try:
                     
-                    msg_len_bytes = client.recv(4)
-                    if not msg_len_bytes:
+                    # Waiting for the next command may take up to idle_timeout;
+                    # once one arrives, every socket operation gets io_timeout
+                    client.settimeout(self.idle_timeout)
+                    try:
+                        message = buffer.recv_frame()
+                    except PeerTimeout:
+                        print(f"Closing idle connection {address}")
+                        self.metrics.inc('sft_connections_dropped_total', reason='idle')
+                        break
+                    client.settimeout(self.io_timeout)
+                    if message is None:
                         print(f"Client {address} disconnected")
                         break
                     
-                    msg_len = int.from_bytes(msg_len_bytes, byteorder='big')
-                    
-                   
-                    message = b''
-                    bytes_received = 0
-                    
-                    while bytes_received < msg_len:
-                        try:
-                            chunk = client.recv(min(4096, msg_len - bytes_received))
-                            if not chunk:
-                                raise ConnectionError("Connection lost while receiving message")
-                            message += chunk
-                            bytes_received += len(chunk)
-                        except socket.timeout:
-                            print(f"Timeout while receiving from {address}")
-                            continue
-                        except ConnectionError as e:
-                            print(f"Connection error with {address}: {e}")
-                            raise
-                    
                     if not message:
                         break
                     
                     try:
                        
-                        message_data = json.loads(message.decode('utf-8'))
+                        message_data = json.loads(str(message, 'utf-8'))
                         command = message_data.get('command')
+                        label = command if command in COMMANDS else 'unknown'
+                        self.metrics.inc('sft_commands_total', command=label)
+                        
+                        trace = self.tracer.start(label, peer=address[0], force=bool(message_data.get('trace')))
+                        
+                        # A subscription takes over the connection until the client goes away;
+                        # it holds a connection slot but no command permit
+                        if command == 'subscribe':
+                            trace.finish()
+                            self.serve_subscription(client, message_data, address)
+                            break
+                        
+                        try:
+                            permit = self.admit(command, message_data)
+                        except Busy as e:
+                            self.send_response(client, self.busy_response(e))
+                            trace.finish('busy')
+                            continue
                         
-                        if command == 'upload':
-                            self.handle_upload(client, message_data)
-                        elif command == 'download':
-                            self.handle_download(client, message_data)
-                        elif command == 'list':
-                            self.handle_list(client)
-                        else:
-                            self.send_response(client, {'status': 'error', 'message': 'Unknown command'})
+                        with permit, self.metrics.timer('sft_command_duration_seconds', command=label):
+                            if command == 'upload':
+                                self.handle_upload(client, message_data, buffer, trace)
+                            elif command == 'download':
+                                self.handle_download(client, message_data, buffer, trace, permit, shaper)
+                            elif command == 'upload_batch':
+                                self.handle_upload_batch(client, message_data, buffer, trace)
+                            elif command == 'stat':
+                                self.handle_stat(client, message_data, trace)
+                            elif command == 'search':
+                                self.handle_search(client, message_data, trace)
+                            elif command == 'download_batch':
+                                self.handle_download_batch(client, message_data, buffer, trace, shaper)
+                            elif command == 'list':
+                                self.handle_list(client, message_data, trace)
+                            elif command == 'delete':
+                                self.handle_delete(client, message_data, trace)
+                            elif command == 'stats':
+                                self.send_response(client, {'status': 'success', 'stats': self.get_stats()})
+                            elif command == 'profile':
+                                self.handle_profile(client, message_data)
+                            else:
+                                self.send_response(client, {'status': 'error', 'message': 'Unknown command'})
+                        
+                        trace.finish()
                     
                     except json.JSONDecodeError:
                         self.send_response(client, {'status': 'error', 'message': 'Invalid JSON format'})
+                    except (ConnectionError, socket.timeout):
+                        # The peer is gone or stuck mid-transfer; the stream is out of sync
+                        raise
                     except Exception as e:
                         print(f"Error handling message from {address}: {e}")
                         traceback.print_exc()
                         self.send_response(client, {'status': 'error', 'message': str(e)})
                 
+                except SlowPeerError as e:
+                    print(f"Dropping slow client {address}: {e}")
+                    self.metrics.inc('sft_connections_dropped_total', reason='slow')
+                    break
+                except (PeerTimeout, socket.timeout) as e:
+                    print(f"Timed out on {address}: {e}")
+                    self.metrics.inc('sft_connections_dropped_total', reason='timeout')
+                    break
                 except ConnectionError as e:
                     print(f"Connection lost with {address}: {e}")
                     break
@@ -161,6 +451,8 @@ class FileServer:
         
         finally:
            
+            self.metrics.add_gauge('sft_active_connections', -1)
+            self.admission.close_connection()
             if client in self.clients:
                 self.clients.remove(client)
             try:
@@ -169,7 +461,130 @@ class FileServer:
                 pass
             print(f"Client disconnected: {address}")
     
-    def handle_upload(self, client, message_data):
+    def admit(self, command, message_data):
+        """
+        Wait for admission of a command (raises Busy if the limits stay exhausted)
+        
+        Uploads reserve their declared size up front, twice when the plaintext
+        and encrypted copies both sit in upload_dir. Drive downloads reserve
+        their size once it is known (see handle_download). Batches count
+        against the limit of the command they batch, and searches against
+        the list limit.
+        """
+        if command in ('upload_batch', 'download_batch'):
+            command = command[:-len('_batch')]
+        elif command == 'search':
+            command = 'list'
+        if command not in ('upload', 'download', 'list'):
+            return self.admission.acquire('control')
+        nbytes = 0
+        if command == 'upload':
+            file_size = message_data.get('file_size', message_data.get('total_size'))
+            if valid_size(file_size):
+                nbytes = file_size * (2 if self.gdrive_enabled and self.gdrive else 1)
+        return self.admission.acquire(command, nbytes)
+    
+    def reject_client(self, client, error):
+        """
+        Answer a connection over the limit with a closing busy response
+        
+        The client's first request is read before replying, so closing the
+        socket does not reset the connection with unread data and the
+        client actually sees the busy response.
+        """
+        try:
+            client.settimeout(2.0)
+            try:
+                # Requests are small JSON frames, one read consumes it
+                client.recv(65536)
+            except OSError:
+                pass
+            self.send_response(client, self.busy_response(error, closing=True))
+        except OSError:
+            pass
+        finally:
+            client.close()
+    
+    def busy_response(self, error, closing=False):
+        """Build the response sent when a request is refused for lack of capacity"""
+        response = {'status': 'busy', 'message': str(error), 'reason': error.reason, 'retry_after': error.retry_after}
+        if closing:
+            response['closing'] = True
+        return response
+    
+    def shaped(self, shaper, buffer, size):
+        """Context manager applying the bandwidth limits to one outgoing transfer"""
+        if shaper is None:
+            shaper = self.bandwidth.connection(None)
+        return shaper.transfer(buffer, size)
+    
+    def start_profiler(self):
+        """Start sampling handler thread stacks"""
+        if self.profiler.start():
+            print(f"Profiler started ({self.profiler.status()['rate']} Hz)")
+            return True
+        return False
+    
+    def stop_profiler(self):
+        """
+        Stop the profiler and write the collapsed stacks to profile_dir
+        
+        Returns:
+            Path of the written profile, or None if the profiler was not running
+        """
+        samples = self.profiler.samples
+        collapsed = self.profiler.stop()
+        if collapsed is None:
+            return None
+        name = time.strftime('profile-%Y%m%d-%H%M%S.folded')
+        path = self.profiler.dump(os.path.join(self.profile_dir, name), collapsed)
+        print(f"Profiler stopped: {samples} samples written to {path}")
+        return path
+    
+    def toggle_profiler(self):
+        """Start the profiler if it is stopped, otherwise stop it and dump (used by SIGUSR2)"""
+        if self.profiler.running:
+            self.stop_profiler()
+        else:
+            self.start_profiler()
+    
+    def handle_profile(self, client, message_data):
+        """Handle the admin profile command (action: start, stop or status)"""
+        token = message_data.get('token')
+        if not self.admin_token or not isinstance(token, str) or not hmac.compare_digest(token, self.admin_token):
+            self.send_response(client, {'status': 'error', 'message': 'Not authorized'})
+            return
+        
+        action = message_data.get('action', 'status')
+        if action == 'start':
+            if not self.start_profiler():
+                self.send_response(client, {'status': 'error', 'message': 'Profiler already running'})
+                return
+        elif action == 'stop':
+            samples = self.profiler.samples
+            path = self.stop_profiler()
+            if path is None:
+                self.send_response(client, {'status': 'error', 'message': 'Profiler not running'})
+                return
+            response = {'status': 'success', 'path': path, 'samples': samples}
+            if message_data.get('include_stacks'):
+                with open(path) as f:
+                    response['stacks'] = f.read()
+            self.send_response(client, response)
+            return
+        elif action != 'status':
+            self.send_response(client, {'status': 'error', 'message': f'Unknown profile action: {action}'})
+            return
+        
+        self.send_response(client, {'status': 'success', 'profiler': self.profiler.status()})
+    
+    def traced(self, trace, message_data, response):
+        """Attach the trace summary to a final response if the client asked for it"""
+        if message_data.get('trace'):
+            response['trace'] = trace.summary()
+        return response
+    
+    def handle_upload(self, client, message_data, buffer, trace):
         """Handle file upload from client"""
         filename = message_data.get('filename')
         file_size = message_data.get('file_size')
@@ -177,77 +592,380 @@ class FileServer:
         if not filename or file_size is None:
             self.send_response(client, {'status': 'error', 'message': 'Missing filename or file_size'})
             return
+        if not valid_size(file_size):
+            self.send_response(client, {'status': 'error', 'message': f'Invalid file_size: {file_size!r}'})
+            return
         
        
         base_name = os.path.basename(filename)
-        file_path = os.path.join(self.upload_dir, base_name)
+        # Staged privately so concurrent uploads of the same name don't
+        # overwrite each other before the file is stored
+        staging = self.staging_dir()
+        file_path = os.path.join(staging, base_name)
         
+        try:
+            f = open(file_path, 'wb')
+            try:
+                preallocate(f, file_size)
+            except OSError as e:
+                f.close()
+                self.send_response(client, {'status': 'error', 'message': f'No room for upload: {e.strerror}'})
+                return
+            
+            self.send_response(client, {'status': 'ready', 'file_path': file_path})
+            
+           
+            # recv_to_file measures its own disk writes, so socket and disk time can be split
+            timing = {}
+            # Hashed as it arrives, so the file is never read back just to checksum it
+            digest = new_hash(self.crypto['hash'])
+            start = time.perf_counter()
+            try:
+                with f:
+                    bytes_received = buffer.recv_to_file(f, file_size, timing, digest)
+            except (ConnectionError, socket.timeout):
+                # Don't leave a partial upload behind when the client stalls or disconnects
+                os.remove(file_path)
+                raise
+            elapsed = time.perf_counter() - start
+            trace.add('socket_recv', elapsed - timing['file_io_s'], bytes_received)
+            trace.add('storage_io', timing['file_io_s'], bytes_received)
+            self.metrics.inc('sft_bytes_received_total', bytes_received)
+            
+            
+            if bytes_received != file_size:
+                self.send_response(client, {'status': 'error', 'message': 'Incomplete file transfer'})
+                os.remove(file_path)
+                return
+            
+            try:
+                result = self.store_file(file_path, base_name, trace, self.peer_name(client), digest.hexdigest())
+            except Exception as e:
+                error = 'Error uploading to Google Drive' if self.objects is None else 'Error storing file'
+                print(f"{error}: {e}")
+                traceback.print_exc()
+                self.send_response(client, {'status': 'error', 'message': f'{error}: {str(e)}'})
+                return
+            
+            result['status'] = 'success'
+            result['message'] = 'File uploaded to Google Drive' if self.objects is None else 'File uploaded to server'
+            self.send_response(client, self.traced(trace, message_data, result))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    
+    def staging_dir(self):
+        """Create a private temporary directory in upload_dir (hidden from listings)"""
+        return tempfile.mkdtemp(prefix='temp_', dir=self.upload_dir)
+    
+    def store_file(self, file_path, base_name, trace, owner=None, checksum=None):
+        """
+        Checksum a received file and store it: encrypted on Drive, or in
+        the local object store (see objectstore.py) when Drive is disabled
         
-        self.send_response(client, {'status': 'ready', 'file_path': file_path})
+        Checksums are taken once, here, and stored with the object (Drive
+        appProperties or a sidecar file, see objectmeta.py) as well as in
+        the catalog, which is recorded once storage has the object; if that
+        fails the stored copy is deleted again, so the two never disagree.
+        Local objects are named by base_name, and a later upload of the
+        same name replaces the object.
         
-       
-        with open(file_path, 'wb') as f:
-            bytes_received = 0
-            
-            while bytes_received < file_size:
-               
-                chunk_size = min(4096, file_size - bytes_received)
-                chunk = client.recv(chunk_size)
-                
-                if not chunk:
-                    break
-                
-                f.write(chunk)
-                bytes_received += len(chunk)
+        Args:
+            checksum: The file's checksum if it was taken while receiving it
         
+        Returns:
+            Dict with the file ID, checksum and (for Drive) the encryption key
+        """
+        size = os.path.getsize(file_path)
+        if checksum is None:
+            with trace.span('checksum', size):
+                checksum = self.calculate_checksum(file_path)
+        result = {'checksum': checksum, 'checksum_algorithm': self.crypto['hash']}
+        record = {'name': base_name, 'size': size, 'checksum': checksum,
+                  'checksum_algorithm': self.crypto['hash'], 'owner': owner}
         
-        checksum = self.calculate_checksum(file_path)
+        if self.objects:
+            result['file_id'] = base_name
+            record.update(id=base_name, stored_size=size, stored_checksum=checksum, codec='plain',
+                          created=time.time())
+            with trace.span('store', size):
+                address = self.objects.put(file_path, self.crypto['hash'], checksum)
+            try:
+                sidecar = write_sidecar(self.upload_dir, record, self.durability)
+                self.save_record(record)
+            except Exception:
+                self.objects.release(address)
+                raise
+            with trace.span('sync'):
+                self.commit_local(self.objects.blob_dir(address), sidecar, os.path.dirname(sidecar))
+            return result
         
+        encryptor = self.new_encryptor()
+        # The stored checksum is taken as the encrypted copy is written, so downloads don't have to
+        stored_digest = new_hash(self.crypto['hash'])
+        with self.metrics.timer('sft_encryption_duration_seconds'), trace.span('encrypt', size):
+            encrypted_file_path = encryptor.encrypt_file(file_path, output_hash=stored_digest)
+        try:
+            stored_size = os.path.getsize(encrypted_file_path)
+            record.update(stored_size=stored_size, stored_checksum=stored_digest.hexdigest(),
+                          codec=self.crypto['cipher'])
+            with trace.span('drive_upload', stored_size):
+                result['gdrive_file_id'] = self.gdrive.upload_file(encrypted_file_path,
+                                                                   properties=to_properties(record))
+        finally:
+            os.remove(encrypted_file_path)
+        os.remove(file_path)
         
-        if bytes_received != file_size:
-            self.send_response(client, {'status': 'error', 'message': 'Incomplete file transfer'})
-            os.remove(file_path)
-            return
+        record['id'] = result['gdrive_file_id']
+        try:
+            self.catalog.add(record)
+        except Exception:
+            self.gdrive.delete_file(result['gdrive_file_id'])
+            raise
+        result['key'] = encryptor.get_key().hex()
+        return result
+    
+    def commit_local(self, *paths):
+        """
+        Make changes to the local store durable, with the catalog
+        transactions that recorded them, before they are acknowledged
+        """
+        if self.durability.enabled:
+            self.durability.commit(*paths, self.catalog.wal_path)
+    
+    def save_record(self, record):
+        """Add record to the catalog, dropping the blob reference of the record it replaces"""
+        replaced = self.catalog.add(record)
+        if replaced:
+            self.release_blob(replaced)
+    
+    def release_blob(self, record):
+        """Drop a removed or replaced local record's reference to its blob"""
+        if self.objects and record['codec'] == 'plain' and record['stored_checksum']:
+            self.objects.release(blob_address(record['checksum_algorithm'], record['stored_checksum']))
+    
+    def local_path(self, file_id):
+        """Path of a local object's bytes in the object store, or None if there is no such object"""
+        record = self.catalog.get(os.path.basename(file_id))
+        if record is None or record['codec'] != 'plain' or not record['stored_checksum']:
+            return None
+        return self.objects.path(blob_address(record['checksum_algorithm'], record['stored_checksum']))
+    
+    def peer_name(self, client):
+        """Client IP address, used as the owner of uploaded objects"""
+        try:
+            return client.getpeername()[0]
+        except OSError:
+            return None
+    
+    def stored_checksum(self, file_id, path, trace):
+        """
+        Checksum of a stored object's bytes at path
         
-       
-        gdrive_file_id = None
-        if self.gdrive_enabled and self.gdrive:
+        Taken from the catalog when it was recorded with the current
+        algorithm and the size still matches; computed otherwise.
+        """
+        size = os.path.getsize(path)
+        record = self.catalog.get(file_id)
+        if (record and record['stored_checksum'] and record['stored_size'] == size
+                and record['checksum_algorithm'] == self.crypto['hash']):
+            return record['stored_checksum']
+        with trace.span('checksum', size):
+            checksum = self.calculate_checksum(path)
+        if record and record['stored_size'] in (None, size):
+            # Recorded, so this object is never hashed on download again
+            self.record_stored_checksum(record, checksum, size)
+        return checksum
+    
+    def record_stored_checksum(self, record, checksum, size=None):
+        """Save a stored object's newly computed checksum in the catalog and with the object"""
+        old_algorithm = record['checksum_algorithm']
+        record = dict(record, stored_checksum=checksum, checksum_algorithm=self.crypto['hash'])
+        if size is not None:
+            record['stored_size'] = size
+        if record['codec'] == 'plain':
+            # A local file is its own plaintext. Its blob is addressed by checksum,
+            # so the new one references the same bytes under the new address
+            record.update(size=record['stored_size'], checksum=checksum)
+            address = self.objects.put(self.local_path(record['id']), self.crypto['hash'], checksum, keep_source=True)
+            sidecar = write_sidecar(self.upload_dir, record, self.durability)
+        else:
+            if old_algorithm != self.crypto['hash']:
+                # The plaintext checksum used another algorithm and can't be kept beside the new one
+                record['checksum'] = None
             try:
-                
-                encryptor = FileEncryptor()
-                encrypted_file_path = encryptor.encrypt_file(file_path)
-                
-                
-                gdrive_file_id = self.gdrive.upload_file(encrypted_file_path)
-                
-                
-                os.remove(encrypted_file_path)
-                
-                
-                os.remove(file_path)
-                
-                self.send_response(client, {
-                    'status': 'success',
-                    'message': 'File uploaded to Google Drive',
-                    'gdrive_file_id': gdrive_file_id,
-                    'key': encryptor.get_key().hex(),  
-                    'checksum': checksum  
-                })
-            
+                self.gdrive.set_properties(record['id'], to_properties(record))
             except Exception as e:
-                print(f"Error uploading to Google Drive: {e}")
-                traceback.print_exc()
-                self.send_response(client, {'status': 'error', 'message': f'Error uploading to Google Drive: {str(e)}'})
+                print(f"Could not store checksum of {record['id']} with the object: {e}")
+        self.save_record(record)
+        if record['codec'] == 'plain':
+            self.commit_local(self.objects.blob_dir(address), sidecar, os.path.dirname(sidecar))
+    
+    @contextmanager
+    def object_chunks(self, record, chunk_size):
+        """
+        A stored object's bytes, as an iterator over chunks, for the duration
+        of a with block (streamed from Drive), or None if storage lacks it
+        """
+        if self.objects:
+            path = self.local_path(record['id'])
+            if not path or not os.path.isfile(path):
+                yield None
                 return
-        else:
-            
-            self.send_response(client, {
-                'status': 'success', 
-                'message': 'File uploaded to server',
-                'checksum': checksum
-            })
+            with open(path, 'rb') as f:
+                yield file_chunks(f, chunk_size)
+            return
+        try:
+            chunks = self.gdrive.read_chunks(record['id'], chunk_size)
+        except FileNotFoundError:
+            chunks = None
+        yield chunks
+    
+    def scrub_backfill(self, record, checksum):
+        """Scrubber hook: record the checksum of an object that had none"""
+        current = self.catalog.get(record['id'])
+        if current is not None:
+            self.record_stored_checksum(current, checksum)
     
-    def handle_download(self, client, message_data):
+    def scrub_mismatch(self, record, checksum):
+        """Scrubber hook: an object's bytes no longer match its stored checksum"""
+        current = self.catalog.get(record['id'])
+        if current is None or current['stored_checksum'] != record['stored_checksum']:
+            return  # Replaced or deleted while it was being checked
+        self.metrics.inc('sft_scrub_mismatches_total')
+        print(f"Scrubber: {record['id']} ({record['name']}) is corrupt: stored checksum "
+              f"{record['stored_checksum']}, bytes hash to {checksum}")
+    
+    def is_unchanged(self, file_id, checksum):
+        """
+        Whether the stored object still has the checksum a client cached
+        
+        Answered from the catalog; objects without a recorded checksum, or
+        one taken with another algorithm, count as changed.
+        """
+        if self.objects:
+            file_id = os.path.basename(file_id)
+        record = self.catalog.get(file_id)
+        if not record or record['stored_checksum'] != checksum or record['checksum_algorithm'] != self.crypto['hash']:
+            return False
+        if self.objects:
+            # A blob lost from the store can't be served even if the catalog matches
+            path = self.local_path(file_id)
+            return path is not None and os.path.isfile(path)
+        return True
+    
+    def import_catalog(self):
+        """
+        Fill the catalog from a storage listing
+        
+        Done once when the catalog is created (and on rebuild_catalog), so
+        objects stored before the catalog existed are listed too. Sizes and
+        checksums come from the metadata stored with each object (see
+        objectmeta.py); Drive objects stored without it get a checksum the
+        first time they are downloaded or scrubbed. Local objects are
+        listed from their sidecars.
+        """
+        if self.objects:
+            self.import_local_catalog()
+            return
+        
+        # Filtered by Drive itself: files trashed in the Drive UI are not objects any more
+        files = self.gdrive.list_files(query='trashed = false')
+        codec = 'unknown'
+        records = []
+        for f in files:
+            name = f.get('name') or f['id']
+            stored_size = int(f['size']) if f.get('size') is not None else None
+            try:
+                created = parse_time(f.get('createdTime'))
+            except ValueError:
+                created = time.time()
+            record = {
+                'id': f['id'],
+                'name': name[:-4] if name.endswith('.enc') else name,
+                'size': None,
+                'stored_size': stored_size,
+                'codec': codec,
+                'created': created
+            }
+            meta = from_properties(f.get('appProperties'))
+            # Metadata for other bytes (the object was replaced behind the server's back) is ignored
+            if meta and meta.get('stored_size') == stored_size:
+                record.update({field: value for field, value in meta.items() if value is not None})
+            records.append(record)
+        
+        self.replace_catalog(records)
+    
+    def import_local_catalog(self):
+        """Fill the catalog from the sidecars of the objects in the local store"""
+        records = []
+        for meta in iter_sidecars(self.upload_dir):
+            if not meta['stored_checksum'] or not meta['checksum_algorithm']:
+                continue
+            path = self.objects.path(blob_address(meta['checksum_algorithm'], meta['stored_checksum']))
+            try:
+                stored_size = os.path.getsize(path)
+            except OSError:
+                continue  # The blob is gone
+            if meta['stored_size'] != stored_size:
+                continue
+            record = dict(meta, codec='plain')
+            record['name'] = record['name'] or record['id']
+            records.append(record)
+        self.replace_catalog(records)
+        self.reconcile_objects()
+    
+    def replace_catalog(self, records):
+        with self.catalog.lock, self.catalog.db:
+            self.catalog.db.execute('DELETE FROM objects')
+        self.catalog.add_many(records)
+        self.catalog.set_meta('imported', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+        print(f"Catalog: imported {len(records)} objects from storage")
+    
+    def reconcile_objects(self):
+        """Recount the local store's blob references from the catalog"""
+        self.objects.reconcile({blob_address(algorithm, checksum): count
+                                for (algorithm, checksum), count in self.catalog.references().items()})
+    
+    def migrate_flat_files(self):
+        """
+        Move files stored flat in upload_dir (before the object store) into the store
+        
+        Each keeps its name as its ID, so IDs clients already have still
+        work. Checksums recorded in the catalog or a sidecar are reused when
+        the size still matches; other files are hashed.
+        """
+        with os.scandir(self.upload_dir) as entries:
+            names = [entry.name for entry in entries if entry.is_file() and not entry.name.startswith('temp_')]
+        for name in names:
+            path = os.path.join(self.upload_dir, name)
+            stat = os.stat(path)
+            known = self.catalog.get(name) or {}
+            meta = read_sidecar(flat_sidecar_path(self.upload_dir, name)) or {}
+            checksum = None
+            for source in (known, meta):
+                if (source.get('stored_checksum') and source.get('stored_size') == stat.st_size
+                        and source.get('checksum_algorithm') == self.crypto['hash']):
+                    checksum = source['stored_checksum']
+                    break
+            if checksum is None:
+                checksum = self.calculate_checksum(path)
+            record = {'id': name, 'name': known.get('name') or name, 'size': stat.st_size, 'checksum': checksum,
+                      'stored_size': stat.st_size, 'stored_checksum': checksum,
+                      'checksum_algorithm': self.crypto['hash'], 'codec': 'plain',
+                      'created': known.get('created') or stat.st_mtime, 'owner': known.get('owner')}
+            self.objects.put(path, self.crypto['hash'], checksum)
+            write_sidecar(self.upload_dir, record)
+            self.catalog.add(record)
+            try:
+                os.remove(flat_sidecar_path(self.upload_dir, name))
+            except FileNotFoundError:
+                pass
+        if names:
+            print(f"Object store: moved {len(names)} files from {self.upload_dir} into the store")
+            # Records replaced above held no references, so counts are taken afresh
+            self.reconcile_objects()
+    
+    def handle_download(self, client, message_data, buffer, trace, permit=None, shaper=None):
         """Handle file download request from client"""
         gdrive_file_id = message_data.get('gdrive_file_id')
         encryption_key = message_data.get('key')
@@ -257,6 +975,16 @@ class FileServer:
             self.send_response(client, {'status': 'error', 'message': 'Missing gdrive_file_id'})
             return
         
+        # The client's cached copy is current: skip storage and send no bytes
+        cached_checksum = message_data.get('cached_checksum')
+        if cached_checksum and self.is_unchanged(gdrive_file_id, cached_checksum):
+            self.send_response(client, self.traced(trace, message_data, {
+                'status': 'not_modified',
+                'checksum': cached_checksum,
+                'checksum_algorithm': self.crypto['hash']
+            }))
+            return
+        
         try:
             
             if encryption_key:
@@ -270,42 +998,73 @@ class FileServer:
             
           
             if self.gdrive_enabled and self.gdrive:
+                # The temporary copy counts against the in-flight budget: reserve
+                # its size from the catalog before it lands on disk
+                record = self.catalog.get(gdrive_file_id)
+                reserved = (record['stored_size'] or 0) if record else 0
+                if permit is not None and reserved:
+                    try:
+                        permit.reserve(reserved)
+                    except Busy as e:
+                        self.send_response(client, self.busy_response(e))
+                        return
                 try:
                    
-                    temp_file_path = os.path.join(self.upload_dir, f"temp_{gdrive_file_id}")
-                    self.gdrive.download_file(gdrive_file_id, temp_file_path)
+                    # Unique per request: the same file may be downloaded by several clients at once
+                    temp_file_path = os.path.join(self.upload_dir, f"temp_{os.path.basename(gdrive_file_id)}_{os.urandom(4).hex()}")
+                    with trace.span('drive_download') as span:
+                        self.gdrive.download_file(gdrive_file_id, temp_file_path)
+                        span['bytes'] = os.path.getsize(temp_file_path)
+                    
                     
+                    file_size = os.path.getsize(temp_file_path)
                     
-                    if client_checksum:
-                        server_checksum = self.calculate_checksum(temp_file_path)
-                        if server_checksum != client_checksum:
+                    # Not in the catalog, or larger than recorded there
+                    if permit is not None and file_size > reserved:
+                        try:
+                            permit.reserve(file_size - reserved)
+                        except Busy as e:
                             os.remove(temp_file_path)
-                            self.send_response(client, {'status': 'error', 'message': 'Checksum mismatch'})
+                            self.send_response(client, self.busy_response(e))
                             return
                     
+                    server_checksum = self.stored_checksum(gdrive_file_id, temp_file_path, trace)
                     
-                    file_size = os.path.getsize(temp_file_path)
+                    if client_checksum and server_checksum != client_checksum:
+                        os.remove(temp_file_path)
+                        self.send_response(client, {'status': 'error', 'message': 'Checksum mismatch'})
+                        return
                     
                     
                     self.send_response(client, {
                         'status': 'ready',
                         'file_size': file_size,
                         'filename': os.path.basename(temp_file_path),
-                        'checksum': self.calculate_checksum(temp_file_path)
+                        'checksum': server_checksum,
+                        'checksum_algorithm': self.crypto['hash']
                     })
                     
                     
-                    with open(temp_file_path, 'rb') as f:
-                        while True:
-                            chunk = f.read(4096)
-                            if not chunk:
-                                break
-                            client.sendall(chunk)
+                    timing = {}
+                    start = time.perf_counter()
+                    with open(temp_file_path, 'rb') as f, self.shaped(shaper, buffer, file_size):
+                        sent = buffer.send_from_file(f, timing=timing)
+                    elapsed = time.perf_counter() - start
+                    trace.add('socket_send', elapsed - timing['file_io_s'], sent)
+                    trace.add('storage_io', timing['file_io_s'], sent)
+                    self.metrics.inc('sft_bytes_sent_total', sent)
                     
                     
                     os.remove(temp_file_path)
                     
-                    self.send_response(client, {'status': 'success', 'message': 'File downloaded from Google Drive'})
+                    self.send_response(client, self.traced(trace, message_data, {
+                        'status': 'success',
+                        'message': 'File downloaded from Google Drive'
+                    }))
+                except (ConnectionError, socket.timeout):
+                    if os.path.exists(temp_file_path):
+                        os.remove(temp_file_path)
+                    raise
                 except Exception as e:
                     print(f"Error downloading from Google Drive: {e}")
                     traceback.print_exc()
@@ -313,25 +1072,466 @@ class FileServer:
                     if os.path.exists(temp_file_path):
                         os.remove(temp_file_path)
             else:
-                self.send_response(client, {'status': 'error', 'message': 'Google Drive integration not enabled'})
+                self.send_local_file(client, message_data, buffer, trace, shaper)
         
+        except (ConnectionError, socket.timeout):
+            raise
         except Exception as e:
             print(f"Error downloading file: {e}")
             traceback.print_exc()
             self.send_response(client, {'status': 'error', 'message': f'Error downloading file: {str(e)}'})
     
-    def handle_list(self, client):
-        """Handle list files request from client"""
-        if self.gdrive_enabled and self.gdrive:
+    def send_local_file(self, client, message_data, buffer, trace, shaper=None):
+        """Serve a plaintext object from the local store, using sendfile where possible"""
+        file_id = os.path.basename(message_data['gdrive_file_id'])
+        file_path = self.local_path(file_id)
+        try:
+            f = open(file_path, 'rb') if file_path else None
+        except FileNotFoundError:
+            f = None
+        if f is None:
+            self.send_response(client, {'status': 'error', 'message': 'File not found'})
+            return
+        
+        with f:
+            
+            file_size = os.fstat(f.fileno()).st_size
+            
+            checksum = self.stored_checksum(file_id, file_path, trace)
+            
+            self.send_response(client, {
+                'status': 'ready',
+                'file_size': file_size,
+                'filename': file_id,
+                'checksum': checksum,
+                'checksum_algorithm': self.crypto['hash'],
+                'encrypted': False
+            })
+            
+            # With sendfile the disk read and socket write are one kernel operation
+            with trace.span('socket_send') as span, self.shaped(shaper, buffer, file_size):
+                sent = buffer.send_file(f, file_size, use_kernel=self.sendfile_enabled)
+                span['bytes'] = sent
+        self.metrics.inc('sft_bytes_sent_total', sent)
+        
+        if sent != file_size:
+            # The client is still waiting for the rest of the body, so the stream can't be recovered
+            raise ConnectionError(f"File changed while sending ({sent}/{file_size} bytes)")
+        
+        self.send_response(client, self.traced(trace, message_data, {
+            'status': 'success',
+            'message': 'File downloaded from server'
+        }))
+    
+    def handle_upload_batch(self, client, message_data, buffer, trace):
+        """
+        Receive many files over one request
+        
+        After the ready response the client streams entries, each a JSON
+        frame {'filename', 'file_size'} followed by the file bytes, and ends
+        with the frame {'end': true}. Entries are handed to the batch workers
+        as soon as they arrive, so checksumming, encryption and storage
+        uploads overlap with receiving the rest of the stream. The final
+        response carries a result per entry, in stream order.
+        """
+        self.send_response(client, {'status': 'ready', 'workers': self.batch_workers})
+        
+        staging = self.staging_dir()
+        owner = self.peer_name(client)
+        # Entries received but not yet stored; bounds the disk used by staged files
+        window = threading.BoundedSemaphore(self.batch_workers * 2)
+        futures = []
+        timing = {'file_io_s': 0.0}
+        received_total = 0
+        start = time.perf_counter()
+        try:
+            while True:
+                header = buffer.recv_message()
+                if header is None:
+                    raise ConnectionError("Connection closed during batch upload")
+                if header.get('end'):
+                    break
+                filename = header.get('filename')
+                file_size = header.get('file_size')
+                if not filename or not valid_size(file_size):
+                    # Without a size the rest of the stream can't be parsed
+                    raise ConnectionError(f"Malformed batch entry header: {header}")
+                
+                index = len(futures)
+                entry_dir = os.path.join(staging, str(index))
+                os.mkdir(entry_dir)
+                file_path = os.path.join(entry_dir, os.path.basename(filename))
+                window.acquire()
+                with open(file_path, 'wb') as f:
+                    preallocate(f, file_size)
+                    received = buffer.recv_to_file(f, file_size, timing)
+                received_total += received
+                if received != file_size:
+                    window.release()
+                    raise ConnectionError(f"Batch entry {index} incomplete ({received}/{file_size} bytes)")
+                
+                future = self.batch_pool.submit(self.store_batch_entry, index, file_path, filename, trace, owner)
+                future.add_done_callback(lambda _: window.release())
+                futures.append(future)
+            
+            elapsed = time.perf_counter() - start
+            trace.add('socket_recv', elapsed - timing['file_io_s'], received_total)
+            trace.add('storage_io', timing['file_io_s'], received_total)
+            self.metrics.inc('sft_bytes_received_total', received_total)
+            
+            results = [future.result() for future in futures]
+        finally:
+            # On a dropped connection, let in-flight entries finish before removing their files
+            wait(futures)
+            shutil.rmtree(staging, ignore_errors=True)
+        
+        failed = sum(1 for r in results if r['status'] != 'success')
+        self.send_response(client, self.traced(trace, message_data, {
+            'status': 'success',
+            'message': f'{len(results) - failed} of {len(results)} files uploaded',
+            'failed': failed,
+            'results': results
+        }))
+    
+    def store_batch_entry(self, index, file_path, filename, trace, owner=None):
+        """Store one received batch entry (runs on a batch worker)"""
+        result = {'index': index, 'filename': filename}
+        try:
+            result.update(self.store_file(file_path, os.path.basename(filename), trace, owner))
+            result['status'] = 'success'
+        except Exception as e:
+            print(f"Error storing batch entry {filename}: {e}")
+            result.update({'status': 'error', 'message': str(e)})
+        self.metrics.inc('sft_batch_entries_total', command='upload_batch', status=result['status'])
+        return result
+    
+    def handle_download_batch(self, client, message_data, buffer, trace, shaper=None):
+        """
+        Send many files over one request
+        
+        The request lists file IDs in 'files'. Batch workers fetch them from
+        storage in parallel, and each file is streamed as soon as it is ready,
+        so entries arrive in completion order: a JSON frame with 'index',
+        'id' and 'status' ('success' followed by file_size bytes, or
+        'error' with a message and no body). Files listed in 'cached' (ID ->
+        checksum of the client's copy) that are unchanged get 'not_modified'
+        and no body. A final response closes the batch.
+        """
+        file_ids = message_data.get('files')
+        cached = message_data.get('cached')
+        if not isinstance(cached, dict):
+            cached = {}
+        if not isinstance(file_ids, list) or not file_ids:
+            self.send_response(client, {'status': 'error', 'message': 'Missing files'})
+            return
+        
+        self.send_response(client, {'status': 'ready', 'count': len(file_ids)})
+        
+        pending = {}
+        queued = iter(enumerate(file_ids))
+        window = self.batch_workers * 2
+        failed = 0
+        unchanged = 0
+        sent_total = 0
+        
+        def refill():
+            for index, file_id in queued:
+                pending[self.batch_pool.submit(self.fetch_batch_entry, file_id, trace, cached.get(file_id))] = (index, file_id)
+                if len(pending) >= window:
+                    break
+        
+        try:
+            # A batch is bulk traffic, so it never gets the small-transfer priority
+            with self.shaped(shaper, buffer, sys.maxsize):
+                refill()
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, file_id = pending.pop(future)
+                        entry = future.result()
+                        header = {'index': index, 'id': file_id}
+                        header.update(entry['header'])
+                        try:
+                            send_json(client, header)
+                            if entry['path']:
+                                with open(entry['path'], 'rb') as f, trace.span('socket_send') as span:
+                                    sent = buffer.send_file(f, header['file_size'], use_kernel=self.sendfile_enabled)
+                                    span['bytes'] = sent
+                                sent_total += sent
+                                if sent != header['file_size']:
+                                    raise ConnectionError(f"File changed while sending ({sent}/{header['file_size']} bytes)")
+                        finally:
+                            self.discard_batch_entry(entry)
+                        if header['status'] == 'not_modified':
+                            unchanged += 1
+                        elif header['status'] != 'success':
+                            failed += 1
+                        self.metrics.inc('sft_batch_entries_total', command='download_batch', status=header['status'])
+                    refill()
+        finally:
+            self.metrics.inc('sft_bytes_sent_total', sent_total)
+            for future in pending:
+                future.add_done_callback(lambda f: self.discard_batch_entry(f.result()))
+        
+        self.send_response(client, self.traced(trace, message_data, {
+            'status': 'success',
+            'message': f'{len(file_ids) - failed - unchanged} of {len(file_ids)} files sent, {unchanged} unchanged',
+            'failed': failed,
+            'unchanged': unchanged
+        }))
+    
+    def fetch_batch_entry(self, file_id, trace, cached_checksum=None):
+        """
+        Get one batch download ready to send (runs on a batch worker)
+        
+        Returns:
+            Dict with the entry 'header', the 'path' to send (None on error
+            or not_modified) and the 'staging' directory to remove afterwards
+        """
+        entry = {'path': None, 'staging': None}
+        if cached_checksum and self.is_unchanged(file_id, cached_checksum):
+            entry['header'] = {'status': 'not_modified', 'checksum': cached_checksum}
+            return entry
+        try:
+            if self.gdrive_enabled and self.gdrive:
+                entry['staging'] = self.staging_dir()
+                path = os.path.join(entry['staging'], 'data')
+                with trace.span('drive_download') as span:
+                    self.gdrive.download_file(file_id, path)
+                    span['bytes'] = os.path.getsize(path)
+                filename, encrypted = file_id, True
+            else:
+                filename = os.path.basename(file_id)
+                path = self.local_path(filename)
+                if not path or not os.path.isfile(path):
+                    entry['header'] = {'status': 'error', 'message': 'File not found'}
+                    return entry
+                encrypted = False
+            
+            file_size = os.path.getsize(path)
+            checksum = self.stored_checksum(filename, path, trace)
+            entry['path'] = path
+            entry['header'] = {
+                'status': 'success',
+                'file_size': file_size,
+                'filename': filename,
+                'checksum': checksum,
+                'checksum_algorithm': self.crypto['hash'],
+                'encrypted': encrypted
+            }
+        except Exception as e:
+            print(f"Error fetching batch entry {file_id}: {e}")
+            entry['path'] = None
+            entry['header'] = {'status': 'error', 'message': str(e)}
+        return entry
+    
+    def discard_batch_entry(self, entry):
+        """Remove the temporary copy of a fetched batch entry"""
+        if entry['staging']:
+            shutil.rmtree(entry['staging'], ignore_errors=True)
+    
+    def catalog_entry(self, record, fields=None):
+        """
+        Catalog record in the shape of a storage listing entry
+        
+        Args:
+            record: Catalog record
+            fields: Optional list of LIST_FIELDS to return (default: all that are known)
+        """
+        entry = {
+            'id': record['id'],
+            'name': record['name'],
+            'size': record['size'] if record['size'] is not None else record['stored_size'],
+            # Milliseconds, as Drive reports them, so clients can order entries like the server does
+            'createdTime': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record['created']))
+                           + f".{int(record['created'] * 1000) % 1000:03d}Z"
+        }
+        for key, field in (('storedSize', 'stored_size'), ('checksum', 'checksum'),
+                           ('checksumAlgorithm', 'checksum_algorithm'), ('codec', 'codec'), ('owner', 'owner')):
+            if record[field] is not None:
+                entry[key] = record[field]
+        if fields:
+            return {key: entry[key] for key in fields if key in entry}
+        return entry
+    
+    def list_options(self, message_data):
+        """
+        Validate the filters, projection and paging of a list/search request
+        
+        Returns:
+            (filters for Catalog.query, fields or None, limit or None)
+        
+        Raises:
+            ValueError: With a message for the client
+        """
+        filters = {}
+        for name, types in LIST_FILTERS.items():
+            value = message_data.get(name)
+            if value is None:
+                continue
+            if not isinstance(value, types) or isinstance(value, bool):
+                raise ValueError(f"Invalid {name}: {value!r}")
+            filters[name] = value
+        
+        fields = message_data.get('fields')
+        if fields is not None:
+            if not isinstance(fields, list) or not fields:
+                raise ValueError("fields must be a non-empty list")
+            unknown = [key for key in fields if key not in LIST_FIELDS]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(map(str, unknown))} (known: {', '.join(LIST_FIELDS)})")
+        
+        limit = message_data.get('limit')
+        if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit <= 0):
+            raise ValueError("limit must be a positive integer")
+        return filters, fields, limit
+    
+    def handle_list(self, client, message_data, trace):
+        """
+        Handle list files request from client (answered from the catalog)
+        
+        Filters (name prefix/glob/substring, owner, size and creation time
+        ranges) and the sort run as one indexed catalog query, and only the
+        requested fields are sent. With 'limit' the reply is one page plus
+        a next_cursor. With 'stream' the matches are sent as a sequence of
+        'page' frames of page_size entries, then a final 'success' frame,
+        so the client can show the first entries before the last are read.
+        """
+        try:
             try:
-                files = self.gdrive.list_files()
-                self.send_response(client, {'status': 'success', 'files': files})
-            except Exception as e:
-                print(f"Error listing files: {e}")
-                traceback.print_exc()
-                self.send_response(client, {'status': 'error', 'message': f'Error listing files: {str(e)}'})
-        else:
-            self.send_response(client, {'status': 'error', 'message': 'Google Drive integration not enabled'})
+                filters, fields, limit = self.list_options(message_data)
+                cursor = message_data.get('cursor')
+                
+                if not message_data.get('stream'):
+                    with trace.span('catalog'):
+                        records, next_cursor = self.catalog.query(limit=limit, cursor=cursor, **filters)
+                    response = {'status': 'success', 'files': [self.catalog_entry(r, fields) for r in records]}
+                    if next_cursor:
+                        response['next_cursor'] = next_cursor
+                    self.send_response(client, self.traced(trace, message_data, response))
+                    return
+                
+                page_size = message_data.get('page_size', LIST_PAGE_SIZE)
+                if not isinstance(page_size, int) or isinstance(page_size, bool) or page_size <= 0:
+                    raise ValueError("page_size must be a positive integer")
+                page_size = min(page_size, MAX_LIST_PAGE_SIZE)
+                
+                # The first page is fetched before anything is sent, so bad filters still get a plain error
+                with trace.span('catalog'):
+                    records, cursor = self.catalog.query(limit=min(page_size, limit or page_size), cursor=cursor, **filters)
+            except ValueError as e:
+                self.send_response(client, {'status': 'error', 'message': str(e)})
+                return
+            
+            count = 0
+            while True:
+                count += len(records)
+                with trace.span('socket_send'):
+                    self.send_response(client, {'status': 'page', 'files': [self.catalog_entry(r, fields) for r in records]})
+                remaining = limit - count if limit else page_size
+                if not cursor or remaining <= 0:
+                    break
+                with trace.span('catalog'):
+                    records, cursor = self.catalog.query(limit=min(page_size, remaining), cursor=cursor, **filters)
+            
+            response = {'status': 'success', 'count': count}
+            if cursor:
+                response['next_cursor'] = cursor
+            self.send_response(client, self.traced(trace, message_data, response))
+        except Exception as e:
+            print(f"Error listing files: {e}")
+            traceback.print_exc()
+            self.send_response(client, {'status': 'error', 'message': f'Error listing files: {str(e)}'})
+    
+    def handle_search(self, client, message_data, trace):
+        """Handle a catalog search (the same filters as list; kept as its own command for older clients)"""
+        self.handle_list(client, message_data, trace)
+    
+    def handle_stat(self, client, message_data, trace):
+        """Handle a request for one object's metadata"""
+        file_id = message_data.get('gdrive_file_id')
+        if not file_id:
+            self.send_response(client, {'status': 'error', 'message': 'Missing gdrive_file_id'})
+            return
+        with trace.span('catalog'):
+            record = self.catalog.get(file_id)
+        if record is None:
+            self.send_response(client, {'status': 'error', 'message': 'File not found'})
+            return
+        self.send_response(client, self.traced(trace, message_data, {'status': 'success', 'file': self.catalog_entry(record)}))
+    
+    def catalog_changed(self, event_type, record):
+        """Catalog hook: publish a change event to subscribers"""
+        self.events.publish(event_type, self.catalog_entry(record) if record else None)
+    
+    def serve_subscription(self, client, message_data, address):
+        """
+        Stream change events to a subscribed client
+        
+        After a 'subscribed' reply ({epoch, seq, resync, heartbeat}) the
+        server sends {'status': 'event', 'events': [...]} frames as objects
+        are created, updated and deleted, batching events that are
+        published together. An empty frame goes out every heartbeat
+        seconds when nothing happens, so dead clients are noticed and the
+        client can tell a quiet server from a dead one. The client ends the
+        subscription by closing the connection.
+        """
+        since = message_data.get('since')
+        if since is not None and (not isinstance(since, int) or isinstance(since, bool)):
+            self.send_response(client, {'status': 'error', 'message': 'since must be an integer'})
+            return
+        
+        subscription, seq, resync = self.events.subscribe(since, message_data.get('epoch'))
+        self.metrics.add_gauge('sft_subscribers', 1)
+        try:
+            self.send_response(client, {
+                'status': 'subscribed',
+                'epoch': self.events.epoch,
+                'seq': seq,
+                'resync': resync,
+                'heartbeat': self.event_heartbeat
+            })
+            while self.running:
+                events = subscription.get(self.event_heartbeat)
+                send_json(client, {'status': 'event', 'events': events})
+                if events:
+                    self.metrics.inc('sft_events_sent_total', len(events))
+        except (ConnectionError, OSError) as e:
+            print(f"Subscriber {address} went away: {e}")
+        finally:
+            subscription.close()
+            self.metrics.add_gauge('sft_subscribers', -1)
+    
+    def handle_delete(self, client, message_data, trace):
+        """Handle a request to delete a stored file"""
+        file_id = message_data.get('gdrive_file_id')
+        if not file_id:
+            self.send_response(client, {'status': 'error', 'message': 'Missing gdrive_file_id'})
+            return
+        
+        try:
+            if self.objects is None:
+                with trace.span('drive_delete'):
+                    deleted = self.gdrive.delete_file(file_id)
+                # Drop the record even if storage no longer had the object
+                self.catalog.remove(file_id)
+            else:
+                file_id = os.path.basename(file_id)
+                remove_sidecar(self.upload_dir, file_id)
+                removed = self.catalog.remove(file_id)
+                deleted = removed is not None
+                if deleted:
+                    # The bytes go once no other object has the same content
+                    self.release_blob(removed)
+                    self.commit_local(os.path.dirname(sidecar_path(self.upload_dir, file_id)))
+            if not deleted:
+                self.send_response(client, {'status': 'error', 'message': 'File not found'})
+                return
+            self.send_response(client, self.traced(trace, message_data, {'status': 'success', 'message': 'File deleted'}))
+        except Exception as e:
+            print(f"Error deleting file: {e}")
+            traceback.print_exc()
+            self.send_response(client, {'status': 'error', 'message': f'Error deleting file: {str(e)}'})
     
     def send_response(self, client, response_data):
         """Send a response to the client with retry"""
@@ -340,15 +1540,8 @@ class FileServer:
         
         for attempt in range(max_retries):
             try:
-                response_json = json.dumps(response_data)
-                response_bytes = response_json.encode('utf-8')
-                
-                
-                msg_len = len(response_bytes)
-                client.sendall(msg_len.to_bytes(4, byteorder='big'))
-                
-                
-                client.sendall(response_bytes)
+                send_json(client, response_data)
+                self.metrics.inc('sft_responses_total', status=response_data.get('status', 'unknown'))
                 return True
             
             except ConnectionError as e:
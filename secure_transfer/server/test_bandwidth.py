@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from bandwidth import TokenBucket, BandwidthScheduler
+
+# Link time per chunk in the ordering tests; keeps the senders apart so the
+# order they are released in is the order they return in
+CHUNK = 10000
+RATE = 500000
+
+
+def send_order(scheduler, chunks):
+    """
+    Queue chunks while the link is busy, then release it
+
+    Args:
+        chunks: (user name, priority) per chunk, queued in this order
+
+    Returns:
+        The indexes of chunks in the order they were sent
+    """
+    order = []
+    lock = threading.Lock()
+    scheduler.link_free = time.monotonic() + 3600
+    users = {}
+    threads = []
+    for index, (name, priority) in enumerate(chunks):
+        if name not in users:
+            users[name] = scheduler._join(name)
+
+        def send(index=index, user=users[name], priority=priority):
+            scheduler._send_slot(user, priority, CHUNK)
+            with lock:
+                order.append(index)
+
+        thread = threading.Thread(target=send)
+        thread.start()
+        threads.append(thread)
+        # Wait until it is queued, so tags are assigned in list order
+        deadline = time.monotonic() + 5
+        while len(scheduler.queue) <= index and time.monotonic() < deadline:
+            time.sleep(0.001)
+    with scheduler.cond:
+        scheduler.link_free = time.monotonic()
+        scheduler.cond.notify_all()
+    for thread in threads:
+        thread.join(10)
+    return order
+
+
+def test_users_share_equally_regardless_of_connections():
+    # a opens three connections before b sends anything; b still goes second
+    scheduler = BandwidthScheduler(total_rate=RATE)
+    order = send_order(scheduler, [('a', 1), ('a', 1), ('a', 1), ('b', 1)])
+    assert order == [0, 3, 1, 2]
+
+
+def test_weights():
+    scheduler = BandwidthScheduler(total_rate=RATE, weights={'b': 2.0})
+    order = send_order(scheduler, [('a', 1), ('a', 1), ('b', 1), ('b', 1)])
+    assert order == [2, 0, 3, 1]
+
+
+def test_small_transfers_go_first():
+    scheduler = BandwidthScheduler(total_rate=RATE)
+    order = send_order(scheduler, [('a', 1), ('b', 1), ('c', 0)])
+    assert order == [2, 0, 1]
+
+
+def test_returning_user_gets_no_credit_for_idle_time():
+    scheduler = BandwidthScheduler(total_rate=RATE)
+    send_order(scheduler, [('a', 1)] * 3)
+    # b was idle while a sent; its tags start from the current virtual time
+    order = send_order(scheduler, [('a', 1), ('a', 1), ('b', 1), ('b', 1)])
+    assert order == [0, 2, 1, 3]
+
+
+def test_token_bucket():
+    bucket = TokenBucket(1000, burst=500)
+    assert bucket.reserve(500) == 0.0
+    assert bucket.reserve(250) == pytest.approx(0.25, abs=0.01)
+    # Debt accumulates: the next caller waits for both
+    assert bucket.reserve(250) == pytest.approx(0.5, abs=0.01)
+
+
+class Buffer:
+    throttle = None
+
+
+def test_transfer_installs_throttle_only_with_limits():
+    buffer = Buffer()
+    with BandwidthScheduler().connection('a').transfer(buffer, 100):
+        assert buffer.throttle is None
+
+    scheduler = BandwidthScheduler(connection_rate=10 ** 9)
+    with scheduler.connection('a').transfer(buffer, 100):
+        buffer.throttle(100)
+        assert scheduler.snapshot()['active_users'] == {'a': {'weight': 1.0, 'transfers': 1, 'bytes': 100}}
+    assert buffer.throttle is None
+    assert scheduler.snapshot()['active_users'] == {}
+
+
+def test_total_rate_is_enforced():
+    rate = 1024 * 1024
+    scheduler = BandwidthScheduler(total_rate=rate)
+    buffer = Buffer()
+    start = time.monotonic()
+    with scheduler.connection('a').transfer(buffer, 10 * rate):
+        for _ in range(8):
+            buffer.throttle(64 * 1024)
+    elapsed = time.monotonic() - start
+    # 512 KB at 1 MB/s, less the 256 KB burst
+    assert 0.2 <= elapsed < 1.0
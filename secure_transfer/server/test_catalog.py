@@ -0,0 +1,136 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from catalog import Catalog, parse_time, encode_cursor
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = Catalog(str(tmp_path / 'catalog.db'))
+    yield catalog
+    catalog.close()
+
+
+def add(catalog, object_id, name=None, size=100, created=1000.0, owner='10.0.0.1', stored_size=None):
+    catalog.add({'id': object_id, 'name': name or object_id, 'size': size, 'stored_size': stored_size,
+                 'created': created, 'owner': owner})
+
+
+def pages(catalog, limit, **filters):
+    """All records of a query, fetched limit at a time"""
+    records, cursor, count = [], None, 0
+    while True:
+        page, cursor = catalog.query(limit=limit, cursor=cursor, **filters)
+        assert len(page) <= limit
+        records += page
+        count += 1
+        if cursor is None:
+            return [r['id'] for r in records], count
+
+
+@pytest.mark.parametrize('sort', ['created', '-created', 'size', '-size', 'name', '-name'])
+def test_pages_with_ties_match_one_query(catalog, sort):
+    # Many rows share a sort value, so pages must break ties by ID
+    for i in range(25):
+        add(catalog, f'id{i:02d}', name=f'file{i % 4}', size=(i % 3) * 10, created=1000.0 + i % 5)
+    expected = [r['id'] for r in catalog.query(sort=sort)[0]]
+    for limit in (1, 3, 7, 25, 100):
+        ids, _ = pages(catalog, limit, sort=sort)
+        assert ids == expected
+    assert len(set(expected)) == 25
+
+
+def test_sort_orders(catalog):
+    add(catalog, 'a', size=30, created=3.0)
+    add(catalog, 'b', size=10, created=1.0)
+    add(catalog, 'c', size=20, created=2.0)
+    add(catalog, 'd', size=None, stored_size=15, created=2.0)
+    assert [r['id'] for r in catalog.query(sort='created')[0]] == ['b', 'c', 'd', 'a']
+    assert [r['id'] for r in catalog.query(sort='-created')[0]] == ['a', 'd', 'c', 'b']
+    # Without a plaintext size the stored size is used
+    assert [r['id'] for r in catalog.query(sort='size')[0]] == ['b', 'd', 'c', 'a']
+    assert [r['id'] for r in catalog.query(sort='-size')[0]] == ['a', 'c', 'd', 'b']
+
+
+def test_last_page_has_no_cursor(catalog):
+    for i in range(4):
+        add(catalog, f'id{i}')
+    assert pages(catalog, 2) == (['id0', 'id1', 'id2', 'id3'], 2)
+    assert catalog.query(limit=4)[1] is None
+    assert catalog.query(limit=5)[1] is None
+
+
+def test_pages_with_filters(catalog):
+    for i in range(20):
+        add(catalog, f'id{i:02d}', name=f'{"log" if i % 2 else "img"}_{i:02d}', size=i, created=float(i))
+    ids, _ = pages(catalog, 3, prefix='log', min_size=5, sort='-size')
+    assert ids == [f'id{i:02d}' for i in range(19, 4, -1) if i % 2]
+
+
+def test_bad_cursors(catalog):
+    add(catalog, 'a')
+    add(catalog, 'b')
+    _, cursor = catalog.query(limit=1, sort='name')
+    with pytest.raises(ValueError):
+        catalog.query(limit=1, sort='-name', cursor=cursor)
+    with pytest.raises(ValueError):
+        catalog.query(cursor='not a cursor')
+    with pytest.raises(ValueError):
+        catalog.query(cursor=encode_cursor(['name', 'a']))
+    with pytest.raises(ValueError):
+        catalog.query(sort='owner')
+
+
+def test_name_filters(catalog):
+    for name in ('report.pdf', 'report_1.txt', 'reportX1.txt', '100%.txt', 'notes.TXT'):
+        add(catalog, name)
+    assert {r['id'] for r in catalog.query(prefix='report')[0]} == {'report.pdf', 'report_1.txt', 'reportX1.txt'}
+    assert {r['id'] for r in catalog.query(glob='*.txt')[0]} == {'report_1.txt', 'reportX1.txt', '100%.txt'}
+    # % and _ are literal in contains, and it ignores case
+    assert {r['id'] for r in catalog.query(contains='_1')[0]} == {'report_1.txt'}
+    assert {r['id'] for r in catalog.query(contains='%')[0]} == {'100%.txt'}
+    assert {r['id'] for r in catalog.query(contains='.txt')[0]} == {'report_1.txt', 'reportX1.txt', '100%.txt',
+                                                                     'notes.TXT'}
+
+
+def test_size_owner_and_time_filters(catalog):
+    add(catalog, 'a', size=10, created=parse_time('2024-05-01'), owner='10.0.0.1')
+    add(catalog, 'b', size=20, created=parse_time('2024-05-02T12:00:00Z'), owner='10.0.0.2')
+    add(catalog, 'c', size=30, created=parse_time('2024-05-03'), owner='10.0.0.1')
+    assert [r['id'] for r in catalog.query(min_size=20, max_size=30)[0]] == ['b', 'c']
+    assert [r['id'] for r in catalog.query(owner='10.0.0.1')[0]] == ['a', 'c']
+    # after is inclusive, before is not
+    assert [r['id'] for r in catalog.query(created_after='2024-05-02T12:00:00Z',
+                                           created_before='2024-05-03')[0]] == ['b']
+
+
+def test_parse_time():
+    assert parse_time(12) == 12.0
+    assert parse_time('1970-01-02') == 86400.0
+    assert parse_time('1970-01-01T00:01:00.500Z') == 60.0
+    for value in ('yesterday', True, None):
+        with pytest.raises(ValueError):
+            parse_time(value)
+
+
+def test_add_remove_and_events(catalog):
+    events = []
+    catalog.on_change = lambda event_type, record: events.append((event_type, record and record['name']))
+    add(catalog, 'a', name='first')
+    assert catalog.add({'id': 'a', 'name': 'second', 'created': 1.0})['name'] == 'first'
+    assert catalog.get('a')['name'] == 'second'
+    assert catalog.remove('a')['name'] == 'second'
+    assert catalog.remove('a') is None
+    catalog.add_many([{'id': 'b', 'name': 'b'}, {'id': 'c', 'name': 'c'}])
+    assert catalog.count() == 2
+    assert events == [('created', 'first'), ('updated', 'second'), ('deleted', 'second'), ('resync', None)]
+
+
+def test_meta(catalog):
+    assert catalog.get_meta('scrub_cursor') is None
+    catalog.set_meta('scrub_cursor', 'abc')
+    assert catalog.get_meta('scrub_cursor') == 'abc'
@@ -2,7 +2,7 @@
 import os
 import sys
 import argparse
-from server.encryption import FileEncryptor
+from server.encryption import FileEncryptor, CIPHERS, DEFAULT_CIPHER
 
 def main():
     parser = argparse.ArgumentParser(description='Test AES encryption/decryption')
@@ -10,12 +10,13 @@ def main():
     parser.add_argument('file_path', help='Path to the file to encrypt/decrypt')
     parser.add_argument('--output', '-o', help='Output file path (optional)')
     parser.add_argument('--key', '-k', help='Hex encryption key (required for decryption)')
+    parser.add_argument('--cipher', '-c', choices=list(CIPHERS), default=DEFAULT_CIPHER, help='Cipher to encrypt with')
     
     args = parser.parse_args()
     
     if args.action == 'encrypt':
         # Create encryptor (generates a random key)
-        encryptor = FileEncryptor()
+        encryptor = FileEncryptor(cipher=args.cipher)
         
         # Encrypt the file
         output_path = encryptor.encrypt_file(args.file_path, args.output)
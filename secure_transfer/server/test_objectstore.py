@@ -0,0 +1,123 @@
+import os
+import sys
+import hashlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from objectstore import ObjectStore, shard_path, blob_address
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ObjectStore(str(tmp_path / 'objects'), gc_grace=0)
+    yield store
+    store.close()
+
+
+def put(store, tmp_path, data, keep_source=False):
+    path = tmp_path / f'upload-{os.urandom(4).hex()}'
+    path.write_bytes(data)
+    address = store.put(str(path), 'sha256', hashlib.sha256(data).hexdigest(), keep_source)
+    return address, str(path)
+
+
+def refs(store, address):
+    row = store.db.execute('SELECT refs FROM blobs WHERE address = ?', (address,)).fetchone()
+    return row[0] if row else None
+
+
+def test_shard_path():
+    assert shard_path('/root', 'abcdef') == os.path.join('/root', 'ab', 'cd', 'abcdef')
+    assert blob_address('sha256', 'abcd') == 'sha256:abcd'
+
+
+def test_put_moves_file_into_place(store, tmp_path):
+    address, source = put(store, tmp_path, b'hello')
+    assert not os.path.exists(source)
+    with open(store.path(address), 'rb') as f:
+        assert f.read() == b'hello'
+    assert refs(store, address) == 1
+
+
+def test_keep_source(store, tmp_path):
+    address, source = put(store, tmp_path, b'kept', keep_source=True)
+    assert os.path.exists(source) and os.path.exists(store.path(address))
+
+
+def test_same_content_is_stored_once(store, tmp_path):
+    first, _ = put(store, tmp_path, b'same')
+    second, source = put(store, tmp_path, b'same')
+    assert first == second
+    assert not os.path.exists(source)
+    assert refs(store, first) == 2
+    assert store.stats()['stored'] == 1 and store.stats()['deduplicated'] == 1
+
+
+def test_blob_is_collected_after_last_release(store, tmp_path):
+    address, _ = put(store, tmp_path, b'shared')
+    put(store, tmp_path, b'shared')
+    store.release(address)
+    assert store.collect() == (0, 0)
+    assert os.path.exists(store.path(address))
+    store.release(address)
+    assert store.stats()['unreferenced'] == 1
+    assert store.collect() == (1, len(b'shared'))
+    assert not os.path.exists(store.path(address))
+    assert refs(store, address) is None
+
+
+def test_grace_period(store, tmp_path):
+    address, _ = put(store, tmp_path, b'recent')
+    store.release(address)
+    assert store.collect(grace=3600) == (0, 0)
+    assert os.path.exists(store.path(address))
+
+
+def test_put_after_release_revives_blob(store, tmp_path):
+    address, _ = put(store, tmp_path, b'again')
+    store.release(address)
+    # Released more often than referenced (e.g. after a crash): refs restart from 1
+    store.release(address)
+    put(store, tmp_path, b'again')
+    assert refs(store, address) == 1
+    assert store.collect() == (0, 0)
+    assert os.path.exists(store.path(address))
+
+
+def test_reconcile(store, tmp_path):
+    kept, _ = put(store, tmp_path, b'kept')
+    dropped, _ = put(store, tmp_path, b'dropped')
+    # An orphan on disk that the index lost
+    orphan = blob_address('sha256', hashlib.sha256(b'orphan').hexdigest())
+    os.makedirs(os.path.dirname(store.path(orphan)), exist_ok=True)
+    with open(store.path(orphan), 'wb') as f:
+        f.write(b'orphan')
+    store.reconcile({kept: 3, orphan: 1, blob_address('sha256', '00' * 32): 1})
+    assert refs(store, kept) == 3 and refs(store, orphan) == 1 and refs(store, dropped) == 0
+    assert store.collect() == (1, len(b'dropped'))
+
+
+def test_unclean_shutdown_needs_reconcile(tmp_path):
+    root = str(tmp_path / 'objects')
+    store = ObjectStore(root)
+    assert store.needs_reconcile
+    store.close()
+    store.close()
+    store = ObjectStore(root)
+    assert not store.needs_reconcile
+    # Not closed: the next open must recount
+    store.db.close()
+    store = ObjectStore(root)
+    assert store.needs_reconcile
+    store.close()
+
+
+def test_collect_removes_stale_temporary_files(store):
+    path = os.path.join(store.tmp_dir, 'partial')
+    with open(path, 'wb') as f:
+        f.write(b'x')
+    os.utime(path, (0, 0))
+    store.collect()
+    assert not os.path.exists(path)
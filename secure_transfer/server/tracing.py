@@ -0,0 +1,125 @@
+import json
+import time
+import uuid
+import random
+import logging
+import logging.handlers
+from contextlib import contextmanager
+
+
+class Trace:
+    """
+    Timeline of one command, made of named spans with durations and byte counts
+
+    Span names used by the server: socket_recv, socket_send, storage_io,
+    checksum, encrypt, drive_upload, drive_download, drive_delete, catalog.
+    """
+    def __init__(self, tracer, command, sampled, peer=None):
+        self.tracer = tracer
+        self.trace_id = uuid.uuid4().hex
+        self.command = command
+        self.sampled = sampled
+        self.peer = peer
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.attributes = {}
+
+    @contextmanager
+    def span(self, name, nbytes=0):
+        """
+        Time the enclosed block as a span
+
+        Yields a dict; set its 'bytes' key inside the block if the byte count
+        is only known afterwards.
+        """
+        info = {'bytes': nbytes}
+        offset = time.perf_counter() - self.start
+        try:
+            yield info
+        finally:
+            self.add(name, time.perf_counter() - self.start - offset, info['bytes'], offset)
+
+    def add(self, name, duration, nbytes=0, offset=None):
+        """Record a span measured elsewhere (duration in seconds)"""
+        if offset is None:
+            offset = time.perf_counter() - self.start - duration
+        self.spans.append({
+            'name': name,
+            'start_ms': round(offset * 1000, 3),
+            'duration_ms': round(duration * 1000, 3),
+            'bytes': nbytes
+        })
+
+    def summary(self):
+        """Aggregate spans per stage: total time, bytes and throughput"""
+        stages = {}
+        for span in self.spans:
+            stage = stages.setdefault(span['name'], {'ms': 0.0, 'bytes': 0})
+            stage['ms'] += span['duration_ms']
+            stage['bytes'] += span['bytes']
+        for stage in stages.values():
+            stage['ms'] = round(stage['ms'], 3)
+            if stage['bytes'] and stage['ms']:
+                stage['mb_s'] = round(stage['bytes'] / (1 << 20) / (stage['ms'] / 1000), 2)
+        return {
+            'trace_id': self.trace_id,
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 3),
+            'stages': stages
+        }
+
+    def finish(self, status=None):
+        """Close the trace and hand it to the tracer for writing"""
+        if status is not None:
+            self.attributes['status'] = status
+        self.tracer.record(self)
+
+
+class Tracer:
+    """
+    Creates traces and writes sampled ones to a rotating JSONL file
+
+    Args:
+        path: Trace log file (None disables writing; summaries still work)
+        sample_rate: Fraction of commands written to the log (0.0 - 1.0)
+        max_bytes: Rotate the log when it reaches this size
+        backup_count: Number of rotated logs to keep
+    """
+    def __init__(self, path=None, sample_rate=0.01, max_bytes=50 * 1024 * 1024, backup_count=5):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.logger = None
+
+        if path:
+            # A private logger gives thread-safe writes and size-based rotation for free
+            self.logger = logging.getLogger(f'sft.trace.{id(self)}')
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+
+    def start(self, command, peer=None, force=False):
+        """Begin a trace; force=True samples it regardless of the sample rate"""
+        sampled = bool(self.logger) and (force or random.random() < self.sample_rate)
+        return Trace(self, command, sampled, peer)
+
+    def record(self, trace):
+        if not trace.sampled:
+            return
+        entry = {
+            'trace_id': trace.trace_id,
+            'command': trace.command,
+            'peer': trace.peer,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(trace.started)) + 'Z',
+            'attributes': trace.attributes,
+            'spans': trace.spans
+        }
+        entry.update(trace.summary())
+        self.logger.info(json.dumps(entry))
+
+    def close(self):
+        if self.logger:
+            for handler in list(self.logger.handlers):
+                handler.close()
+                self.logger.removeHandler(handler)